@@ -1,31 +1,153 @@
+import asyncio
+import contextlib
+import itertools
 import json
 import os
 from typing import Any
 
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import (
+    JSONResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-
-from .assignment import get_i_item, get_next_item, reset_task, update_progress
+from pydantic import BaseModel, Field
+
+from .assignment import (
+    add_users,
+    get_i_item,
+    get_next_item,
+    reset_task,
+    set_priorities,
+    task_owner,
+    update_progress,
+)
+from .dashboard import (
+    mark_dirty,
+    publish_changes,
+    query_dashboard_json,
+    schedule_ranking,
+    subscribe,
+    unsubscribe,
+)
+from .jobs import JOB_KINDS, cancel_job, get_job, job_status, start_job
 from .results_export import (
+    ANNOTATION_FORMATS,
+    EXPORT_FORMATS,
+    annotation_rows,
+    annotations_to_bytes,
     compute_model_scores,
-    generate_latex_table,
-    generate_pdf,
-    generate_typst_table,
+    export_digest,
+    get_cached_export,
+    get_score_matrix,
+    iter_annotations_csv,
+    render_export,
+)
+from .router import (
+    compute_work,
+    invalidate_work,
+    load_pool,
+    route_annotator,
+    unrouted_campaigns,
 )
 from .utils import (
     ROOT,
-    check_validation_threshold,
+    SNAPSHOT_INTERVAL,
+    CampaignTasks,
+    get_db_log,
+    get_log_index,
+    init_validation_counts,
     load_progress_data,
+    log_loaded,
+    merge_pending_progress,
+    read_db_log,
+    record_validations,
     save_db_payload,
+    save_priorities,
     save_progress_data,
+    write_changed_snapshots,
 )
 
 os.makedirs(f"{ROOT}/data/outputs", exist_ok=True)
 
-app = FastAPI()
+
+async def _write_snapshots():
+    # failures are logged per campaign and do not stop later snapshots
+    await asyncio.to_thread(write_changed_snapshots)
+
+
+async def _snapshot_periodically():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        await _write_snapshots()
+
+
+# campaign_id -> task loading the campaign in a worker thread
+_warmup = {}
+# campaigns loaded at startup, in order, and whether all of them were loaded
+_startup_warmup = {"campaign_ids": [], "done": False}
+
+
+def _warm_campaign(campaign_id: str) -> None:
+    """Load the tasks, log, line index and score matrix of a campaign."""
+    tasks_data[campaign_id]
+    get_db_log(campaign_id)
+    get_log_index(campaign_id)
+    get_score_matrix(campaign_id)
+
+
+async def _wait_warm(campaign_id: str) -> None:
+    """
+    Wait until a campaign is loaded, loading it in a worker thread if needed,
+    so that loading large logs does not block requests to other campaigns.
+    """
+    task = _warmup.get(campaign_id)
+    if task is None or (task.done() and not log_loaded(campaign_id)):
+        # not loaded yet or evicted since
+        task = asyncio.ensure_future(asyncio.to_thread(_warm_campaign, campaign_id))
+        _warmup[campaign_id] = task
+    # a cancelled request must not cancel the load for other requests
+    await asyncio.shield(task)
+
+
+async def _warm_all():
+    # campaigns with unfinished users, the most recently active first
+    campaign_ids = sorted(
+        [
+            campaign_id for campaign_id, campaign_progress in progress_data.items()
+            if any(not all(user_val["progress"]) for user_val in campaign_progress.values())
+        ],
+        key=lambda campaign_id: max(
+            [user_val["time_end"] or 0 for user_val in progress_data[campaign_id].values()],
+            default=0,
+        ),
+        reverse=True,
+    )
+    _startup_warmup["campaign_ids"] = campaign_ids
+    for campaign_id in campaign_ids:
+        try:
+            await _wait_warm(campaign_id)
+        except Exception as e:
+            print(f"Failed to load campaign {campaign_id}: {e}")
+    _startup_warmup["done"] = True
+
+
+@contextlib.asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # load campaigns in the background, see /ready
+    warmup_task = asyncio.create_task(_warm_all())
+    # snapshots of the in-memory logs and derived state for fast restarts
+    snapshot_task = asyncio.create_task(_snapshot_periodically())
+    yield
+    warmup_task.cancel()
+    snapshot_task.cancel()
+    await _write_snapshots()
+
+
+app = FastAPI(lifespan=_lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -34,15 +156,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-tasks_data = {}
 progress_data = load_progress_data(
     warn="No progress.json found. Running, but no campaign will be available."
 )
+# campaigns added while the previous server was running but not reloaded,
+# also removes the logs of overwritten ones
+merge_pending_progress(progress_data)
+# tasks are loaded on first access and evicted when inactive
+tasks_data = CampaignTasks(progress_data)
 
-# load all tasks into data_all
 for campaign_id in progress_data.keys():
-    with open(f"{ROOT}/data/tasks/{campaign_id}.json", "r") as f:
-        tasks_data[campaign_id] = json.load(f)
+    for user_progress in progress_data[campaign_id].values():
+        init_validation_counts(user_progress)
 
 
 class LogResponseRequest(BaseModel):
@@ -52,6 +177,27 @@ class LogResponseRequest(BaseModel):
     payload: dict[str, Any]
 
 
+@app.get("/ready")
+async def _ready():
+    # 503 until all campaigns scheduled at startup are loaded
+    campaigns = {}
+    for campaign_id in _startup_warmup["campaign_ids"] + list(_warmup.keys()):
+        task = _warmup.get(campaign_id)
+        if task is None:
+            campaigns[campaign_id] = "queued"
+        elif not task.done():
+            campaigns[campaign_id] = "loading"
+        elif task.exception() is not None:
+            campaigns[campaign_id] = "failed"
+        else:
+            campaigns[campaign_id] = "ready" if log_loaded(campaign_id) else "evicted"
+    ready = _startup_warmup["done"]
+    return JSONResponse(
+        content={"ready": ready, "campaigns": campaigns},
+        status_code=200 if ready else 503,
+    )
+
+
 @app.post("/log-response")
 async def _log_response(request: LogResponseRequest):
     global progress_data
@@ -62,12 +208,19 @@ async def _log_response(request: LogResponseRequest):
 
     if campaign_id not in progress_data:
         return JSONResponse(content="Unknown campaign ID", status_code=400)
+    await _wait_warm(campaign_id)
     if user_id not in progress_data[campaign_id]:
         return JSONResponse(content="Unknown user ID", status_code=400)
 
+    # items taken over by work stealing are also logged with their owner
+    owner = None
+    if tasks_data[campaign_id]["info"]["assignment"] == "task-based":
+        owner = task_owner(tasks_data, progress_data, campaign_id, user_id, item_i)
+    owner_payload = {} if owner is None else {"owner": {"user_id": owner[0], "item_i": owner[1]}}
+
     # append response to the output log
     save_db_payload(
-        campaign_id, request.payload | {"user_id": user_id, "item_i": item_i}
+        campaign_id, request.payload | {"user_id": user_id, "item_i": item_i} | owner_payload
     )
 
     # if actions were submitted, we can log time data
@@ -80,20 +233,29 @@ async def _log_response(request: LogResponseRequest):
             [min(b - a, 60) for a, b in zip(times, times[1:])]
         )
 
-    # Initialize validation_checks if it doesn't exist
+    # store validations and update the running totals of checks
     if "validations" in request.payload:
-        if "validations" not in progress_data[campaign_id][user_id]:
-            progress_data[campaign_id][user_id]["validations"] = {}
-
-        progress_data[campaign_id][user_id]["validations"][request.item_i] = (
-            request.payload["validations"]
+        record_validations(
+            progress_data[campaign_id][user_id],
+            request.item_i,
+            request.payload["validations"],
         )
 
     update_progress(
         campaign_id, user_id, tasks_data, progress_data, request.item_i, request.payload
     )
+    mark_dirty(tasks_data, campaign_id, user_id)
+    if owner is not None:
+        mark_dirty(tasks_data, campaign_id, owner[0])
+    invalidate_work(campaign_id)
     save_progress_data(progress_data)
 
+    # push changes to live dashboards
+    publish_changes(tasks_data, progress_data, campaign_id, user_id)
+    if owner is not None:
+        publish_changes(tasks_data, progress_data, campaign_id, owner[0])
+    schedule_ranking(campaign_id)
+
     return JSONResponse(content="ok", status_code=200)
 
 
@@ -109,15 +271,52 @@ async def _get_next_item(request: NextItemRequest):
 
     if campaign_id not in progress_data:
         return JSONResponse(content="Unknown campaign ID", status_code=400)
+    await _wait_warm(campaign_id)
     if user_id not in progress_data[campaign_id]:
         return JSONResponse(content="Unknown user ID", status_code=400)
 
-    return get_next_item(
+    num_items = len(progress_data[campaign_id][user_id]["progress"])
+    response = get_next_item(
         campaign_id,
         user_id,
         tasks_data,
         progress_data,
     )
+    if len(progress_data[campaign_id][user_id]["progress"]) != num_items:
+        # an item was taken over from another user by work stealing
+        mark_dirty(tasks_data, campaign_id, user_id)
+        save_progress_data(progress_data)
+    return response
+
+
+@app.get("/route")
+async def _route(pool_id: str, annotator_id: str, redirect: bool = True):
+    pool = load_pool(pool_id)
+    if pool is None:
+        return JSONResponse(content="Unknown pool ID", status_code=400)
+    if annotator_id not in pool["annotators"]:
+        return JSONResponse(content="Unknown annotator ID", status_code=400)
+
+    # the remaining work of campaigns not routed to yet is computed once they are loaded
+    # in a worker thread, so that routing does not load campaigns on the event loop
+    for campaign_id in unrouted_campaigns(pool, annotator_id, progress_data):
+        await _wait_warm(campaign_id)
+        compute_work(tasks_data, progress_data, campaign_id)
+
+    routed = route_annotator(pool, annotator_id, tasks_data, progress_data)
+    if routed is None:
+        return JSONResponse(content="No work left in the pool", status_code=200)
+    campaign_id, user_id = routed
+    # the claim is stored in the progress
+    save_progress_data(progress_data)
+
+    url = progress_data[campaign_id][user_id]["url"]
+    if redirect:
+        return RedirectResponse(url=f"/{url}", status_code=307)
+    return JSONResponse(
+        content={"campaign_id": campaign_id, "user_id": user_id, "url": url},
+        status_code=200,
+    )
 
 
 class GetItemRequest(BaseModel):
@@ -134,6 +333,7 @@ async def _get_i_item(request: GetItemRequest):
 
     if campaign_id not in progress_data:
         return JSONResponse(content="Unknown campaign ID", status_code=400)
+    await _wait_warm(campaign_id)
     if user_id not in progress_data[campaign_id]:
         return JSONResponse(content="Unknown user ID", status_code=400)
 
@@ -149,6 +349,18 @@ async def _get_i_item(request: GetItemRequest):
 class DashboardDataRequest(BaseModel):
     campaign_id: str
     token: str | None = None
+    # pagination, all users if limit is not set
+    offset: int = Field(0, ge=0)
+    limit: int | None = Field(None, gt=0)
+    sort_by: str = "user_id"
+    sort_desc: bool = False
+    # filters
+    status: list[str] | None = None
+    validation: str | None = None
+    active_since: float | None = None
+    active_before: float | None = None
+    # full per-item progress of each user
+    include_progress: bool = False
 
 
 @app.post("/dashboard-data")
@@ -160,46 +372,139 @@ async def _dashboard_data(request: DashboardDataRequest):
 
     is_privileged = request.token == tasks_data[campaign_id]["token"]
 
-    progress_new = {}
     assignment = tasks_data[campaign_id]["info"]["assignment"]
-    if assignment not in ["task-based", "single-stream", "dynamic"]:
+    if assignment not in ["task-based", "single-stream", "dynamic", "priority"]:
         return JSONResponse(
             content="Unsupported campaign assignment type", status_code=400
         )
 
-    # Get threshold info for the campaign
-    validation_threshold = tasks_data[campaign_id]["info"].get("validation_threshold")
+    try:
+        content = query_dashboard_json(
+            tasks_data,
+            progress_data,
+            campaign_id,
+            is_privileged,
+            offset=request.offset,
+            limit=request.limit,
+            sort_by=request.sort_by,
+            sort_desc=request.sort_desc,
+            status=request.status,
+            validation=request.validation,
+            active_since=request.active_since,
+            active_before=request.active_before,
+            include_progress=request.include_progress,
+        )
+    except ValueError as e:
+        return JSONResponse(content=str(e), status_code=400)
+
+    # rows are served pre-serialized
+    return Response(content=content, media_type="application/json")
+
+
+class DashboardBatchRequest(BaseModel):
+    campaign_id: list[str]
+    # tokens in the same order as campaign_id, or empty if none are known
+    token: list[str | None] = []
+    limit: int | None = Field(None, gt=0)
+    include_results: bool = False
 
-    for user_id, user_val in progress_data[campaign_id].items():
-        # shallow copy
-        entry = dict(user_val)
-        entry["validations"] = [
-            all(v) for v in list(entry.get("validations", {}).values())
-        ]
 
-        # Add threshold pass/fail status (only when user is complete)
-        if all(entry["progress"]):
-            entry["threshold_passed"] = check_validation_threshold(
-                tasks_data, progress_data, campaign_id, user_id
+@app.post("/dashboard-batch")
+async def _dashboard_batch(request: DashboardBatchRequest):
+    # first dashboard page (and ranking) of many campaigns in a single request
+    campaign_ids = request.campaign_id
+    tokens = request.token or [None] * len(campaign_ids)
+    if len(campaign_ids) != len(tokens):
+        return JSONResponse(
+            content="Mismatched campaign_id and token count", status_code=400
+        )
+
+    for cid in campaign_ids:
+        if cid not in progress_data:
+            return JSONResponse(content=f"Unknown campaign ID {cid}", status_code=400)
+        if tasks_data[cid]["info"]["assignment"] not in ["task-based", "single-stream", "dynamic", "priority"]:
+            return JSONResponse(
+                content=f"Unsupported campaign assignment type for campaign ID {cid}",
+                status_code=400,
             )
-        else:
-            entry["threshold_passed"] = None
 
-        if not is_privileged:
-            entry["token_correct"] = None
-            entry["token_incorrect"] = None
+    if request.include_results:
+        await asyncio.gather(*[_wait_warm(cid) for cid in campaign_ids])
+
+    # pages are cheap to take from the materialized rows, the rankings of all
+    # campaigns are computed concurrently
+    campaigns = {
+        cid: token == tasks_data[cid]["token"]
+        for cid, token in zip(campaign_ids, tokens)
+    }
+    results = await asyncio.gather(*[
+        asyncio.to_thread(compute_model_scores, cid)
+        if request.include_results and is_privileged else asyncio.sleep(0)
+        for cid, is_privileged in campaigns.items()
+    ])
+
+    summaries = []
+    for (cid, is_privileged), cid_results in zip(campaigns.items(), results):
+        page = query_dashboard_json(
+            tasks_data, progress_data, cid, is_privileged, limit=request.limit
+        )
+        summaries.append(
+            f'{json.dumps(cid)}: {page[:-1]}, "results": {json.dumps(cid_results)}}}'
+        )
+    content = ", ".join(summaries)
+    return Response(content=f"{{{content}}}", media_type="application/json")
+
 
-        progress_new[user_id] = entry
+@app.get("/dashboard-events")
+async def _dashboard_events(
+    request: Request,
+    campaign_id: list[str] = Query(),
+    token: list[str] | None = Query(None),
+):
+    # server-sent events with changed user rows, shared progress and model rankings
+    # of all campaigns of a dashboard over a single connection
+    campaign_ids = campaign_id
+    tokens = token or [None] * len(campaign_ids)
+    if len(tokens) != len(campaign_ids):
+        return JSONResponse(content="Token count does not match campaign count", status_code=400)
+    for cid in campaign_ids:
+        if cid not in progress_data:
+            return JSONResponse(content=f"Unknown campaign ID {cid}", status_code=400)
 
-    return JSONResponse(
-        content={"data": progress_new, "validation_threshold": validation_threshold},
-        status_code=200,
+    queue = None
+    for cid, cid_token in zip(campaign_ids, tokens):
+        queue = subscribe(cid, cid_token == tasks_data.token(cid), queue)
+
+    async def _events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # keep the connection alive
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    # dropped for being too slow
+                    return
+                cid, name, data = event
+                yield f'event: {name}\ndata: {{"campaign_id": {json.dumps(cid)}, "data": {data}}}\n\n'
+        finally:
+            for cid in campaign_ids:
+                unsubscribe(cid, queue)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
     )
 
 
 class DashboardResultsRequest(BaseModel):
     campaign_id: str
     token: str
+    # number of bootstrap resamples for the confidence intervals, 0 for none
+    bootstrap: int = Field(0, ge=0, le=10000)
 
 
 @app.post("/dashboard-results")
@@ -209,12 +514,13 @@ async def _dashboard_results(request: DashboardResultsRequest):
 
     if campaign_id not in progress_data:
         return JSONResponse(content="Unknown campaign ID", status_code=400)
+    await _wait_warm(campaign_id)
 
     # Check if token is valid
     if token != tasks_data[campaign_id]["token"]:
         return JSONResponse(content="Invalid token", status_code=400)
 
-    results = compute_model_scores(campaign_id)
+    results = compute_model_scores(campaign_id, bootstrap=request.bootstrap)
     return JSONResponse(content=results, status_code=200)
 
 
@@ -226,33 +532,30 @@ async def _export_results(
 ):
     if campaign_id not in progress_data:
         return JSONResponse(content="Unknown campaign ID", status_code=400)
+    await _wait_warm(campaign_id)
 
     # Check if token is valid
     if token != tasks_data[campaign_id]["token"]:
         return JSONResponse(content="Invalid token", status_code=400)
 
+    if format not in EXPORT_FORMATS:
+        return JSONResponse(content="Invalid export format", status_code=400)
+
     results = compute_model_scores(campaign_id)
 
-    if format == "typst":
-        content = generate_typst_table(results)
-        return Response(
-            content=content,
-            media_type="text/plain",
-        )
-    elif format == "latex":
-        content = generate_latex_table(results)
-        return Response(
-            content=content,
-            media_type="text/plain",
-        )
-    elif format == "pdf":
-        pdf_bytes = generate_pdf(results, campaign_id)
-        return Response(
-            content=pdf_bytes,
-            media_type="application/pdf",
+    # reuse the rendered export if the results did not change
+    digest = export_digest(results, campaign_id, format)
+    content = get_cached_export(digest)
+    if content is None:
+        # compiling a PDF takes a while so keep it out of the event loop
+        content = await asyncio.to_thread(
+            render_export, results, campaign_id, format, digest
         )
-    else:
-        return JSONResponse(content="Invalid export format", status_code=400)
+
+    return Response(
+        content=content,
+        media_type=EXPORT_FORMATS[format],
+    )
 
 
 class ResetTaskRequest(BaseModel):
@@ -270,35 +573,156 @@ async def _reset_task(request: ResetTaskRequest):
 
     if campaign_id not in progress_data:
         return JSONResponse(content="Unknown campaign ID", status_code=400)
+    await _wait_warm(campaign_id)
     if token != tasks_data[campaign_id]["token"]:
         return JSONResponse(content="Invalid token", status_code=400)
     if user_id not in progress_data[campaign_id]:
         return JSONResponse(content="Unknown user ID", status_code=400)
 
     response = reset_task(campaign_id, user_id, tasks_data, progress_data)
+    mark_dirty(tasks_data, campaign_id, user_id)
+    invalidate_work(campaign_id)
     save_progress_data(progress_data)
+    publish_changes(tasks_data, progress_data, campaign_id, user_id)
     return response
 
 
+class AddUsersRequest(BaseModel):
+    campaign_id: str
+    token: str
+    num_users: int
+
+
+@app.post("/add-users")
+async def _add_users(request: AddUsersRequest):
+    campaign_id = request.campaign_id
+
+    if campaign_id not in progress_data:
+        return JSONResponse(content="Unknown campaign ID", status_code=400)
+    await _wait_warm(campaign_id)
+    if request.token != tasks_data[campaign_id]["token"]:
+        return JSONResponse(content="Invalid token", status_code=400)
+
+    try:
+        new_users = add_users(campaign_id, tasks_data, progress_data, request.num_users)
+    except ValueError as e:
+        return JSONResponse(content=str(e), status_code=400)
+    # rows of new users are added to the dashboard on the next read
+    invalidate_work(campaign_id)
+    save_progress_data(progress_data)
+    return JSONResponse(
+        content={user_id: user_val["url"] for user_id, user_val in new_users.items()},
+        status_code=200,
+    )
+
+
+class ReloadCampaignRequest(BaseModel):
+    campaign_id: str
+    token: str
+
+
+@app.post("/reload-campaign")
+async def _reload_campaign(request: ReloadCampaignRequest):
+    campaign_id = request.campaign_id
+
+    if "/" in campaign_id or "\\" in campaign_id or campaign_id in ["", ".", ".."]:
+        return JSONResponse(content="Unknown campaign ID", status_code=400)
+    # the campaign may not be known to the server yet, the token is checked against the task file
+    task_file = f"{ROOT}/data/tasks/{campaign_id}.json"
+    if not os.path.exists(task_file):
+        return JSONResponse(content="Unknown campaign ID", status_code=400)
+    with open(task_file, "r") as f:
+        token = json.load(f)["token"]
+    if request.token != token:
+        return JSONResponse(content="Invalid token", status_code=400)
+
+    overwritten = campaign_id in progress_data
+    pending = os.path.exists(f"{ROOT}/data/pending/{campaign_id}.json")
+    if not pending and not overwritten:
+        return JSONResponse(content="Unknown campaign ID", status_code=400)
+
+    # other campaigns are not touched, this one is loaded again on next access
+    tasks_data.unload(campaign_id)
+    _warmup.pop(campaign_id, None)
+    invalidate_work(campaign_id)
+
+    # progress of new or overwritten campaigns is handed over by `pearmut add`,
+    # the log of an overwritten campaign is removed only now that it is unloaded
+    if pending:
+        merge_pending_progress(progress_data, [campaign_id])
+        for user_progress in progress_data[campaign_id].values():
+            init_validation_counts(user_progress)
+    return JSONResponse(content="ok", status_code=200)
+
+
+class SetPriorityRequest(BaseModel):
+    campaign_id: str
+    token: str
+    # item index -> new priority
+    priorities: dict[int, float]
+
+
+@app.post("/set-priority")
+async def _set_priority(request: SetPriorityRequest):
+    campaign_id = request.campaign_id
+
+    if campaign_id not in progress_data:
+        return JSONResponse(content="Unknown campaign ID", status_code=400)
+    await _wait_warm(campaign_id)
+    if request.token != tasks_data[campaign_id]["token"]:
+        return JSONResponse(content="Invalid token", status_code=400)
+    if tasks_data[campaign_id]["info"]["assignment"] != "priority":
+        return JSONResponse(content="Campaign does not use priority assignment", status_code=400)
+    num_items = len(tasks_data[campaign_id]["data"])
+    if any(item_i < 0 or item_i >= num_items for item_i in request.priorities):
+        return JSONResponse(content="Item index out of range", status_code=400)
+
+    priorities = set_priorities(campaign_id, tasks_data, progress_data, request.priorities)
+    save_priorities(campaign_id, priorities)
+    return JSONResponse(content="ok", status_code=200)
+
+
 @app.get("/download-annotations")
 async def _download_annotations(
     campaign_id: list[str] = Query(),
     # NOTE: currently not checking tokens for progress download as it is non-destructive
     # token: list[str] = Query()
+    format: str = Query("json"),
 ):
 
-    output = {}
-    for campaign_id in campaign_id:
-        output_path = f"{ROOT}/data/outputs/{campaign_id}.jsonl"
-        if campaign_id not in progress_data:
-            return JSONResponse(
-                content=f"Unknown campaign ID {campaign_id}", status_code=400
+    for cid in campaign_id:
+        if cid not in progress_data:
+            return JSONResponse(content=f"Unknown campaign ID {cid}", status_code=400)
+
+    if format in ANNOTATION_FORMATS:
+        # flat segment-level table of all campaigns
+        rows = itertools.chain.from_iterable(
+            annotation_rows(cid) for cid in campaign_id
+        )
+        headers = {
+            "Content-Disposition": f'attachment; filename="annotations.{format}"',
+        }
+        if format == "csv":
+            return StreamingResponse(
+                iter_annotations_csv(rows),
+                media_type=ANNOTATION_FORMATS[format],
+                headers=headers,
             )
-        if not os.path.exists(output_path):
-            output[campaign_id] = []
-        else:
-            with open(output_path, "r") as f:
-                output[campaign_id] = [json.loads(x) for x in f.readlines()]
+        try:
+            content = await asyncio.to_thread(annotations_to_bytes, rows, format)
+        except ImportError as e:
+            return JSONResponse(content=str(e), status_code=400)
+        return Response(
+            content=content,
+            media_type=ANNOTATION_FORMATS[format],
+            headers=headers,
+        )
+    elif format != "json":
+        return JSONResponse(content="Invalid annotation format", status_code=400)
+
+    output = {}
+    for cid in campaign_id:
+        output[cid] = read_db_log(cid)
 
     return JSONResponse(
         content=output,
@@ -339,6 +763,89 @@ async def _download_progress(
     )
 
 
+class StartJobRequest(BaseModel):
+    kind: str
+    campaign_id: list[str]
+    token: list[str] = []
+    format: str | None = None
+
+
+@app.post("/start-job")
+async def _start_job(request: StartJobRequest):
+    if request.kind not in JOB_KINDS:
+        return JSONResponse(content="Unknown job kind", status_code=400)
+
+    for i, cid in enumerate(request.campaign_id):
+        if cid not in progress_data:
+            return JSONResponse(content=f"Unknown campaign ID {cid}", status_code=400)
+        if request.kind == "export-results":
+            # the results of exports are computed in the server process
+            await _wait_warm(cid)
+        if JOB_KINDS[request.kind][1] and (
+            i >= len(request.token) or request.token[i] != tasks_data[cid]["token"]
+        ):
+            return JSONResponse(
+                content=f"Invalid token for campaign ID {cid}", status_code=400
+            )
+
+    try:
+        job_id = start_job(request.kind, request.campaign_id, request.format)
+    except ValueError as e:
+        return JSONResponse(content=str(e), status_code=400)
+
+    return JSONResponse(content={"job_id": job_id}, status_code=200)
+
+
+class JobRequest(BaseModel):
+    job_id: str
+
+
+@app.post("/job-status")
+async def _job_status(request: JobRequest):
+    job = get_job(request.job_id)
+    if job is None:
+        return JSONResponse(content="Unknown job ID", status_code=400)
+
+    return JSONResponse(content=job_status(job), status_code=200)
+
+
+@app.post("/cancel-job")
+async def _cancel_job(request: JobRequest):
+    if get_job(request.job_id) is None:
+        return JSONResponse(content="Unknown job ID", status_code=400)
+
+    return JSONResponse(
+        content={"cancelled": cancel_job(request.job_id)}, status_code=200
+    )
+
+
+@app.get("/job-result")
+async def _job_result(job_id: str = Query()):
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(content="Unknown job ID", status_code=400)
+    if job_status(job)["status"] != "done":
+        return JSONResponse(content="Job is not finished", status_code=400)
+
+    result = job["future"].result()
+    if job["kind"] == "export-results":
+        extension = {"typst": "typ", "latex": "tex", "pdf": "pdf"}[job["format"]]
+        return Response(
+            content=result,
+            media_type=EXPORT_FORMATS[job["format"]],
+            headers={
+                "Content-Disposition": f'attachment; filename="results.{extension}"',
+            },
+        )
+    return JSONResponse(
+        content=result,
+        status_code=200,
+        headers={
+            "Content-Disposition": f'attachment; filename="{job["kind"]}.json"',
+        },
+    )
+
+
 static_dir = f"{os.path.dirname(os.path.abspath(__file__))}/static/"
 if not os.path.exists(static_dir + "index.html"):
     raise FileNotFoundError(
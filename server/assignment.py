@@ -1,15 +1,23 @@
 import collections
+import heapq
 import random
 import statistics
+import time
+import urllib.parse
 from typing import Any
 
 from fastapi.responses import JSONResponse
 
 from .utils import (
     RESET_MARKER,
+    campaign_caches,
     check_validation_threshold,
     get_db_log,
-    get_db_log_item,
+    get_latest_db_log_item,
+    init_validation_counts,
+    load_priorities,
+    random_token,
+    random_user_ids,
     save_db_payload,
 )
 
@@ -41,16 +49,20 @@ def _completed_response(
     if progress and isinstance(progress[0], set):
         progress = [list(s) for s in progress]
 
-    return JSONResponse(
-        content={
-            "status": "goodbye",
-            "progress": progress,
-            "time": user_progress["time"],
-            "token": token,
-            "instructions_goodbye": instructions_goodbye,
-        },
-        status_code=200,
-    )
+    content = {
+        "status": "goodbye",
+        "progress": progress,
+        "time": user_progress["time"],
+        "token": token,
+        "instructions_goodbye": instructions_goodbye,
+    }
+    # annotators routed from a pool continue with the next campaign
+    if "pool" in user_progress:
+        content["route_url"] = (
+            f"route?pool_id={urllib.parse.quote_plus(user_progress['pool'])}"
+            f"&annotator_id={urllib.parse.quote_plus(user_progress['annotator'])}"
+        )
+    return JSONResponse(content=content, status_code=200)
 
 
 def get_next_item(
@@ -71,6 +83,8 @@ def get_next_item(
         )
     elif assignment == "dynamic":
         return get_next_item_dynamic(campaign_id, user_id, tasks_data, progress_data)
+    elif assignment == "priority":
+        return get_next_item_priority(campaign_id, user_id, tasks_data, progress_data)
     else:
         return JSONResponse(content="Unknown campaign assignment type", status_code=400)
 
@@ -90,7 +104,7 @@ def get_i_item(
         return get_i_item_taskbased(
             campaign_id, user_id, tasks_data, progress_data, item_i
         )
-    elif assignment == "single-stream":
+    elif assignment in ["single-stream", "priority"]:
         return get_i_item_singlestream(
             campaign_id, user_id, tasks_data, progress_data, item_i
         )
@@ -113,16 +127,14 @@ def get_i_item_taskbased(
     user_progress = progress_data[campaign_id][user_id]
 
     # try to get existing annotations if any
-    items_existing = get_db_log_item(campaign_id, user_id, item_i)
+    latest_item = get_latest_db_log_item(campaign_id, user_id, item_i)
     payload_existing = None
-    if items_existing:
-        # get the latest ones
-        latest_item = items_existing[-1]
+    if latest_item is not None:
         payload_existing = {"annotation": latest_item["annotation"]}
         if "comment" in latest_item:
             payload_existing["comment"] = latest_item["comment"]
 
-    if item_i < 0 or item_i >= len(data_all[campaign_id]["data"][user_id]):
+    if item_i < 0 or item_i >= len(user_progress["progress"]):
         return JSONResponse(content="Item index out of range", status_code=400)
 
     return JSONResponse(
@@ -138,13 +150,35 @@ def get_i_item_taskbased(
                 for k, v in data_all[campaign_id]["info"].items()
                 if k.startswith("protocol")
             },
-            "payload": data_all[campaign_id]["data"][user_id][item_i],
+            "payload": _task_item(data_all, progress_data, campaign_id, user_id, item_i),
         }
         | ({"payload_existing": payload_existing} if payload_existing else {}),
         status_code=200,
     )
 
 
+def _existing_payload_singlestream(
+    data_all: dict,
+    campaign_id: str,
+    user_id: str,
+    item_i: int,
+) -> dict | None:
+    """
+    Existing annotation of an item to pre-fill. Items annotated by one user are shared,
+    with redundancy each user only sees their own annotation to keep them independent.
+    """
+    if data_all[campaign_id]["info"].get("redundancy", 1) > 1:
+        latest_item = get_latest_db_log_item(campaign_id, user_id, item_i, shared_reset=True)
+    else:
+        latest_item = get_latest_db_log_item(campaign_id, None, item_i)
+    if latest_item is None:
+        return None
+    payload_existing = {"annotation": latest_item["annotation"]}
+    if "comment" in latest_item:
+        payload_existing["comment"] = latest_item["comment"]
+    return payload_existing
+
+
 def get_i_item_singlestream(
     campaign_id: str,
     user_id: str,
@@ -157,16 +191,7 @@ def get_i_item_singlestream(
     """
     user_progress = progress_data[campaign_id][user_id]
 
-    # try to get existing annotations if any
-    # note the None user_id since it is shared
-    items_existing = get_db_log_item(campaign_id, None, item_i)
-    payload_existing = None
-    if items_existing:
-        # get the latest ones
-        latest_item = items_existing[-1]
-        payload_existing = {"annotation": latest_item["annotation"]}
-        if "comment" in latest_item:
-            payload_existing["comment"] = latest_item["comment"]
+    payload_existing = _existing_payload_singlestream(data_all, campaign_id, user_id, item_i)
 
     if item_i < 0 or item_i >= len(data_all[campaign_id]["data"]):
         return JSONResponse(content="Item index out of range", status_code=400)
@@ -191,6 +216,106 @@ def get_i_item_singlestream(
     )
 
 
+def _borrowed_item(progress_data: dict, campaign_id: str, user_id: str, item_i: int) -> tuple[str, int] | None:
+    """
+    Owner and item index in the owner's task of an item that user_id took over
+    by work stealing, also if it was returned since, None for the user's own items.
+    Taken over items follow the user's own items in their progress.
+    """
+    borrowed = progress_data[campaign_id][user_id].get("borrowed")
+    if not borrowed:
+        return None
+    num_own = len(progress_data[campaign_id][user_id]["progress"]) - len(borrowed)
+    if item_i < num_own:
+        return None
+    owner, owner_i = borrowed[item_i - num_own]
+    return owner, owner_i
+
+
+def task_owner(
+    data_all: dict,
+    progress_data: dict,
+    campaign_id: str,
+    user_id: str,
+    item_i: int,
+) -> tuple[str, int] | None:
+    """
+    Owner and item index in the owner's task of an item that user_id took over
+    by work stealing, None for the user's own items and for items that were
+    returned to their owner because the owner's task was reset.
+    """
+    if item_i in progress_data[campaign_id][user_id].get("returned", []):
+        return None
+    return _borrowed_item(progress_data, campaign_id, user_id, item_i)
+
+
+def _task_item(
+    data_all: dict,
+    progress_data: dict,
+    campaign_id: str,
+    user_id: str,
+    item_i: int,
+) -> list:
+    owner = _borrowed_item(progress_data, campaign_id, user_id, item_i)
+    if owner is not None:
+        return data_all[campaign_id]["data"][owner[0]][owner[1]]
+    return data_all[campaign_id]["data"][user_id][item_i]
+
+
+def _steal_item(
+    data_all: dict,
+    progress_data: dict,
+    campaign_id: str,
+    user_id: str,
+) -> int | None:
+    """
+    Move the last unstarted item of the user with the most unstarted items to the
+    end of the queue of user_id. The first unstarted item of each user is never
+    taken, as they may be working on it.
+    Returns the index of the item in the progress of user_id, None if there is nothing to take.
+    """
+    victim, victim_unstarted = None, []
+    for uid, user_val in progress_data[campaign_id].items():
+        if uid == user_id:
+            continue
+        num_own = len(data_all[campaign_id]["data"][uid])
+        stolen = set(user_val.get("stolen", []))
+        unstarted = [
+            i for i, v in enumerate(user_val["progress"][:num_own])
+            if not v and i not in stolen
+        ]
+        if len(unstarted) > max(len(victim_unstarted), 1):
+            victim, victim_unstarted = uid, unstarted
+    if victim is None:
+        return None
+
+    owner_i = victim_unstarted[-1]
+    progress_data[campaign_id][victim].setdefault("stolen", []).append(owner_i)
+    user_progress = progress_data[campaign_id][user_id]
+    user_progress.setdefault("borrowed", []).append([victim, owner_i])
+    user_progress["progress"].append(False)
+    return len(user_progress["progress"]) - 1
+
+
+def _return_borrowed_items(progress_data: dict, campaign_id: str, owner: str) -> None:
+    """
+    Give the items taken over from owner back after owner's task was reset. The other
+    users keep them in their progress, done, but their submissions no longer count for owner.
+    """
+    for uid, user_val in progress_data[campaign_id].items():
+        borrowed = user_val.get("borrowed")
+        if uid == owner or not borrowed:
+            continue
+        num_own = len(user_val["progress"]) - len(borrowed)
+        returned = user_val.setdefault("returned", [])
+        for k, (item_owner, _) in enumerate(borrowed):
+            if item_owner == owner and num_own + k not in returned:
+                returned.append(num_own + k)
+                user_val["progress"][num_own + k] = True
+        if not returned:
+            user_val.pop("returned")
+
+
 def get_next_item_taskbased(
     campaign_id: str,
     user_id: str,
@@ -199,20 +324,30 @@ def get_next_item_taskbased(
 ) -> JSONResponse:
     """
     Get the next item for task-based assignment.
+    With `work_stealing`, users who finished their task take over unstarted items
+    from the end of the task of the user with the most unstarted items. The
+    submissions then count for the progress of both users.
     """
     user_progress = progress_data[campaign_id][user_id]
-    if all(user_progress["progress"]):
+    # items taken over by other users are skipped
+    stolen = set(user_progress.get("stolen", []))
+    incomplete = [
+        i for i, v in enumerate(user_progress["progress"]) if not v and i not in stolen
+    ]
+    if incomplete:
+        # find first incomplete item
+        item_i = min(incomplete)
+    elif data_all[campaign_id]["info"].get("work_stealing", False):
+        item_i = _steal_item(data_all, progress_data, campaign_id, user_id)
+    else:
+        item_i = None
+    if item_i is None:
         return _completed_response(data_all, progress_data, campaign_id, user_id)
 
-    # find first incomplete item
-    item_i = min([i for i, v in enumerate(user_progress["progress"]) if not v])
-
     # try to get existing annotations if any
-    items_existing = get_db_log_item(campaign_id, user_id, item_i)
+    latest_item = get_latest_db_log_item(campaign_id, user_id, item_i)
     payload_existing = None
-    if items_existing:
-        # get the latest ones
-        latest_item = items_existing[-1]
+    if latest_item is not None:
         payload_existing = {"annotation": latest_item["annotation"]}
         if "comment" in latest_item:
             payload_existing["comment"] = latest_item["comment"]
@@ -230,13 +365,225 @@ def get_next_item_taskbased(
                 for k, v in data_all[campaign_id]["info"].items()
                 if k.startswith("protocol")
             },
-            "payload": data_all[campaign_id]["data"][user_id][item_i],
+            "payload": _task_item(data_all, progress_data, campaign_id, user_id, item_i),
         }
         | ({"payload_existing": payload_existing} if payload_existing else {}),
         status_code=200,
     )
 
 
+# default number of seconds for which a single-stream item is reserved for a user
+LEASE_TTL = 10 * 60
+
+
+class IndexedSet:
+    """Set of items with O(1) add, discard and random sampling."""
+
+    def __init__(self):
+        self._items = []
+        self._pos = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._pos
+
+    def add(self, item) -> None:
+        if item not in self._pos:
+            self._pos[item] = len(self._items)
+            self._items.append(item)
+
+    def discard(self, item) -> None:
+        pos = self._pos.pop(item, None)
+        if pos is None:
+            return
+        # move the last item into the gap
+        last = self._items.pop()
+        if last != item:
+            self._items[pos] = last
+            self._pos[last] = pos
+
+    def sample(self, exclude=(), tries: int = 8):
+        """
+        Random item that is not in exclude, None if there is none.
+        Falls back to a scan if random tries hit excluded items.
+        """
+        if not self._items:
+            return None
+        for _ in range(tries):
+            item = random.choice(self._items)
+            if item not in exclude:
+                return item
+        candidates = [item for item in self._items if item not in exclude]
+        return random.choice(candidates) if candidates else None
+
+
+class ItemScheduler:
+    """
+    Scheduler of a single-stream campaign that serves each item to `redundancy`
+    distinct users. An item handed out is leased to the user until it is submitted
+    or the lease expires after ttl seconds.
+
+    Items are kept in buckets by coverage (submissions and active leases), so the
+    least covered items are sampled in O(redundancy). Users are never served items
+    they already submitted, and leases are queued by expiry for O(1) sweeping.
+    """
+
+    def __init__(
+        self,
+        campaign_progress: dict,
+        coverage: list[int],
+        seen: dict[str, set],
+        redundancy: int = 1,
+        ttl: float = LEASE_TTL,
+    ):
+        # to detect replaced progress data
+        self.campaign_progress = campaign_progress
+        self.redundancy = redundancy
+        self.ttl = ttl
+        # item_i -> number of distinct users who submitted it
+        self._coverage = coverage
+        # item_i -> number of active leases
+        self._leased = [0] * len(coverage)
+        # user_id -> submitted items
+        self._seen = seen
+        # coverage including leases -> items with that coverage, up to redundancy - 1
+        self._buckets = [IndexedSet() for _ in range(redundancy)]
+        for item_i, item_coverage in enumerate(coverage):
+            if item_coverage < redundancy:
+                self._buckets[item_coverage].add(item_i)
+        # user_id -> (leased item_i, expiry)
+        self._leases = {}
+        # (expiry, user_id), entries of renewed or released leases are skipped
+        self._expiry = collections.deque()
+
+    def _effective(self, item_i: int) -> int:
+        return self._coverage[item_i] + self._leased[item_i]
+
+    def _move(self, item_i: int, before: int) -> None:
+        """Move an item to the bucket of its coverage after it changed from before."""
+        after = self._effective(item_i)
+        if before < self.redundancy:
+            self._buckets[before].discard(item_i)
+        if after < self.redundancy:
+            self._buckets[after].add(item_i)
+
+    def sweep(self, now: float) -> None:
+        """Release all expired leases."""
+        while self._expiry and self._expiry[0][0] <= now:
+            expiry, user_id = self._expiry.popleft()
+            lease = self._leases.get(user_id)
+            if lease is not None and lease[1] == expiry:
+                self.release(user_id)
+
+    def lease(self, user_id: str, now: float) -> int | None:
+        """
+        Lease one of the least covered items the user has not submitted, or renew the
+        lease the user already holds. None if there is no such item that is not leased out.
+        """
+        self.sweep(now)
+        if user_id in self._leases:
+            item_i = self._leases[user_id][0]
+        else:
+            seen = self._seen.get(user_id, ())
+            for bucket in self._buckets:
+                item_i = bucket.sample(exclude=seen)
+                if item_i is not None:
+                    break
+            else:
+                return None
+            before = self._effective(item_i)
+            self._leased[item_i] += 1
+            self._move(item_i, before)
+        self._leases[user_id] = (item_i, now + self.ttl)
+        self._expiry.append((now + self.ttl, user_id))
+        return item_i
+
+    def release(self, user_id: str) -> None:
+        """Return the item leased to the user to the pool."""
+        lease = self._leases.pop(user_id, None)
+        if lease is not None:
+            item_i = lease[0]
+            before = self._effective(item_i)
+            self._leased[item_i] -= 1
+            self._move(item_i, before)
+
+    def complete(self, user_id: str, item_i: int) -> bool:
+        """
+        Count a submission of the user, releasing their lease of the item.
+        Returns whether the item has been submitted by `redundancy` users.
+        """
+        if self._leases.get(user_id, (None,))[0] == item_i:
+            self.release(user_id)
+        seen = self._seen.setdefault(user_id, set())
+        if item_i not in seen:
+            seen.add(item_i)
+            before = self._effective(item_i)
+            self._coverage[item_i] += 1
+            self._move(item_i, before)
+        return self._coverage[item_i] >= self.redundancy
+
+    def unserved(self, user_id: str) -> list[int]:
+        """All items that are not fully covered and that the user has not submitted."""
+        seen = self._seen.get(user_id, ())
+        return [
+            item_i for item_i, item_coverage in enumerate(self._coverage)
+            if item_coverage < self.redundancy and item_i not in seen
+        ]
+
+
+def _log_coverage(campaign_id: str, num_items: int) -> tuple[list[int], dict[str, set]]:
+    """Distinct users per item and submitted items per user from the log, respecting resets."""
+    item_users = collections.defaultdict(set)
+    for entry in get_db_log(campaign_id):
+        if entry.item_i is None or entry.item_i >= num_items:
+            continue
+        if entry.annotation == RESET_MARKER:
+            if entry.user_id is None:
+                item_users[entry.item_i].clear()
+            else:
+                item_users[entry.item_i].discard(entry.user_id)
+        elif entry.user_id is not None:
+            item_users[entry.item_i].add(entry.user_id)
+
+    coverage = [0] * num_items
+    seen = collections.defaultdict(set)
+    for item_i, users in item_users.items():
+        coverage[item_i] = len(users)
+        for user_id in users:
+            seen[user_id].add(item_i)
+    return coverage, dict(seen)
+
+
+# campaign_id -> ItemScheduler of single-stream and PriorityScheduler of priority campaigns
+_item_schedulers = {}
+campaign_caches.append(_item_schedulers)
+
+
+def _get_item_scheduler(tasks_data: dict, progress_data: dict, campaign_id: str, user_id: str) -> ItemScheduler:
+    scheduler = _item_schedulers.get(campaign_id)
+    if (
+        not isinstance(scheduler, ItemScheduler)
+        or scheduler.campaign_progress is not progress_data[campaign_id]
+    ):
+        info = tasks_data[campaign_id]["info"]
+        redundancy = info.get("redundancy", 1)
+        progress = progress_data[campaign_id][user_id]["progress"]
+        if redundancy == 1:
+            coverage, seen = [int(bool(v)) for v in progress], {}
+        else:
+            coverage, seen = _log_coverage(campaign_id, len(progress))
+            coverage = [redundancy if v else c for c, v in zip(coverage, progress)]
+        scheduler = ItemScheduler(
+            progress_data[campaign_id], coverage, seen,
+            redundancy=redundancy,
+            ttl=info.get("lease_ttl", LEASE_TTL),
+        )
+        _item_schedulers[campaign_id] = scheduler
+    return scheduler
+
+
 def get_next_item_singlestream(
     campaign_id: str,
     user_id: str,
@@ -245,11 +592,12 @@ def get_next_item_singlestream(
 ) -> JSONResponse:
     """
     Get the next item for single-stream assignment.
-    In this mode, all users share the same pool of items.
-    Items are randomly selected from unfinished items.
-
-    Note: There is a potential race condition where multiple users could
-    receive the same item simultaneously. This is fine since we store all responses.
+    In this mode, all users share the same pool of items and each item is
+    annotated by `redundancy` distinct users (default 1).
+    Items are randomly selected from the least covered unfinished items that are
+    not leased to other users, and leased to the user until submitted or
+    `lease_ttl` passes. Only when all such items are leased, users can receive
+    the same item.
     """
     user_progress = progress_data[campaign_id][user_id]
     progress = user_progress["progress"]
@@ -257,20 +605,16 @@ def get_next_item_singlestream(
     if all(progress):
         return _completed_response(data_all, progress_data, campaign_id, user_id)
 
-    # find a random incomplete item
-    incomplete_indices = [i for i, v in enumerate(progress) if not v]
-    item_i = random.choice(incomplete_indices)
+    scheduler = _get_item_scheduler(data_all, progress_data, campaign_id, user_id)
+    item_i = scheduler.lease(user_id, time.monotonic())
+    if item_i is None:
+        # find a random unfinished item the user has not submitted
+        unserved = scheduler.unserved(user_id)
+        if not unserved:
+            return _completed_response(data_all, progress_data, campaign_id, user_id)
+        item_i = random.choice(unserved)
 
-    # try to get existing annotations if any
-    # note the None user_id since it is shared
-    items_existing = get_db_log_item(campaign_id, None, item_i)
-    payload_existing = None
-    if items_existing:
-        # get the latest ones
-        latest_item = items_existing[-1]
-        payload_existing = {"annotation": latest_item["annotation"]}
-        if "comment" in latest_item:
-            payload_existing["comment"] = latest_item["comment"]
+    payload_existing = _existing_payload_singlestream(data_all, campaign_id, user_id, item_i)
 
     return JSONResponse(
         content={
@@ -292,6 +636,162 @@ def get_next_item_singlestream(
     )
 
 
+class PriorityScheduler:
+    """
+    Scheduler of a priority campaign. Unfinished items are served highest priority
+    first from a heap keyed by priority + priority_decay * hours since the epoch at
+    which the priority was set. Priorities thus decrease linearly over time relative
+    to priorities set later. Changed priorities are pushed again and outdated heap
+    entries skipped when popped, so updates are O(log n).
+    Items handed out are leased like in ItemScheduler.
+    """
+
+    def __init__(
+        self,
+        campaign_progress: dict,
+        priorities: list[list[float]],
+        progress: list,
+        decay: float = 0,
+        ttl: float = LEASE_TTL,
+    ):
+        # to detect replaced progress data
+        self.campaign_progress = campaign_progress
+        # item_i -> [priority, time it was set]
+        self.priorities = priorities
+        self.decay = decay
+        self.ttl = ttl
+        self._keys = [self._key(priority, set_time) for priority, set_time in priorities]
+        self._done = [bool(v) for v in progress]
+        # item_i -> user_id it is leased to
+        self._leased = {}
+        self._heap = [(-key, item_i) for item_i, key in enumerate(self._keys) if not self._done[item_i]]
+        heapq.heapify(self._heap)
+        # user_id -> (leased item_i, expiry)
+        self._leases = {}
+        # (expiry, user_id), entries of renewed or released leases are skipped
+        self._expiry = collections.deque()
+
+    def _key(self, priority: float, set_time: float) -> float:
+        return priority + self.decay * set_time / 3600
+
+    def _push(self, item_i: int) -> None:
+        if not self._done[item_i] and item_i not in self._leased:
+            heapq.heappush(self._heap, (-self._keys[item_i], item_i))
+
+    def set_priority(self, item_i: int, priority: float, set_time: float) -> None:
+        self.priorities[item_i] = [priority, set_time]
+        self._keys[item_i] = self._key(priority, set_time)
+        self._push(item_i)
+
+    def sweep(self, now: float) -> None:
+        """Release all expired leases."""
+        while self._expiry and self._expiry[0][0] <= now:
+            expiry, user_id = self._expiry.popleft()
+            lease = self._leases.get(user_id)
+            if lease is not None and lease[1] == expiry:
+                self.release(user_id)
+
+    def lease(self, user_id: str, now: float) -> int | None:
+        """
+        Lease the unfinished item with the highest priority that is not leased out, or
+        renew the lease the user already holds. None if all unfinished items are leased.
+        """
+        self.sweep(now)
+        if user_id in self._leases:
+            item_i = self._leases[user_id][0]
+        else:
+            while self._heap:
+                neg_key, item_i = heapq.heappop(self._heap)
+                if -neg_key == self._keys[item_i] and not self._done[item_i] and item_i not in self._leased:
+                    break
+            else:
+                return None
+            self._leased[item_i] = user_id
+        self._leases[user_id] = (item_i, now + self.ttl)
+        self._expiry.append((now + self.ttl, user_id))
+        return item_i
+
+    def release(self, user_id: str) -> None:
+        """Return the item leased to the user to the queue."""
+        lease = self._leases.pop(user_id, None)
+        if lease is not None:
+            self._leased.pop(lease[0], None)
+            self._push(lease[0])
+
+    def complete(self, user_id: str, item_i: int) -> None:
+        """Remove a submitted item from the queue together with its lease."""
+        if self._leases.get(user_id, (None,))[0] == item_i:
+            self.release(user_id)
+        self._done[item_i] = True
+
+    def unfinished(self) -> list[int]:
+        return [item_i for item_i, done in enumerate(self._done) if not done]
+
+
+def _get_priority_scheduler(tasks_data: dict, progress_data: dict, campaign_id: str, user_id: str) -> PriorityScheduler:
+    scheduler = _item_schedulers.get(campaign_id)
+    if (
+        not isinstance(scheduler, PriorityScheduler)
+        or scheduler.campaign_progress is not progress_data[campaign_id]
+    ):
+        info = tasks_data[campaign_id]["info"]
+        priorities = load_priorities(campaign_id)
+        if priorities is None:
+            # priorities of the first document of each item
+            priorities = [[item[0].get("priority", 0), 0] for item in tasks_data[campaign_id]["data"]]
+        scheduler = PriorityScheduler(
+            progress_data[campaign_id],
+            priorities,
+            progress_data[campaign_id][user_id]["progress"],
+            decay=info.get("priority_decay", 0),
+            ttl=info.get("lease_ttl", LEASE_TTL),
+        )
+        _item_schedulers[campaign_id] = scheduler
+    return scheduler
+
+
+def get_next_item_priority(
+    campaign_id: str,
+    user_id: str,
+    tasks_data: dict,
+    progress_data: dict,
+) -> JSONResponse:
+    """
+    Get the next item for priority assignment.
+    All users share the same pool of items, which are served by their `priority`
+    (highest first), optionally decaying by `priority_decay` per hour.
+    Items are leased to the user until submitted or `lease_ttl` passes.
+    """
+    progress = progress_data[campaign_id][user_id]["progress"]
+    if all(progress):
+        return _completed_response(tasks_data, progress_data, campaign_id, user_id)
+
+    scheduler = _get_priority_scheduler(tasks_data, progress_data, campaign_id, user_id)
+    item_i = scheduler.lease(user_id, time.monotonic())
+    if item_i is None:
+        # all unfinished items are leased to other users
+        item_i = random.choice(scheduler.unfinished())
+    return get_i_item_singlestream(campaign_id, user_id, tasks_data, progress_data, item_i)
+
+
+def set_priorities(
+    campaign_id: str,
+    tasks_data: dict,
+    progress_data: dict,
+    priorities: dict[int, float],
+) -> list[list[float]]:
+    """
+    Change the priorities of items of a priority campaign at runtime.
+    Returns the priorities of all items and when they were set, to be saved.
+    """
+    user_id = next(iter(progress_data[campaign_id]))
+    scheduler = _get_priority_scheduler(tasks_data, progress_data, campaign_id, user_id)
+    now = time.time()
+    for item_i, priority in priorities.items():
+        scheduler.set_priority(item_i, priority, now)
+    return scheduler.priorities
+
+
 def get_next_item_dynamic(
     campaign_id: str,
     user_id: str,
@@ -457,6 +957,8 @@ def _reset_user_time(progress_data: dict, campaign_id: str, user_id: str) -> Non
     progress_data[campaign_id][user_id]["time_start"] = None
     progress_data[campaign_id][user_id]["time_end"] = None
     progress_data[campaign_id][user_id]["validations"] = {}
+    progress_data[campaign_id][user_id]["validations_total"] = 0
+    progress_data[campaign_id][user_id]["validations_failed"] = 0
 
 
 def reset_task(
@@ -478,10 +980,15 @@ def reset_task(
                 campaign_id,
                 {"user_id": user_id, "item_i": item_i, "annotation": RESET_MARKER},
             )
-        progress_data[campaign_id][user_id]["progress"] = [False] * num_items
+        # items taken over from other users belong to them and are kept
+        user_progress = progress_data[campaign_id][user_id]
+        user_progress["progress"] = [False] * num_items + user_progress["progress"][num_items:]
+        # and the user's items taken over by others are annotated again
+        user_progress.pop("stolen", None)
+        _return_borrowed_items(progress_data, campaign_id, user_id)
         _reset_user_time(progress_data, campaign_id, user_id)
         return JSONResponse(content="ok", status_code=200)
-    elif assignment == "single-stream":
+    elif assignment in ["single-stream", "priority"]:
         # Save reset markers for all items (shared pool)
         num_items = len(tasks_data[campaign_id]["data"])
         for item_i in range(num_items):
@@ -492,6 +999,7 @@ def reset_task(
         # for single-stream reset all progress
         for uid in progress_data[campaign_id]:
             progress_data[campaign_id][uid]["progress"] = [False] * num_items
+        _item_schedulers.pop(campaign_id, None)
         _reset_user_time(progress_data, campaign_id, user_id)
         return JSONResponse(content="ok", status_code=200)
     elif assignment == "dynamic":
@@ -513,6 +1021,57 @@ def reset_task(
         )
 
 
+def add_users(
+    campaign_id: str,
+    tasks_data: dict,
+    progress_data: dict,
+    num_users: int,
+) -> dict:
+    """
+    Add users with random IDs and tokens to a shared-pool campaign.
+    New users start with the current shared progress, existing users are not changed.
+
+    Returns:
+        Progress of the new users keyed by user_id.
+    """
+    campaign_data = tasks_data[campaign_id]
+    assignment = campaign_data["info"]["assignment"]
+    if assignment not in ["single-stream", "dynamic", "priority"]:
+        raise ValueError("Users can only be added to shared-pool campaigns")
+    if num_users < 1:
+        raise ValueError("Number of users must be positive")
+
+    campaign_progress = progress_data[campaign_id]
+    user_val = next(iter(campaign_progress.values()), None)
+    if user_val is not None:
+        progress = user_val["progress"]
+    elif assignment == "dynamic":
+        progress = [[] for _ in range(len(campaign_data["data"]))]
+    else:
+        progress = [False] * len(campaign_data["data"])
+
+    rng = random.Random()
+    new_users = {}
+    for user_id in random_user_ids(num_users, rng, existing=campaign_progress):
+        new_users[user_id] = {
+            # models annotated per item in dynamic campaigns are copied too
+            "progress": [list(v) if isinstance(v, (list, set)) else v for v in progress],
+            "time_start": None,
+            "time_end": None,
+            "time": 0,
+            "url": (
+                f"{campaign_data['info'].get('template', 'basic')}.html"
+                f"?campaign_id={urllib.parse.quote_plus(campaign_id)}"
+                f"&user_id={user_id}"
+            ),
+            "token_correct": random_token(rng),
+            "token_incorrect": random_token(rng),
+        }
+        init_validation_counts(new_users[user_id])
+    campaign_progress.update(new_users)
+    return new_users
+
+
 def update_progress(
     campaign_id: str,
     user_id: str,
@@ -528,11 +1087,22 @@ def update_progress(
     if assignment == "task-based":
         # even if it's already set it should be fine
         progress_data[campaign_id][user_id]["progress"][item_i] = True
+        owner = task_owner(tasks_data, progress_data, campaign_id, user_id, item_i)
+        if owner is not None:
+            progress_data[campaign_id][owner[0]]["progress"][owner[1]] = True
         return JSONResponse(content={"status": "ok"}, status_code=200)
     elif assignment == "single-stream":
+        scheduler = _get_item_scheduler(tasks_data, progress_data, campaign_id, user_id)
+        if scheduler.complete(user_id, item_i):
+            # progress all users
+            for uid in progress_data[campaign_id]:
+                progress_data[campaign_id][uid]["progress"][item_i] = True
+        return JSONResponse(content="ok", status_code=200)
+    elif assignment == "priority":
         # progress all users
         for uid in progress_data[campaign_id]:
             progress_data[campaign_id][uid]["progress"][item_i] = True
+        _get_priority_scheduler(tasks_data, progress_data, campaign_id, user_id).complete(user_id, item_i)
         return JSONResponse(content="ok", status_code=200)
     elif assignment == "dynamic":
         # For dynamic, track which models were annotated
@@ -3,14 +3,27 @@ Command-line interface for managing and running the Pearmut server.
 """
 
 import argparse
-import hashlib
 import json
 import os
+import time
+import urllib.error
 import urllib.parse
+import urllib.request
 
 import psutil
 
-from .utils import ROOT, load_progress_data, save_progress_data
+from .item_store import remove_items, write_items
+from .utils import (
+    ROOT,
+    load_progress_data,
+    random_token,
+    random_user_ids,
+    remove_db_log,
+    save_campaign_token,
+    save_pending_progress,
+    save_priorities,
+    save_progress_data,
+)
 
 os.makedirs(f"{ROOT}/data/tasks", exist_ok=True)
 load_progress_data(warn=None)
@@ -30,13 +43,20 @@ def _run(args_unknown):
         "--server", default="http://localhost:8001",
         help="Prefix server URL for protocol links"
     )
+    args.add_argument(
+        "--memory-budget", type=int, default=None,
+        help="Approximate memory for loaded campaigns in MB, inactive campaigns above it are evicted"
+    )
     args = args.parse_args(args_unknown)
 
+    if args.memory_budget is not None:
+        tasks_data.memory_budget = args.memory_budget * 1024 ** 2
+
     # print access dashboard URL for all campaigns
-    if tasks_data:
+    if tasks_data.campaign_ids:
         dashboard_url = args.server + "/dashboard.html?" + "&".join([
-            f"campaign_id={urllib.parse.quote_plus(campaign_id)}&token={campaign_data["token"]}"
-            for campaign_id, campaign_data in tasks_data.items()
+            f"campaign_id={urllib.parse.quote_plus(campaign_id)}&token={tasks_data.token(campaign_id)}"
+            for campaign_id in tasks_data.campaign_ids
         ])
         print("\033[92mNow serving Pearmut, use the following URL to access the everything-dashboard:\033[0m")
         print("🍐", dashboard_url+"\n", flush=True)
@@ -56,6 +76,42 @@ def _run(args_unknown):
     )
 
 
+def _server_running(server):
+    """
+    Whether a pearmut server answers at the server URL. Servers that are still
+    loading campaigns answer /ready with 503.
+    """
+    try:
+        with urllib.request.urlopen(f"{server}/ready", timeout=5) as response:
+            status = json.load(response)
+    except urllib.error.HTTPError as e:
+        try:
+            status = json.load(e)
+        except ValueError:
+            return False
+    except (OSError, ValueError):
+        return False
+    return isinstance(status, dict) and "ready" in status
+
+
+def _post_server(server, path, payload):
+    """
+    Send a request to the running server, returns the decoded response.
+    Raises ValueError with the message of the server if the request is refused
+    and urllib.error.URLError if the server cannot be reached.
+    """
+    request = urllib.request.Request(
+        f"{server}{path}",
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        raise ValueError(json.load(e))
+
+
 def _validate_item_structure(items):
     """
     Validate that items have the correct structure.
@@ -179,20 +235,19 @@ def _shuffle_campaign_data(campaign_data, rng):
         for user_id, task in campaign_data["data"].items():
             for doc in task:
                 shuffle_document(doc)
-    elif assignment in ["single-stream", "dynamic"]:
+    elif assignment in ["single-stream", "dynamic", "priority"]:
         # Shuffle each document in the shared pool
         for doc in campaign_data["data"]:
             shuffle_document(doc)
 
 
-def _add_single_campaign(data_file, overwrite, server):
+def _add_single_campaign(data_file, overwrite, server, live=False):
     """
     Add a single campaign from a JSON data file.
+    If live, the server is running and the progress is handed over to it (see /reload-campaign).
     """
     import random
 
-    import wonderwords
-
     with open(data_file, 'r') as f:
         campaign_data = json.load(f)
 
@@ -214,9 +269,7 @@ def _add_single_campaign(data_file, overwrite, server):
     
     # Template defaults to "basic" if not specified
     assignment = campaign_data["info"]["assignment"]
-    # use random words for identifying users
     rng = random.Random()
-    rword = wonderwords.RandomWord(rng=rng)
 
     # Parse users specification from info
     users_spec = campaign_data["info"].get("users")
@@ -238,6 +291,8 @@ def _add_single_campaign(data_file, overwrite, server):
                 except ValueError as e:
                     raise ValueError(f"Task {task_i}, document {doc_i}: {e}")
         num_users = len(tasks)
+        if not isinstance(campaign_data["info"].get("work_stealing", False), bool):
+            raise ValueError("'work_stealing' must be true or false.")
     elif assignment == "single-stream":
         tasks = campaign_data["data"]
         if users_spec is None:
@@ -258,6 +313,33 @@ def _add_single_campaign(data_file, overwrite, server):
             num_users = len(users_spec)
         else:
             raise ValueError("'users' must be an integer or a list.")
+        redundancy = campaign_data["info"].get("redundancy", 1)
+        if not isinstance(redundancy, int) or isinstance(redundancy, bool) or redundancy < 1:
+            raise ValueError("'redundancy' must be a positive integer.")
+    elif assignment == "priority":
+        tasks = campaign_data["data"]
+        if users_spec is None:
+            raise ValueError(
+                "Priority campaigns must specify 'users' in info.")
+        if not isinstance(campaign_data["data"], list):
+            raise ValueError(
+                "Priority campaign 'data' must be a list of items.")
+        for doc_i, doc in enumerate(tasks):
+            try:
+                _validate_item_structure(doc)
+            except ValueError as e:
+                raise ValueError(f"Document {doc_i}: {e}")
+            priority = doc[0].get("priority", 0) if doc else 0
+            if not isinstance(priority, (int, float)) or isinstance(priority, bool):
+                raise ValueError(f"Document {doc_i}: 'priority' must be a number")
+        if isinstance(users_spec, int):
+            num_users = users_spec
+        elif isinstance(users_spec, list):
+            num_users = len(users_spec)
+        else:
+            raise ValueError("'users' must be an integer or a list.")
+        if not isinstance(campaign_data["info"].get("priority_decay", 0), (int, float)):
+            raise ValueError("'priority_decay' must be a number.")
     elif assignment == "dynamic":
         tasks = campaign_data["data"]
         if users_spec is None:
@@ -304,16 +386,8 @@ def _add_single_campaign(data_file, overwrite, server):
 
     # Generate or parse user IDs based on users specification
     if users_spec is None or isinstance(users_spec, int):
-        # Generate random user IDs
-        user_ids = []
-        while len(user_ids) < num_users:
-            new_id = f"{rword.random_words(amount=1, include_parts_of_speech=['adjective'])[0]}-{rword.random_words(amount=1, include_parts_of_speech=['noun'])[0]}"
-            if new_id not in user_ids:
-                user_ids.append(new_id)
-        user_ids = [
-            f"{user_id}-{rng.randint(0, 999):03d}"
-            for user_id in user_ids
-        ]
+        # use random words for identifying users
+        user_ids = random_user_ids(num_users, rng)
     elif isinstance(users_spec, list):
         if len(users_spec) != num_users:
             raise ValueError(
@@ -342,40 +416,37 @@ def _add_single_campaign(data_file, overwrite, server):
         print("Warning: 'protocol' not specified in campaign info. Defaulting to 'ESA'.")
 
     # Remove output file when overwriting (after all validations pass)
-    if overwrite and campaign_data['campaign_id'] in progress_data:
-        output_file = f"{ROOT}/data/outputs/{campaign_data['campaign_id']}.jsonl"
-        if os.path.exists(output_file):
-            os.remove(output_file)
+    # a running server removes the log itself once the old campaign is unloaded
+    if overwrite and campaign_data['campaign_id'] in progress_data and not live:
+        remove_db_log(campaign_data['campaign_id'])
 
     # For task-based, data is a dict mapping user_id -> tasks
-    # For single-stream and dynamic, data is a flat list (shared among all users)
+    # For single-stream, dynamic and priority, data is a flat list (shared among all users)
     if assignment == "task-based":
         campaign_data["data"] = {
             user_id: task
             for user_id, task in zip(user_ids, tasks)
         }
-    elif assignment in ["single-stream", "dynamic"]:
+    elif assignment in ["single-stream", "dynamic", "priority"]:
         campaign_data["data"] = tasks
 
     # generate a token for dashboard access if not present
     if "token" not in campaign_data:
-        campaign_data["token"] = (
-            hashlib.sha256(random.randbytes(16)).hexdigest()[:10]
-        )
+        campaign_data["token"] = random_token(rng)
 
     def get_token(user_id, token_type):
         """Get user token or generate a random one."""
         token = user_tokens.get(user_id, {}).get(token_type)
         if token is not None:
             return token
-        return hashlib.sha256(random.randbytes(16)).hexdigest()[:10]
+        return random_token(rng)
 
     user_progress = {
         user_id: {
             # TODO: progress tracking could be based on the assignment type
             "progress": (
                 [False]*len(campaign_data["data"][user_id]) if assignment == "task-based"
-                else [False]*len(campaign_data["data"]) if assignment == "single-stream"
+                else [False]*len(campaign_data["data"]) if assignment in ["single-stream", "priority"]
                 else [list() for _ in range(len(campaign_data["data"]))] if assignment == "dynamic"
                 else []
             ),
@@ -455,12 +526,39 @@ def _add_single_campaign(data_file, overwrite, server):
     if should_shuffle:
         _shuffle_campaign_data(campaign_data, rng)
 
-    # commit to transaction
-    with open(f"{ROOT}/data/tasks/{campaign_data['campaign_id']}.json", "w") as f:
-        json.dump(campaign_data, f, indent=2, ensure_ascii=False)
+    # commit to transaction, items are stored separately for random access
+    task_prefix = f"{ROOT}/data/tasks/{campaign_data['campaign_id']}"
+    campaign_meta = write_items(task_prefix, campaign_data)
+    with open(f"{task_prefix}.json.tmp", "w") as f:
+        json.dump(campaign_meta, f, indent=2, ensure_ascii=False)
+    os.replace(f"{task_prefix}.json.tmp", f"{task_prefix}.json")
+
+    if assignment == "priority":
+        # priorities of the first document of each item, set at the time of adding
+        save_priorities(campaign_data['campaign_id'], [
+            [item[0].get("priority", 0) if item else 0, time.time()]
+            for item in campaign_data["data"]
+        ])
 
-    progress_data[campaign_data['campaign_id']] = user_progress
-    save_progress_data(progress_data)
+    if live:
+        # the running server saves progress.json from memory and would drop the campaign
+        save_pending_progress(campaign_data['campaign_id'], user_progress)
+    else:
+        progress_data[campaign_data['campaign_id']] = user_progress
+        save_progress_data(progress_data)
+    save_campaign_token(campaign_data['campaign_id'], campaign_data['token'])
+    if live:
+        try:
+            _post_server(server, "/reload-campaign", {
+                "campaign_id": campaign_data['campaign_id'],
+                "token": campaign_data['token'],
+            })
+        except urllib.error.URLError as e:
+            # the pending progress is merged when the server starts
+            print(
+                f"Could not reach the server at {server} ({e.reason}), "
+                f"campaign '{campaign_data['campaign_id']}' is loaded when it is started again."
+            )
 
 
     print(
@@ -490,26 +588,187 @@ def _add_campaign(args_unknown):
     )
     args.add_argument(
         "--server", default="http://localhost:8001",
-        help="Prefix server URL for protocol links"
+        help="Prefix server URL for protocol links, campaigns are loaded into it if it is running"
     )
     args = args.parse_args(args_unknown)
 
+    live = _server_running(args.server)
     for data_file in args.data_files:
         try:
-            _add_single_campaign(data_file, args.overwrite, args.server)
+            _add_single_campaign(data_file, args.overwrite, args.server, live=live)
         except Exception as e:
             print(f"Error processing {data_file}: {e}")
             exit(1)
 
 
+def _add_pool(args_unknown):
+    """
+    Add a pool of campaigns that annotators are routed across.
+    """
+    from .router import save_pool
+
+    args = argparse.ArgumentParser()
+    args.add_argument(
+        'pool_file', type=str,
+        help='Path to the pool definition'
+    )
+    args.add_argument(
+        "--server", default="http://localhost:8001",
+        help="Prefix server URL for routing links"
+    )
+    args = args.parse_args(args_unknown)
+
+    with open(args.pool_file, "r") as f:
+        pool = json.load(f)
+
+    progress_data = load_progress_data()
+    if "pool_id" not in pool:
+        print("Pool must contain 'pool_id'.")
+        exit(1)
+    if not isinstance(pool.get("campaigns"), dict) or not isinstance(pool.get("annotators"), dict):
+        print("Pool must contain 'campaigns' (campaign -> language pair) and 'annotators' (annotator -> language pairs).")
+        exit(1)
+    for campaign_id in pool["campaigns"]:
+        if campaign_id not in progress_data:
+            print(f"Campaign '{campaign_id}' does not exist.")
+            exit(1)
+    for annotator_id, language_pairs in pool["annotators"].items():
+        if not isinstance(language_pairs, list):
+            print(f"Language pairs of annotator '{annotator_id}' must be a list.")
+            exit(1)
+
+    save_pool(pool)
+    for annotator_id in pool["annotators"]:
+        print(
+            f"🧭 {args.server}/route"
+            f"?pool_id={urllib.parse.quote_plus(pool['pool_id'])}"
+            f"&annotator_id={urllib.parse.quote_plus(annotator_id)}"
+        )
+
+
+def _add_users(args_unknown):
+    """
+    Add users to a shared-pool campaign, through the running server if there is one.
+    """
+    from .utils import CampaignTasks
+
+    args = argparse.ArgumentParser()
+    args.add_argument('action', type=str, choices=['add'])
+    args.add_argument('campaign', type=str, help='Campaign to add users to')
+    args.add_argument('num_users', type=int, help='Number of users to add')
+    args.add_argument(
+        "--server", default="http://localhost:8001",
+        help="URL of the running server and prefix for protocol links"
+    )
+    args = args.parse_args(args_unknown)
+
+    progress_data = load_progress_data()
+    if args.campaign not in progress_data:
+        print(f"Campaign '{args.campaign}' does not exist.")
+        exit(1)
+    tasks_data = CampaignTasks(progress_data)
+
+    if _server_running(args.server):
+        # the running server keeps the progress in memory and owns progress.json
+        try:
+            urls = _post_server(args.server, "/add-users", {
+                "campaign_id": args.campaign,
+                "token": tasks_data.token(args.campaign),
+                "num_users": args.num_users,
+            })
+        except ValueError as e:
+            print(f"Error adding users: {e}")
+            exit(1)
+        except urllib.error.URLError as e:
+            print(f"Could not reach the server at {args.server} ({e.reason}), no users were added.")
+            exit(1)
+    else:
+        from .assignment import add_users
+
+        try:
+            new_users = add_users(args.campaign, tasks_data, progress_data, args.num_users)
+        except ValueError as e:
+            print(f"Error adding users: {e}")
+            exit(1)
+        save_progress_data(progress_data)
+        urls = {user_id: user_val["url"] for user_id, user_val in new_users.items()}
+
+    for url in urls.values():
+        print(f'🧑 {args.server}/{url}')
+
+
+def _export_annotations(args_unknown):
+    """
+    Export annotations of one or more campaigns as a flat segment-level table.
+    """
+    import itertools
+
+    from .results_export import (
+        ANNOTATION_FORMATS,
+        annotation_rows,
+        iter_annotations_csv,
+        write_annotations_arrow,
+    )
+
+    args = argparse.ArgumentParser()
+    args.add_argument(
+        'campaigns', type=str, nargs='*',
+        help='Campaigns to export (exports all if not specified)'
+    )
+    args.add_argument(
+        "-o", "--output", default="annotations.csv",
+        help="Output file, the format is inferred from the extension if not given"
+    )
+    args.add_argument(
+        "--format", choices=list(ANNOTATION_FORMATS.keys()), default=None,
+        help="Output format (csv, parquet or arrow)"
+    )
+    args = args.parse_args(args_unknown)
+
+    progress_data = load_progress_data()
+    campaign_ids = args.campaigns or list(progress_data.keys())
+    for campaign_id in campaign_ids:
+        if campaign_id not in progress_data:
+            print(f"Campaign '{campaign_id}' does not exist.")
+            exit(1)
+
+    export_format = args.format or os.path.splitext(args.output)[1].lstrip(".")
+    if export_format not in ANNOTATION_FORMATS:
+        print(f"Unknown export format '{export_format}', use --format.")
+        exit(1)
+
+    rows = itertools.chain.from_iterable(
+        annotation_rows(campaign_id) for campaign_id in campaign_ids
+    )
+    if export_format == "csv":
+        with open(args.output, "w", newline="") as f:
+            for chunk in iter_annotations_csv(rows):
+                f.write(chunk)
+    else:
+        write_annotations_arrow(rows, args.output, export_format)
+    print(f"Annotations of {len(campaign_ids)} campaign(s) exported to {args.output}")
+
+
 def main():
     """
     Main entry point for the CLI.
     """
     args = argparse.ArgumentParser()
-    args.add_argument('command', type=str, choices=['run', 'add', 'purge'])
+    args.add_argument('command', type=str, choices=['run', 'add', 'users', 'pool', 'purge', 'export'])
     args, args_unknown = args.parse_known_args()
 
+    # export only reads the data so it can run alongside the server
+    if args.command == 'export':
+        _export_annotations(args_unknown)
+        return
+    # adding campaigns and users goes through the running server if there is one
+    if args.command == 'add':
+        _add_campaign(args_unknown)
+        return
+    if args.command == 'users':
+        _add_users(args_unknown)
+        return
+
     # enforce that only one pearmut process is running
     for p in psutil.process_iter():
         if "pearmut" == p.name() and p.pid != os.getpid():
@@ -519,8 +778,8 @@ def main():
 
     if args.command == 'run':
         _run(args_unknown)
-    elif args.command == 'add':
-        _add_campaign(args_unknown)
+    elif args.command == 'pool':
+        _add_pool(args_unknown)
     elif args.command == 'purge':
         import shutil
 
@@ -563,10 +822,11 @@ def main():
                 task_file = f"{ROOT}/data/tasks/{campaign_id}.json"
                 if os.path.exists(task_file):
                     os.remove(task_file)
-                # Remove output file
-                output_file = f"{ROOT}/data/outputs/{campaign_id}.jsonl"
-                if os.path.exists(output_file):
-                    os.remove(output_file)
+                remove_items(f"{ROOT}/data/tasks/{campaign_id}")
+                if os.path.exists(f"{ROOT}/data/tasks/{campaign_id}.priorities.json"):
+                    os.remove(f"{ROOT}/data/tasks/{campaign_id}.priorities.json")
+                # Remove output files
+                remove_db_log(campaign_id)
                 # Remove from progress data
                 progress_data = load_progress_data()
                 if campaign_id in progress_data:
@@ -586,8 +846,12 @@ def main():
                     _unlink_assets(campaign_id)
                 shutil.rmtree(f"{ROOT}/data/tasks", ignore_errors=True)
                 shutil.rmtree(f"{ROOT}/data/outputs", ignore_errors=True)
-                if os.path.exists(f"{ROOT}/data/progress.json"):
-                    os.remove(f"{ROOT}/data/progress.json")
+                shutil.rmtree(f"{ROOT}/data/snapshots", ignore_errors=True)
+                shutil.rmtree(f"{ROOT}/data/pools", ignore_errors=True)
+                shutil.rmtree(f"{ROOT}/data/pending", ignore_errors=True)
+                for data_file in ["progress.json", "tokens.json"]:
+                    if os.path.exists(f"{ROOT}/data/{data_file}"):
+                        os.remove(f"{ROOT}/data/{data_file}")
                 print("All campaign data purged.")
             else:
                 print("Cancelled.")
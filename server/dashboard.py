@@ -0,0 +1,380 @@
+"""
+Per-user rows of the campaign dashboard with server-side filtering, sorting and pagination.
+
+The rows are materialized per campaign together with their JSON serialization.
+Only rows of users marked as dirty (by submissions and resets) are rebuilt on the next read.
+Changed rows and model rankings are also pushed to live dashboards (server-sent events).
+"""
+
+import asyncio
+import json
+import time
+
+from .results_export import compute_model_scores
+from .utils import check_validation_threshold
+
+DASHBOARD_SORT_KEYS = {
+    "user_id": lambda user_id, row: user_id,
+    "progress": lambda user_id, row: row["progress_count"],
+    "time": lambda user_id, row: row["time"],
+    "time_start": lambda user_id, row: row["time_start"] or 0,
+    "time_end": lambda user_id, row: row["time_end"] or 0,
+}
+
+
+def dashboard_row(
+    tasks_data: dict,
+    progress_data: dict,
+    campaign_id: str,
+    user_id: str,
+) -> dict:
+    """
+    Summary of a single user for the dashboard.
+    Progress is summarized as counts, the full progress is only added on request.
+    """
+    user_val = progress_data[campaign_id][user_id]
+    progress = user_val["progress"]
+    progress_count = sum(bool(v) for v in progress)
+
+    validations = [all(v) for v in user_val.get("validations", {}).values()]
+
+    if progress_count == len(progress):
+        # Add threshold pass/fail status (only when user is complete)
+        threshold_passed = check_validation_threshold(
+            tasks_data, progress_data, campaign_id, user_id
+        )
+        status = "completed"
+    else:
+        threshold_passed = None
+        # shared-pool progress is not the user's own, time_start is set by their first submission with actions
+        started = user_val["time_start"] is not None or (
+            progress_count > 0
+            and tasks_data[campaign_id]["info"]["assignment"] == "task-based"
+        )
+        status = "in_progress" if started else "not_started"
+
+    return {
+        "status": status,
+        "progress_count": progress_count,
+        "progress_total": len(progress),
+        "time": user_val["time"],
+        "time_start": user_val["time_start"],
+        "time_end": user_val["time_end"],
+        "validations_passed": sum(validations),
+        "validations_count": len(validations),
+        "threshold_passed": threshold_passed,
+        "url": user_val.get("url"),
+        "token_correct": user_val.get("token_correct"),
+        "token_incorrect": user_val.get("token_incorrect"),
+    }
+
+
+# campaign_id -> materialized rows
+_views = {}
+
+
+def mark_dirty(tasks_data: dict, campaign_id: str, user_id: str | None = None) -> None:
+    """
+    Mark the dashboard row of a user as changed so that it is rebuilt on the next read.
+    In shared-pool campaigns progress is shared so all rows of the campaign are marked.
+    If user_id is None, all rows are marked.
+    """
+    view = _views.get(campaign_id)
+    if view is None:
+        return
+    if user_id is None or tasks_data[campaign_id]["info"]["assignment"] != "task-based":
+        view["dirty_all"] = True
+    else:
+        view["dirty"].add(user_id)
+
+
+def _materialized_rows(tasks_data: dict, progress_data: dict, campaign_id: str) -> dict:
+    """
+    Returns user_id -> (row, privileged JSON, public JSON) with all dirty rows rebuilt.
+    """
+    view = _views.get(campaign_id)
+    if view is None or view["progress"] is not progress_data[campaign_id]:
+        view = {
+            "progress": progress_data[campaign_id],
+            "rows": {},
+            "dirty": set(),
+            "dirty_all": True,
+        }
+        _views[campaign_id] = view
+
+    rows = view["rows"]
+    if view["dirty_all"]:
+        to_build = list(progress_data[campaign_id].keys())
+        rows.clear()
+    else:
+        # also users that were added since the last read
+        to_build = view["dirty"] | (progress_data[campaign_id].keys() - rows.keys())
+    for user_id in to_build:
+        row = dashboard_row(tasks_data, progress_data, campaign_id, user_id)
+        rows[user_id] = (
+            row,
+            json.dumps(row),
+            json.dumps(row | {"token_correct": None, "token_incorrect": None}),
+        )
+    view["dirty"] = set()
+    view["dirty_all"] = False
+    return rows
+
+
+def _select_rows(
+    tasks_data: dict,
+    progress_data: dict,
+    campaign_id: str,
+    offset: int = 0,
+    limit: int | None = None,
+    sort_by: str = "user_id",
+    sort_desc: bool = False,
+    status: list[str] | None = None,
+    validation: str | None = None,
+    active_since: float | None = None,
+    active_before: float | None = None,
+) -> tuple[list, int]:
+    """
+    Filter, sort and paginate the materialized rows.
+
+    Returns:
+        (user_id, (row, privileged JSON, public JSON)) of the page and the number of matching users.
+    """
+    if sort_by not in DASHBOARD_SORT_KEYS:
+        raise ValueError(f"Unknown sort key {sort_by}")
+    threshold_filter = {"passed": True, "failed": False, "pending": None}
+    if validation is not None and validation not in threshold_filter:
+        raise ValueError(f"Unknown validation filter {validation}")
+
+    selected = []
+    for user_id, materialized in _materialized_rows(
+        tasks_data, progress_data, campaign_id
+    ).items():
+        row = materialized[0]
+        if status is not None and row["status"] not in status:
+            continue
+        if validation is not None and row["threshold_passed"] != threshold_filter[validation]:
+            continue
+        if active_since is not None and (row["time_end"] or 0) < active_since:
+            continue
+        if active_before is not None and (row["time_end"] or 0) >= active_before:
+            continue
+        selected.append((user_id, materialized))
+
+    selected.sort(
+        key=lambda x: DASHBOARD_SORT_KEYS[sort_by](x[0], x[1][0]), reverse=sort_desc
+    )
+    total = len(selected)
+    selected = selected[offset:] if limit is None else selected[offset:offset + limit]
+    return selected, total
+
+
+def _progress_list(progress_data: dict, campaign_id: str, user_id: str) -> list:
+    progress = progress_data[campaign_id][user_id]["progress"]
+    if progress and isinstance(progress[0], set):
+        progress = [list(s) for s in progress]
+    return progress
+
+
+def query_dashboard(
+    tasks_data: dict,
+    progress_data: dict,
+    campaign_id: str,
+    is_privileged: bool,
+    include_progress: bool = False,
+    **query,
+) -> tuple[dict, int]:
+    """
+    Filter, sort and paginate the dashboard rows of a campaign.
+
+    Args:
+        offset/limit: page of users to return, all users if limit is None
+        sort_by/sort_desc: one of DASHBOARD_SORT_KEYS and the direction
+        status: keep only users with one of these statuses (not_started, in_progress, completed)
+        validation: keep only users whose validation threshold is "passed", "failed" or "pending"
+        active_since/active_before: keep only users whose last activity is in this range
+        include_progress: add the full per-item progress of each user
+
+    Returns:
+        Rows of the requested page as a dict keyed by user_id and the number of matching users.
+    """
+    selected, total = _select_rows(tasks_data, progress_data, campaign_id, **query)
+
+    page = {}
+    for user_id, (row, _, _) in selected:
+        # shallow copy
+        row = dict(row)
+        if not is_privileged:
+            row["token_correct"] = None
+            row["token_incorrect"] = None
+        if include_progress:
+            row["progress"] = _progress_list(progress_data, campaign_id, user_id)
+        page[user_id] = row
+    return page, total
+
+
+def query_dashboard_json(
+    tasks_data: dict,
+    progress_data: dict,
+    campaign_id: str,
+    is_privileged: bool,
+    include_progress: bool = False,
+    **query,
+) -> str:
+    """
+    Same as query_dashboard but returns the whole response body assembled from the
+    pre-serialized rows.
+    """
+    selected, total = _select_rows(tasks_data, progress_data, campaign_id, **query)
+
+    rows_json = []
+    for user_id, (_, row_privileged, row_public) in selected:
+        row_json = row_privileged if is_privileged else row_public
+        if include_progress:
+            progress = _progress_list(progress_data, campaign_id, user_id)
+            row_json = f'{row_json[:-1]}, "progress": {json.dumps(progress)}}}'
+        rows_json.append(f"{json.dumps(user_id)}: {row_json}")
+
+    validation_threshold = tasks_data[campaign_id]["info"].get("validation_threshold")
+    return (
+        f'{{"data": {{{", ".join(rows_json)}}}, "total": {total}, '
+        f'"validation_threshold": {json.dumps(validation_threshold)}}}'
+    )
+
+
+# campaign_id -> {queue: is_privileged} of connected live dashboards,
+# a dashboard showing several campaigns uses one queue for all of them
+_subscribers = {}
+# campaign_id -> last published model ranking
+_rankings = {}
+# maximum number of unsent events before a slow subscriber is dropped
+SUBSCRIBER_QUEUE_SIZE = 1000
+# minimum time between two ranking computations of a campaign, in seconds
+RANKING_INTERVAL = 5
+# campaign_id -> task publishing the ranking, time of the last computation
+_ranking_tasks = {}
+_ranking_times = {}
+# campaigns with submissions since their pending ranking computation started
+_ranking_stale = set()
+
+
+def subscribe(
+    campaign_id: str,
+    is_privileged: bool,
+    queue: asyncio.Queue | None = None,
+) -> asyncio.Queue:
+    """
+    Register a live dashboard, or add a campaign to the queue of one. Events are put
+    into the returned queue as (campaign_id, event name, JSON data) tuples, and None
+    if the subscriber was dropped.
+    """
+    if queue is None:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    _subscribers.setdefault(campaign_id, {})[queue] = is_privileged
+    return queue
+
+
+def unsubscribe(campaign_id: str, queue: asyncio.Queue) -> None:
+    _subscribers.get(campaign_id, {}).pop(queue, None)
+
+
+def _publish(campaign_id: str, event: str, data_privileged: str, data_public: str | None) -> None:
+    """Send an event to all subscribers, data_public None means privileged only."""
+    for queue, is_privileged in list(_subscribers.get(campaign_id, {}).items()):
+        data = data_privileged if is_privileged else data_public
+        if data is None:
+            continue
+        try:
+            queue.put_nowait((campaign_id, event, data))
+        except asyncio.QueueFull:
+            # the client is not keeping up, it reconnects and reloads all its campaigns
+            for subscribers in _subscribers.values():
+                subscribers.pop(queue, None)
+            queue.get_nowait()
+            queue.put_nowait(None)
+
+
+def publish_changes(
+    tasks_data: dict,
+    progress_data: dict,
+    campaign_id: str,
+    user_id: str,
+) -> None:
+    """
+    Push the changed dashboard rows after a submission or reset of a user to live dashboards.
+    In shared-pool campaigns the shared progress is sent once instead of every row,
+    unless the pool was just completed, which changes the status of all users.
+    """
+    if not _subscribers.get(campaign_id):
+        return
+
+    rows = _materialized_rows(tasks_data, progress_data, campaign_id)
+    user_ids = [user_id]
+    if tasks_data[campaign_id]["info"]["assignment"] != "task-based":
+        row = rows[user_id][0]
+        if row["progress_count"] == row["progress_total"]:
+            user_ids = list(rows.keys())
+        else:
+            progress = json.dumps({
+                "progress_count": row["progress_count"],
+                "progress_total": row["progress_total"],
+            })
+            _publish(campaign_id, "progress", progress, progress)
+
+    for uid in user_ids:
+        _, row_privileged, row_public = rows[uid]
+        _publish(
+            campaign_id,
+            "user",
+            f'{{"user_id": {json.dumps(uid)}, "row": {row_privileged}}}',
+            f'{{"user_id": {json.dumps(uid)}, "row": {row_public}}}',
+        )
+
+
+def _publish_ranking(campaign_id: str, ranking: str) -> None:
+    if _rankings.get(campaign_id) != ranking:
+        _rankings[campaign_id] = ranking
+        _publish(campaign_id, "ranking", ranking, None)
+
+
+def publish_ranking(campaign_id: str) -> None:
+    """
+    Push the model ranking to privileged live dashboards if it changed.
+    """
+    if not any(_subscribers.get(campaign_id, {}).values()):
+        return
+    _publish_ranking(campaign_id, json.dumps(compute_model_scores(campaign_id)))
+
+
+async def _publish_ranking_throttled(campaign_id: str) -> None:
+    while True:
+        delay = _ranking_times.get(campaign_id, 0) + RANKING_INTERVAL - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if not any(_subscribers.get(campaign_id, {}).values()):
+            return
+        _ranking_stale.discard(campaign_id)
+        _ranking_times[campaign_id] = time.monotonic()
+        ranking = await asyncio.to_thread(
+            lambda: json.dumps(compute_model_scores(campaign_id))
+        )
+        _publish_ranking(campaign_id, ranking)
+        if campaign_id not in _ranking_stale:
+            return
+
+
+def schedule_ranking(campaign_id: str) -> None:
+    """
+    Push the model ranking to privileged live dashboards after a submission.
+    The ranking is computed in a worker thread at most once per RANKING_INTERVAL,
+    submissions in the meantime are included in the next computation.
+    Must be called from the event loop.
+    """
+    if not any(_subscribers.get(campaign_id, {}).values()):
+        return
+    _ranking_stale.add(campaign_id)
+    task = _ranking_tasks.get(campaign_id)
+    if task is None or task.done():
+        _ranking_tasks[campaign_id] = asyncio.ensure_future(
+            _publish_ranking_throttled(campaign_id)
+        )
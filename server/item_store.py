@@ -0,0 +1,168 @@
+"""
+Random-access storage of campaign items.
+
+`pearmut add` writes the items of a campaign as one JSON line per item
+(data/tasks/{campaign_id}.items.jsonl) together with the byte offsets of all
+lines (data/tasks/{campaign_id}.items.idx, native uint64). The campaign JSON
+then only keeps the item ranges, so that loading a campaign is cheap and
+single items are read from the memory-mapped file when they are served.
+
+Items are content-addressed: identical items (e.g. shared tasks or tutorials
+prefixed to every task) are written once and referenced by their position in
+data/tasks/{campaign_id}.items.refs (native uint64).
+"""
+
+import array
+import collections
+import collections.abc
+import hashlib
+import json
+import mmap
+import os
+
+
+class ItemSequence(collections.abc.Sequence):
+    """
+    Read-only list of items [start, stop) of a memory-mapped item file.
+    Items are parsed on every access.
+    """
+
+    def __init__(self, store: "ItemStore", start: int, stop: int):
+        self._store = store
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, item_i):
+        if isinstance(item_i, slice):
+            return [self[i] for i in range(*item_i.indices(len(self)))]
+        if item_i < 0:
+            item_i += len(self)
+        if item_i < 0 or item_i >= len(self):
+            raise IndexError("item index out of range")
+        return self._store.read(self._start + item_i)
+
+
+class ItemStore:
+    """
+    Memory-mapped item file with its offset index and item references.
+    Items referenced more than once are parsed once and shared, so they must not be modified.
+    """
+
+    def __init__(self, path_prefix: str):
+        with open(f"{path_prefix}.items.idx", "rb") as f:
+            self._offsets = array.array("Q")
+            self._offsets.frombytes(f.read())
+        # stores written before deduplication have no references
+        self._refs = None
+        self._shared = {}
+        if os.path.exists(f"{path_prefix}.items.refs"):
+            with open(f"{path_prefix}.items.refs", "rb") as f:
+                self._refs = array.array("Q")
+                self._refs.frombytes(f.read())
+            self._shared = {
+                ref: None for ref, count in collections.Counter(self._refs).items()
+                if count > 1
+            }
+        with open(f"{path_prefix}.items.jsonl", "rb") as f:
+            # empty files can not be mapped
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._offsets[-1] else b""
+
+    def read(self, i: int):
+        ref = i if self._refs is None else self._refs[i]
+        if ref in self._shared:
+            if self._shared[ref] is None:
+                self._shared[ref] = json.loads(self._mm[self._offsets[ref]:self._offsets[ref + 1]])
+            return self._shared[ref]
+        return json.loads(self._mm[self._offsets[ref]:self._offsets[ref + 1]])
+
+
+def write_items(path_prefix: str, campaign_data: dict) -> dict:
+    """
+    Write the items of a campaign to the random-access files.
+
+    Returns:
+        Campaign data without items, "items" has the item ranges
+        (per user for task-based campaigns).
+    """
+    data = campaign_data["data"]
+    offsets = array.array("Q", [0])
+    refs = array.array("Q")
+    # content hash -> position of the stored item
+    stored = {}
+    # written to temporary files and replaced, a running server may have the old files mapped
+    with open(f"{path_prefix}.items.jsonl.tmp", "wb") as f:
+        def _write(items):
+            start = len(refs)
+            for item in items:
+                line = json.dumps(item, ensure_ascii=False).encode() + b"\n"
+                digest = hashlib.sha256(line).digest()
+                if digest not in stored:
+                    stored[digest] = len(offsets) - 1
+                    f.write(line)
+                    offsets.append(offsets[-1] + len(line))
+                refs.append(stored[digest])
+            return [start, len(refs)]
+
+        if isinstance(data, dict):
+            items = {user_id: _write(user_items) for user_id, user_items in data.items()}
+        else:
+            items = _write(data)
+    with open(f"{path_prefix}.items.idx.tmp", "wb") as f:
+        f.write(offsets.tobytes())
+    with open(f"{path_prefix}.items.refs.tmp", "wb") as f:
+        f.write(refs.tobytes())
+    for suffix in [".items.jsonl", ".items.idx", ".items.refs"]:
+        os.replace(f"{path_prefix}{suffix}.tmp", f"{path_prefix}{suffix}")
+
+    campaign_meta = {k: v for k, v in campaign_data.items() if k != "data"}
+    campaign_meta["items"] = items
+    return campaign_meta
+
+
+def load_campaign(path_prefix: str) -> dict:
+    """
+    Load a campaign JSON. If its items are in the random-access files, "data" is
+    replaced by sequences reading from them, otherwise identical items of the
+    inline data are loaded as a single object.
+    """
+    with open(f"{path_prefix}.json", "r") as f:
+        campaign_data = json.load(f)
+    if "items" not in campaign_data:
+        if "data" in campaign_data:
+            campaign_data["data"] = _dedup_items(campaign_data["data"])
+        return campaign_data
+
+    store = ItemStore(path_prefix)
+    items = campaign_data.pop("items")
+    if isinstance(items, dict):
+        campaign_data["data"] = {
+            user_id: ItemSequence(store, start, stop)
+            for user_id, (start, stop) in items.items()
+        }
+    else:
+        campaign_data["data"] = ItemSequence(store, *items)
+    return campaign_data
+
+
+def _dedup_items(data):
+    """Replace identical items (of all users) by the same object."""
+    stored = {}
+
+    def _dedup(items):
+        return [
+            stored.setdefault(json.dumps(item, ensure_ascii=False), item)
+            for item in items
+        ]
+
+    if isinstance(data, dict):
+        return {user_id: _dedup(user_items) for user_id, user_items in data.items()}
+    return _dedup(data)
+
+
+def remove_items(path_prefix: str) -> None:
+    for suffix in [".items.jsonl", ".items.idx", ".items.refs"]:
+        if os.path.exists(f"{path_prefix}{suffix}"):
+            os.remove(f"{path_prefix}{suffix}")
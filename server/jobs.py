@@ -0,0 +1,188 @@
+"""
+Background jobs for expensive analytics and exports.
+
+Jobs run in a small process pool so that they never occupy the event loop of the
+server. Each job gets an id which can be used to poll its status, fetch the result
+or cancel it. Finished jobs are kept for JOB_RETENTION seconds.
+"""
+
+import concurrent.futures
+import multiprocessing
+import secrets
+import time
+
+from .results_export import (
+    EXPORT_FORMATS,
+    cache_export,
+    compute_model_scores,
+    export_digest,
+    get_cached_export,
+    render_export,
+)
+from .utils import campaign_caches, read_db_log
+
+# number of worker processes
+JOB_WORKERS = 2
+# maximum number of jobs that are queued or running at the same time
+JOB_MAX_PENDING = 16
+# how long to keep finished jobs and their results, in seconds
+JOB_RETENTION = 60 * 60
+
+
+def _drop_caches(campaign_ids: list[str]) -> None:
+    """
+    Workers outlive jobs and do not see appends to logs they parsed before,
+    so the logs and derived state are read again for every job.
+    """
+    for campaign_id in campaign_ids:
+        for cache in campaign_caches:
+            cache.pop(campaign_id, None)
+
+
+def _job_export_results(results: list[dict], campaign_id: str, format: str):
+    # the results are computed by the server process, see _start_export_job
+    return render_export(results, campaign_id, format)
+
+
+def _job_model_scores(campaign_ids: list[str], format: str):
+    _drop_caches(campaign_ids)
+    return {
+        campaign_id: compute_model_scores(campaign_id)
+        for campaign_id in campaign_ids
+    }
+
+
+def _job_download_annotations(campaign_ids: list[str], format: str):
+    return {campaign_id: read_db_log(campaign_id) for campaign_id in campaign_ids}
+
+
+# kind -> (function executed in the worker, whether campaign tokens are required)
+JOB_KINDS = {
+    "export-results": (_job_export_results, True),
+    "model-scores": (_job_model_scores, True),
+    "download-annotations": (_job_download_annotations, False),
+}
+
+_executor = None
+_jobs = {}
+
+
+def _get_executor() -> concurrent.futures.ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn instead of fork because the server process runs threads
+        _executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=JOB_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def _prune_jobs() -> None:
+    """Forget finished jobs older than the retention period."""
+    now = time.time()
+    for job_id in [
+        job_id for job_id, job in _jobs.items()
+        if job["finished"] is not None and now - job["finished"] > JOB_RETENTION
+    ]:
+        del _jobs[job_id]
+
+
+def _start_export_job(campaign_id: str, format: str) -> concurrent.futures.Future:
+    """
+    Exports share the export cache of the server process with /export-results: the
+    results are computed there, cached renders are reused without a worker and
+    rendered exports are stored once the job finishes.
+    """
+    results = compute_model_scores(campaign_id)
+    digest = export_digest(results, campaign_id, format)
+    content = get_cached_export(digest)
+    if content is not None:
+        future = concurrent.futures.Future()
+        future.set_result(content)
+        return future
+
+    def _on_rendered(future):
+        if not future.cancelled() and future.exception() is None:
+            cache_export(digest, future.result())
+
+    future = _get_executor().submit(_job_export_results, results, campaign_id, format)
+    future.add_done_callback(_on_rendered)
+    return future
+
+
+def start_job(kind: str, campaign_ids: list[str], format: str | None = None) -> str:
+    """
+    Submit a job to the process pool.
+
+    Returns:
+        The job id.
+
+    Raises:
+        ValueError: If the job kind or format is unknown or too many jobs are pending.
+    """
+    _prune_jobs()
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind {kind}")
+    if kind == "export-results" and (format not in EXPORT_FORMATS or len(campaign_ids) != 1):
+        raise ValueError("Export job requires a single campaign and a valid format")
+    if sum(job["finished"] is None for job in _jobs.values()) >= JOB_MAX_PENDING:
+        raise ValueError("Too many pending jobs, try again later")
+
+    job_id = secrets.token_hex(8)
+    job = {
+        "kind": kind,
+        "campaign_ids": campaign_ids,
+        "format": format,
+        "created": time.time(),
+        "finished": None,
+    }
+
+    def _on_done(_future):
+        job["finished"] = time.time()
+
+    if kind == "export-results":
+        job["future"] = _start_export_job(campaign_ids[0], format)
+    else:
+        job["future"] = _get_executor().submit(JOB_KINDS[kind][0], campaign_ids, format)
+    job["future"].add_done_callback(_on_done)
+    _jobs[job_id] = job
+    return job_id
+
+
+def get_job(job_id: str) -> dict | None:
+    """Returns the job with the given id or None if it does not exist (anymore)."""
+    _prune_jobs()
+    return _jobs.get(job_id)
+
+
+def job_status(job: dict) -> dict:
+    """Returns a JSON-serializable description of the job."""
+    future = job["future"]
+    if future.cancelled():
+        status = "cancelled"
+    elif future.done():
+        status = "failed" if future.exception() is not None else "done"
+    elif future.running():
+        status = "running"
+    else:
+        status = "pending"
+
+    return {
+        "kind": job["kind"],
+        "campaign_ids": job["campaign_ids"],
+        "status": status,
+        "created": job["created"],
+        "finished": job["finished"],
+    } | ({"error": str(future.exception())} if status == "failed" else {})
+
+
+def cancel_job(job_id: str) -> bool:
+    """
+    Cancel a job. Only jobs that did not start running yet can be cancelled.
+    Returns True if the job was cancelled.
+    """
+    job = get_job(job_id)
+    if job is None:
+        return False
+    return job["future"].cancel()
@@ -1,74 +1,229 @@
 import collections
+import concurrent.futures
+import csv
+import hashlib
+import io
+import itertools
 import json
 import os
-import statistics
+import threading
 
-from .utils import get_db_log
+from .utils import (
+    RESET_MARKER,
+    campaign_caches,
+    get_db_log,
+    iter_db_log,
+    snapshot_hooks,
+)
 
 
-def comparison_significant(
-    scores1: dict[str, float], scores2: dict[str, float]
-) -> bool:
-    """Check if the difference between two sets of scores is statistically significant.
-    Assume scores1 > scores2.
+def pairwise_significance(matrix):
     """
+    One-sided paired t-tests between all pairs of models in a single pass.
 
+    Args:
+        matrix: models x items NumPy array of scores, NaN where a model was not annotated
+
+    Returns:
+        models x models array of p-values, where entry [i, j] tests whether model i
+        is better than model j on their common items. NaN if there are fewer than
+        two common items.
+    """
+    import numpy as np
     import scipy.stats
 
-    # compute intersection
-    common_items = set(scores1.keys()).intersection(set(scores2.keys()))
-    scores1 = [scores1[k] for k in common_items]
-    scores2 = [scores2[k] for k in common_items]
+    valid = ~np.isnan(matrix)
+    mask = valid.astype(np.float64)
+    scores = np.where(valid, matrix, 0.0)
+    scores_sq = scores**2
 
-    return bool(
-        scipy.stats.ttest_rel(scores1, scores2, alternative="greater").pvalue < 0.05
-    )
+    # all sums over common items expressed as matrix products
+    count = mask @ mask.T
+    diff_sum = scores @ mask.T - mask @ scores.T
+    diff_sq_sum = scores_sq @ mask.T + mask @ scores_sq.T - 2 * scores @ scores.T
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = diff_sum / count
+        var = np.maximum(diff_sq_sum - diff_sum * mean, 0.0) / (count - 1)
+        statistic = mean / np.sqrt(var / count)
+        pvalues = scipy.stats.t.sf(statistic, df=count - 1)
+    pvalues[count < 2] = np.nan
+    return pvalues
 
 
-def compute_model_scores(campaign_id):
+def bootstrap_ci(matrix, resamples=1000, confidence=0.95, seed=0):
     """
-    Compute model scores from annotations for a campaign.
+    Bootstrap confidence intervals of the mean score of each model.
+
+    Args:
+        matrix: models x items NumPy array of scores, NaN where a model was not annotated
+        resamples: number of bootstrap resamples
+        confidence: width of the confidence interval
 
     Returns:
-        List of dicts with keys: model, score, count
-        Sorted by score in descending order
+        models x 2 array with the lower and upper bound for each model
     """
-    # Compute model scores from annotations
-    model_scores = collections.defaultdict(dict)
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    alpha = (1 - confidence) / 2
+    intervals = np.full((matrix.shape[0], 2), np.nan)
+    for model_i, row in enumerate(matrix):
+        scores = row[~np.isnan(row)]
+        if len(scores) == 0:
+            continue
+        means = []
+        # resample in chunks to bound memory for campaigns with many items
+        chunk = max(1, 2**22 // len(scores))
+        for start in range(0, resamples, chunk):
+            size = min(chunk, resamples - start)
+            sample = rng.integers(0, len(scores), size=(size, len(scores)))
+            means.append(scores[sample].mean(axis=1))
+        intervals[model_i] = np.quantile(np.concatenate(means), [alpha, 1 - alpha])
+    return intervals
+
+
+# campaign_id -> cached score matrix and the part of the log it covers
+_score_matrices = {}
+campaign_caches.append(_score_matrices)
+# campaign_id -> lock for updating and copying the cached score matrix, which happens
+# both in worker threads and on the event loop; kept when the campaign is evicted
+_score_matrix_locks = {}
+
+
+def _score_matrix_lock(campaign_id):
+    return _score_matrix_locks.setdefault(campaign_id, threading.Lock())
+
+
+def _dump_score_matrix(campaign_id, log):
+    with _score_matrix_lock(campaign_id):
+        cache = _score_matrices.get(campaign_id)
+        if cache is None or cache["log"] is not log:
+            return None
+        # items and scores are updated in place and copied, the matrices are replaced
+        return {
+            "processed": cache["processed"],
+            "items": dict(cache["items"]),
+            "scores": {model: dict(scores) for model, scores in cache["scores"].items()},
+            "models": list(cache["models"]),
+            "matrix": cache["matrix"],
+            "pvalues": cache["pvalues"],
+        }
+
+
+def _load_score_matrix(campaign_id, state, log):
+    with _score_matrix_lock(campaign_id):
+        _score_matrices[campaign_id] = state | {
+            "log": log,
+            "scores": collections.defaultdict(dict, state["scores"]),
+        }
+
+
+snapshot_hooks["score_matrix"] = (_dump_score_matrix, _load_score_matrix)
 
-    # Iterate through all tasks to find items with 'models' field (basic template)
+
+def get_score_matrix(campaign_id):
+    """
+    Returns the models x items score matrix for a campaign together with the model names
+    and the pairwise significance p-values.
+    The cache is updated incrementally from new log lines and the matrix is rebuilt only
+    when the campaign log changed since the last call.
+    """
     log = get_db_log(campaign_id)
-    for entry in log:
+    with _score_matrix_lock(campaign_id):
+        # a copy, so that the matrix, models and p-values stay consistent with each other
+        return dict(_update_score_matrix(campaign_id, log))
+
+
+def _update_score_matrix(campaign_id, log):
+    import numpy as np
+
+    cache = _score_matrices.get(campaign_id)
+    if cache is None or cache["log"] is not log or cache["processed"] > len(log):
+        cache = {
+            "log": log,
+            "processed": 0,
+            "items": {},
+            "scores": collections.defaultdict(dict),
+            "models": [],
+            "matrix": np.zeros((0, 0)),
+            "pvalues": np.zeros((0, 0)),
+        }
+        _score_matrices[campaign_id] = cache
+
+    # the log may grow while this runs in a worker thread
+    log_len = len(log)
+    if cache["processed"] == log_len:
+        return cache
+
+    for entry in log[cache["processed"]:log_len]:
         if "item" not in entry or "annotation" not in entry:
             continue
         for item, annotation in zip(entry["item"], entry["annotation"]):
+            # TODO: when #111 is done use the unique item_id
+            # item_id = item.get("doc_id", json.dumps(item | {"tgt": None}))
+            item_id = json.dumps(item | {"tgt": None})
+            item_col = cache["items"].setdefault(item_id, len(cache["items"]))
             for model, annotation in annotation.items():
                 if "score" in annotation and annotation["score"] is not None:
-                    # TODO: when #111 is done use the unique item_id
-                    # item_id = item.get("doc_id", json.dumps(item | {"tgt": None}))
-                    model_scores[model][json.dumps(item | {"tgt": None})] = annotation["score"]
+                    cache["scores"][model][item_col] = annotation["score"]
+    cache["processed"] = log_len
 
-    model_scores = list(model_scores.items())
-    model_scores.sort(key=lambda x: statistics.mean(x[1].values()), reverse=True)
+    cache["models"] = list(cache["scores"].keys())
+    matrix = np.full((len(cache["models"]), len(cache["items"])), np.nan)
+    for model_i, model in enumerate(cache["models"]):
+        scores = cache["scores"][model]
+        matrix[model_i, list(scores.keys())] = list(scores.values())
+    cache["matrix"] = matrix
+    cache["pvalues"] = pairwise_significance(matrix)
+    return cache
+
+
+def compute_model_scores(campaign_id, bootstrap=0):
+    """
+    Compute model scores from annotations for a campaign.
+
+    Args:
+        campaign_id: campaign to compute the scores for
+        bootstrap: number of bootstrap resamples for confidence intervals (0 to disable)
+
+    Returns:
+        List of dicts with keys: model, score, count, sig_better_than_next, sig_better_than
+        (and ci if bootstrap is set)
+        Sorted by score in descending order
+    """
+    import numpy as np
+
+    cache = get_score_matrix(campaign_id)
+    matrix = cache["matrix"]
+    significant = cache["pvalues"] < 0.05
+
+    counts = (~np.isnan(matrix)).sum(axis=1)
+    means = np.nansum(matrix, axis=1) / np.maximum(counts, 1)
+    # stable sort to keep the order of first appearance for ties
+    order = sorted(range(len(cache["models"])), key=lambda i: means[i], reverse=True)
+    intervals = bootstrap_ci(matrix, resamples=bootstrap) if bootstrap else None
 
     results = []
-    for i, (model, scores) in enumerate(model_scores):
-        avg_score = statistics.mean(scores.values())
-        sig_better = False
-        if i < len(model_scores) - 1:
+    for rank, model_i in enumerate(order):
+        result = {
+            "model": cache["models"][model_i],
+            "score": float(means[model_i]),
+            "count": int(counts[model_i]),
             # Compare with next model
-            scores_next = model_scores[i + 1][1]
-            sig_better = comparison_significant(scores, scores_next)
-        else:
-            sig_better = False
-        results.append(
-            {
-                "model": model,
-                "score": avg_score,
-                "count": len(scores),
-                "sig_better_than_next": sig_better,
-            }
-        )
+            "sig_better_than_next": (
+                bool(significant[model_i, order[rank + 1]])
+                if rank < len(order) - 1 else False
+            ),
+            "sig_better_than": [
+                cache["models"][other_i]
+                for other_i in order
+                if significant[model_i, other_i]
+            ],
+        }
+        if intervals is not None:
+            result["ci"] = [float(x) for x in intervals[model_i]]
+        results.append(result)
     return results
 
 
@@ -206,3 +361,252 @@ def generate_pdf(results, campaign_id):
     finally:
         # Clean up
         os.unlink(typst_file)
+
+
+EXPORT_FORMATS = {
+    "typst": "text/plain",
+    "latex": "text/plain",
+    "pdf": "application/pdf",
+}
+
+# digest of results and format -> rendered export, least recently used first
+_export_cache = collections.OrderedDict()
+EXPORT_CACHE_SIZE = 128
+# digest -> future of an export that is being rendered, so that it is rendered once
+_export_renders = {}
+# guards both, they are used from the event loop and from worker threads
+_export_cache_lock = threading.Lock()
+
+
+def export_digest(results, campaign_id, format):
+    """
+    Digest identifying a rendered export of the given results.
+    """
+    return hashlib.sha256(
+        json.dumps([campaign_id, format, results], sort_keys=True).encode()
+    ).hexdigest()
+
+
+def get_cached_export(digest):
+    """
+    Returns the cached rendered export or None if it was not rendered yet.
+    """
+    with _export_cache_lock:
+        if digest not in _export_cache:
+            return None
+        _export_cache.move_to_end(digest)
+        return _export_cache[digest]
+
+
+def render_export(results, campaign_id, format, digest=None):
+    """
+    Render results in the given export format and store them in the export cache.
+    Rendering a PDF is slow so this should not be called from the event loop.
+    Concurrent calls for the same export wait for a single render.
+
+    Returns:
+        str for typst and latex, bytes for pdf
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {format}")
+    if digest is None:
+        digest = export_digest(results, campaign_id, format)
+
+    with _export_cache_lock:
+        if digest in _export_cache:
+            _export_cache.move_to_end(digest)
+            return _export_cache[digest]
+        render = _export_renders.get(digest)
+        if render is None:
+            render = _export_renders[digest] = concurrent.futures.Future()
+            rendering = True
+        else:
+            rendering = False
+    if not rendering:
+        return render.result()
+
+    try:
+        if format == "typst":
+            content = generate_typst_table(results)
+        elif format == "latex":
+            content = generate_latex_table(results)
+        else:
+            content = generate_pdf(results, campaign_id)
+    except Exception as e:
+        with _export_cache_lock:
+            _export_renders.pop(digest, None)
+        render.set_exception(e)
+        raise
+    # cached before it stops being in flight, so that later calls find it
+    cache_export(digest, content)
+    with _export_cache_lock:
+        _export_renders.pop(digest, None)
+    render.set_result(content)
+    return content
+
+
+def cache_export(digest, content):
+    """
+    Store a rendered export in the export cache, evicting the least recently used ones.
+    """
+    with _export_cache_lock:
+        _export_cache[digest] = content
+        _export_cache.move_to_end(digest)
+        while len(_export_cache) > EXPORT_CACHE_SIZE:
+            _export_cache.popitem(last=False)
+
+
+# column name -> type of the flat segment-level annotation table
+ANNOTATION_COLUMNS = {
+    "campaign_id": "string",
+    "user_id": "string",
+    "item_i": "int",
+    "segment_i": "int",
+    "doc_id": "string",
+    "model": "string",
+    "score": "float",
+    "error_spans": "int",
+    "error_spans_minor": "int",
+    "error_spans_major": "int",
+    "time": "float",
+    "time_start": "float",
+    "time_end": "float",
+}
+
+ANNOTATION_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+
+def annotation_rows(campaign_id):
+    """
+    Stream the annotations of a campaign as rows of a flat table with ANNOTATION_COLUMNS.
+    There is one row per annotation line, segment and model. The segments are joined
+    with the items that were shown to the annotator, which are stored in the log.
+    Annotations masked by a later reset of the (user, item) or of the shared item are skipped.
+    """
+    # position of the last reset marker per (user_id, item_i), user_id None for shared resets
+    last_reset = {}
+    for entry_i, entry in enumerate(iter_db_log(campaign_id)):
+        if entry.get("annotation") == RESET_MARKER:
+            last_reset[(entry.get("user_id"), entry.get("item_i"))] = entry_i
+
+    for entry_i, entry in enumerate(iter_db_log(campaign_id)):
+        annotation = entry.get("annotation")
+        # skips reset markers
+        if not isinstance(annotation, list):
+            continue
+        item_i = entry.get("item_i")
+        if (
+            last_reset.get((entry.get("user_id"), item_i), -1) > entry_i
+            or last_reset.get((None, item_i), -1) > entry_i
+        ):
+            continue
+
+        # item-level timing, computed the same way as the time in progress
+        times = [action["time"] for action in entry.get("actions", []) if "time" in action]
+        if times:
+            time_spent = sum(min(b - a, 60) for a, b in zip(times, times[1:]))
+            time_start, time_end = min(times), max(times)
+        else:
+            time_spent = time_start = time_end = None
+
+        items = entry.get("item") or []
+        for segment_i, segment in enumerate(annotation):
+            if not isinstance(segment, dict):
+                continue
+            item = items[segment_i] if segment_i < len(items) else None
+            doc_id = item.get("doc_id") if isinstance(item, dict) else None
+            for model, model_annotation in segment.items():
+                if not isinstance(model_annotation, dict):
+                    continue
+                error_spans = model_annotation.get("error_spans") or []
+                severities = [
+                    span.get("severity") for span in error_spans if isinstance(span, dict)
+                ]
+                yield (
+                    campaign_id,
+                    entry.get("user_id"),
+                    entry.get("item_i"),
+                    segment_i,
+                    doc_id,
+                    model,
+                    model_annotation.get("score"),
+                    len(error_spans),
+                    severities.count("minor"),
+                    severities.count("major"),
+                    time_spent,
+                    time_start,
+                    time_end,
+                )
+
+
+def iter_annotations_csv(rows, chunk_size=10_000):
+    """
+    Serialize annotation rows as CSV, yielding chunks of text so that the output can be
+    streamed to a file or an HTTP response.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ANNOTATION_COLUMNS.keys())
+    rows = iter(rows)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_annotations_arrow(rows, sink, format, batch_size=65_536):
+    """
+    Write annotation rows as a Parquet or Arrow IPC file in record batches.
+    Requires pyarrow.
+
+    Args:
+        rows: iterable of rows with ANNOTATION_COLUMNS
+        sink: path or writable (binary) file-like object
+        format: "parquet" or "arrow"
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(
+            "Exporting to Parquet or Arrow requires pyarrow. "
+            "Install it with `pip install pearmut[export]`."
+        )
+
+    pa_types = {"string": pa.string(), "int": pa.int64(), "float": pa.float64()}
+    schema = pa.schema([
+        (column, pa_types[column_type])
+        for column, column_type in ANNOTATION_COLUMNS.items()
+    ])
+
+    if format == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    elif format == "arrow":
+        writer = pa.ipc.new_file(sink, schema)
+    else:
+        raise ValueError(f"Unknown annotation format {format}")
+
+    rows = iter(rows)
+    with writer:
+        while chunk := list(itertools.islice(rows, batch_size)):
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(zip(*chunk), schema)],
+                schema=schema,
+            ))
+
+
+def annotations_to_bytes(rows, format):
+    """
+    Serialize annotation rows in the given ANNOTATION_FORMATS format.
+    """
+    if format == "csv":
+        return "".join(iter_annotations_csv(rows)).encode()
+    buffer = io.BytesIO()
+    write_annotations_arrow(rows, buffer, format)
+    return buffer.getvalue()
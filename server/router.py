@@ -0,0 +1,154 @@
+"""
+Routing of annotators across the campaigns of a pool.
+
+A pool (data/pools/{pool_id}.json, added with `pearmut pool`) lists campaigns with
+their language pair and annotators with the language pairs they can annotate:
+
+    {
+        "pool_id": "wmt",
+        "campaigns": {"wmt_ende": "en-de", "wmt_encs": "en-cs"},
+        "annotators": {"alice": ["en-de", "en-cs"], "bob": ["en-cs"]}
+    }
+
+Annotators are sent back to the unfinished campaign user they already hold, otherwise
+they claim a free user of the eligible campaign with the most outstanding work.
+Claims are stored in the user progress ("annotator" and "pool").
+The remaining work of each campaign is kept in memory and recomputed after submissions and resets.
+"""
+
+import json
+import os
+
+from .utils import ROOT
+
+# pool_id -> pool definition
+_pools = {}
+# campaign_id -> {"remaining": outstanding items, "free": unclaimed users, "claims": annotator -> user}
+# kept for evicted campaigns too, so that routing does not load every campaign of a pool
+_work_remaining = {}
+
+
+def load_pool(pool_id: str) -> dict | None:
+    """Pool definition or None if there is no such pool."""
+    # pool IDs are file names
+    if "/" in pool_id or "\\" in pool_id or pool_id in ["", ".", ".."]:
+        return None
+    if pool_id not in _pools:
+        pool_file = f"{ROOT}/data/pools/{pool_id}.json"
+        if not os.path.exists(pool_file):
+            return None
+        with open(pool_file, "r") as f:
+            _pools[pool_id] = json.load(f)
+    return _pools[pool_id]
+
+
+def save_pool(pool: dict) -> None:
+    os.makedirs(f"{ROOT}/data/pools", exist_ok=True)
+    with open(f"{ROOT}/data/pools/{pool['pool_id']}.json", "w") as f:
+        json.dump(pool, f, indent=2, ensure_ascii=False)
+    _pools.pop(pool["pool_id"], None)
+
+
+def invalidate_work(campaign_id: str) -> None:
+    """Recompute the remaining work of a campaign on the next routing."""
+    _work_remaining.pop(campaign_id, None)
+
+
+def _is_free(user_val: dict) -> bool:
+    return "annotator" not in user_val and user_val["time_start"] is None
+
+
+def _eligible_campaigns(pool: dict, annotator_id: str, progress_data: dict) -> list[str]:
+    language_pairs = pool["annotators"].get(annotator_id, [])
+    return [
+        campaign_id for campaign_id, language_pair in pool["campaigns"].items()
+        if language_pair in language_pairs and campaign_id in progress_data
+    ]
+
+
+def unrouted_campaigns(pool: dict, annotator_id: str, progress_data: dict) -> list[str]:
+    """
+    Campaigns of the pool the annotator is eligible for whose remaining work is not known yet.
+    They have to be loaded and passed to compute_work before routing.
+    """
+    return [
+        campaign_id for campaign_id in _eligible_campaigns(pool, annotator_id, progress_data)
+        if campaign_id not in _work_remaining
+    ]
+
+
+def compute_work(tasks_data: dict, progress_data: dict, campaign_id: str) -> dict:
+    """Remaining work of a campaign, computed from the loaded campaign if it is not known yet."""
+    entry = _work_remaining.get(campaign_id)
+    if entry is not None:
+        return entry
+
+    campaign_progress = progress_data[campaign_id]
+    free = [
+        user_id for user_id, user_val in campaign_progress.items()
+        if _is_free(user_val)
+    ]
+    task_based = tasks_data[campaign_id]["info"]["assignment"] == "task-based"
+    if task_based:
+        # only items of users that can still be claimed
+        remaining = sum(
+            sum(not v for v in campaign_progress[user_id]["progress"])
+            for user_id in free
+        )
+    else:
+        # progress is shared by all users
+        user_val = next(iter(campaign_progress.values()), None)
+        remaining = 0 if user_val is None else sum(not v for v in user_val["progress"])
+    entry = {
+        "task_based": task_based,
+        "remaining": remaining,
+        "free": free,
+        "claims": {
+            user_val["annotator"]: user_id
+            for user_id, user_val in campaign_progress.items()
+            if "annotator" in user_val
+        },
+    }
+    _work_remaining[campaign_id] = entry
+    return entry
+
+
+def route_annotator(
+    pool: dict,
+    annotator_id: str,
+    tasks_data: dict,
+    progress_data: dict,
+) -> tuple[str, str] | None:
+    """
+    Find the campaign and user an annotator should work on next, claiming a free user if needed.
+    Only campaigns from unrouted_campaigns are loaded from tasks_data.
+
+    Returns:
+        (campaign_id, user_id) or None if there is no work left for the annotator.
+    """
+    campaign_ids = _eligible_campaigns(pool, annotator_id, progress_data)
+
+    # continue with an unfinished user held by the annotator
+    for campaign_id in campaign_ids:
+        user_id = compute_work(tasks_data, progress_data, campaign_id)["claims"].get(annotator_id)
+        if user_id is not None and not all(progress_data[campaign_id][user_id]["progress"]):
+            return campaign_id, user_id
+
+    best = None
+    for campaign_id in campaign_ids:
+        entry = compute_work(tasks_data, progress_data, campaign_id)
+        if annotator_id in entry["claims"] or not entry["free"] or entry["remaining"] == 0:
+            continue
+        if best is None or entry["remaining"] > _work_remaining[best]["remaining"]:
+            best = campaign_id
+    if best is None:
+        return None
+
+    entry = _work_remaining[best]
+    user_id = entry["free"].pop(0)
+    progress_data[best][user_id]["annotator"] = annotator_id
+    progress_data[best][user_id]["pool"] = pool["pool_id"]
+    entry["claims"][annotator_id] = user_id
+    if entry["task_based"]:
+        entry["remaining"] -= sum(not v for v in progress_data[best][user_id]["progress"])
+    return best, user_id
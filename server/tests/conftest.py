@@ -0,0 +1,15 @@
+"""Shared fixtures for the server tests."""
+
+import pytest
+from pearmut.utils import campaign_caches
+
+
+@pytest.fixture
+def tmp_root(tmp_path, monkeypatch):
+    """Run the test in an empty data directory (ROOT is relative) with empty campaign caches."""
+    monkeypatch.chdir(tmp_path)
+    for cache in campaign_caches:
+        cache.clear()
+    yield tmp_path
+    for cache in campaign_caches:
+        cache.clear()
@@ -1,9 +1,17 @@
 """Tests for protocol functions."""
 
+import json
+
+import pytest
 from pearmut.assignment import (
+    ItemScheduler,
+    PriorityScheduler,
+    add_users,
     get_i_item,
     get_next_item,
     reset_task,
+    set_priorities,
+    task_owner,
     update_progress,
 )
 from pearmut.utils import (
@@ -11,6 +19,7 @@ from pearmut.utils import (
     _logs,
     check_validation_threshold,
     get_db_log_item,
+    record_validations,
     save_db_payload,
 )
 
@@ -346,6 +355,113 @@ class TestTaskBased:
         assert 'User: user1, Token: <b>MY_TOKEN</b>' in content
 
 
+    def test_work_stealing(self):
+        """Test that idle users take over unstarted items from the end of other tasks."""
+        tasks_data = {
+            "campaign_stealing": {
+                "info": {"assignment": "task-based", "work_stealing": True},
+                "data": {
+                    "user1": [[{"src": f"a{i}", "tgt": "x"}] for i in range(4)],
+                    "user2": [[{"src": "b0", "tgt": "x"}]],
+                },
+            }
+        }
+        progress_data = {
+            "campaign_stealing": {
+                "user1": {"progress": [False] * 4, "time": 0, "token_correct": "abc", "token_incorrect": "xyz"},
+                "user2": {"progress": [True], "time": 0, "token_correct": "abc", "token_incorrect": "xyz"},
+            }
+        }
+
+        def _next_item(user_id):
+            return json.loads(get_next_item("campaign_stealing", user_id, tasks_data, progress_data).body)
+
+        content = _next_item("user2")
+        assert content["info"]["item_i"] == 1
+        assert content["payload"] == [{"src": "a3", "tgt": "x"}]
+        assert task_owner(tasks_data, progress_data, "campaign_stealing", "user2", 1) == ("user1", 3)
+        # the same item is served until it is submitted
+        assert _next_item("user2")["info"]["item_i"] == 1
+
+        update_progress("campaign_stealing", "user2", tasks_data, progress_data, 1, {})
+        assert progress_data["campaign_stealing"]["user1"]["progress"] == [False, False, False, True]
+        assert _next_item("user2")["payload"] == [{"src": "a2", "tgt": "x"}]
+        assert _next_item("user1")["info"]["item_i"] == 0
+
+        update_progress("campaign_stealing", "user2", tasks_data, progress_data, 2, {})
+        assert _next_item("user2")["payload"] == [{"src": "a1", "tgt": "x"}]
+        update_progress("campaign_stealing", "user2", tasks_data, progress_data, 3, {})
+        # the first unstarted item is left to its owner
+        assert _next_item("user2")["status"] == "goodbye"
+        update_progress("campaign_stealing", "user1", tasks_data, progress_data, 0, {})
+        assert _next_item("user1")["status"] == "goodbye"
+        assert all(progress_data["campaign_stealing"]["user1"]["progress"])
+
+    def test_reset_returns_stolen_items(self, tmp_root):
+        """Test that resetting a task gives its taken over items back to the owner."""
+        tasks_data = {
+            "campaign_stealing": {
+                "info": {"assignment": "task-based", "work_stealing": True},
+                "data": {
+                    "user1": [[{"src": f"a{i}", "tgt": "x"}] for i in range(4)],
+                    "user2": [[{"src": "b0", "tgt": "x"}]],
+                },
+            }
+        }
+        progress_data = {
+            "campaign_stealing": {
+                "user1": {"progress": [False] * 4, "time": 0, "time_start": None, "time_end": None,
+                          "token_correct": "abc", "token_incorrect": "xyz"},
+                "user2": {"progress": [True], "time": 0, "time_start": None, "time_end": None,
+                          "token_correct": "abc", "token_incorrect": "xyz"},
+            }
+        }
+
+        def _next_item(user_id):
+            return json.loads(get_next_item("campaign_stealing", user_id, tasks_data, progress_data).body)
+
+        # user2 submits a3 and is working on a2
+        assert _next_item("user2")["info"]["item_i"] == 1
+        update_progress("campaign_stealing", "user2", tasks_data, progress_data, 1, {})
+        assert _next_item("user2")["info"]["item_i"] == 2
+
+        reset_task("campaign_stealing", "user1", tasks_data, progress_data)
+        user2 = progress_data["campaign_stealing"]["user2"]
+        assert user2["returned"] == [1, 2]
+        assert user2["progress"] == [True, True, True]
+        assert task_owner(tasks_data, progress_data, "campaign_stealing", "user2", 1) is None
+
+        # submissions of returned items no longer mark the owner's items
+        update_progress("campaign_stealing", "user2", tasks_data, progress_data, 1, {})
+        assert progress_data["campaign_stealing"]["user1"]["progress"] == [False] * 4
+        content = json.loads(get_i_item("campaign_stealing", "user2", tasks_data, progress_data, 1).body)
+        assert content["payload"] == [{"src": "a3", "tgt": "x"}]
+        # and new items are taken over again
+        assert _next_item("user2")["info"]["item_i"] == 3
+        assert task_owner(tasks_data, progress_data, "campaign_stealing", "user2", 3) == ("user1", 3)
+
+    def test_no_stealing_by_default(self):
+        """Test that users with finished tasks do not take over items without work_stealing."""
+        tasks_data = {
+            "campaign_stealing": {
+                "info": {"assignment": "task-based"},
+                "data": {
+                    "user1": [[{"src": f"a{i}", "tgt": "x"}] for i in range(4)],
+                    "user2": [[{"src": "b0", "tgt": "x"}]],
+                },
+            }
+        }
+        progress_data = {
+            "campaign_stealing": {
+                "user1": {"progress": [False] * 4, "time": 0, "token_correct": "abc", "token_incorrect": "xyz"},
+                "user2": {"progress": [True], "time": 0, "token_correct": "abc", "token_incorrect": "xyz"},
+            }
+        }
+        response = get_next_item("campaign_stealing", "user2", tasks_data, progress_data)
+        assert json.loads(response.body)["status"] == "goodbye"
+        assert "stolen" not in progress_data["campaign_stealing"]["user1"]
+
+
 class TestSingleStream:
     """Tests for single-stream assignment."""
 
@@ -508,6 +624,258 @@ class TestSingleStream:
         content = response.body.decode()
         assert '"item_i":2' in content
         assert '"src":"e"' in content
+    def test_items_leased_to_one_user(self):
+        """Test that concurrent users receive different items until the pool is leased out."""
+        tasks_data = {
+            "campaign_leases": {
+                "info": {"assignment": "single-stream"},
+                "data": [[{"src": str(i), "tgt": "x"}] for i in range(3)],
+            }
+        }
+        progress_data = {
+            "campaign_leases": {
+                f"user{i}": {
+                    "progress": [False, False, False],
+                    "time": 0,
+                    "token_correct": "abc",
+                    "token_incorrect": "xyz",
+                }
+                for i in range(4)
+            }
+        }
+
+        def _next_item(user_id):
+            response = get_next_item("campaign_leases", user_id, tasks_data, progress_data)
+            return json.loads(response.body)["info"]["item_i"]
+
+        items = [_next_item(f"user{i}") for i in range(3)]
+        assert sorted(items) == [0, 1, 2]
+        # the lease is kept when asking again
+        assert _next_item("user0") == items[0]
+        # all items are leased
+        assert _next_item("user3") in items
+
+        # submitted items are not handed out again
+        update_progress("campaign_leases", "user0", tasks_data, progress_data, items[0], {})
+        assert _next_item("user0") != items[0]
+
+    def test_leases_expire(self):
+        """Test that expired and released leases return items to the pool."""
+        leases = ItemScheduler({}, [0, 0, 1], {}, ttl=10)
+        item_a = leases.lease("user1", now=0)
+        item_b = leases.lease("user2", now=5)
+        assert {item_a, item_b} == {0, 1}
+        assert leases.lease("user3", now=6) is None
+
+        # renewed lease of user2 does not expire with the first one
+        assert leases.lease("user2", now=9) == item_b
+        assert leases.lease("user3", now=10) == item_a
+        assert leases.lease("user4", now=16) is None
+        assert leases.lease("user4", now=19) == item_b
+
+        leases.release("user4")
+        assert leases.lease("user5", now=19.5) == item_b
+        assert leases.complete("user5", item_b)
+        assert leases.lease("user6", now=30) == item_a
+        assert leases.lease("user7", now=30) is None
+
+    def test_redundancy_least_covered_first(self):
+        """Test that items are served to k distinct users, least covered first."""
+        scheduler = ItemScheduler({}, [0, 1, 2], {"user0": {1, 2}}, redundancy=2)
+        assert scheduler.lease("user1", now=0) == 0
+        # item 0 is leased, item 1 is covered once
+        assert scheduler.lease("user2", now=0) in [0, 1]
+        scheduler.release("user2")
+        assert not scheduler.complete("user1", 0)
+        # never served again to the same user
+        assert scheduler.lease("user1", now=0) == 1
+        assert scheduler.unserved("user0") == [0]
+
+    def test_redundancy_campaign(self, tmp_root):
+        """Test that each item is annotated by k distinct users and restored from the log."""
+        tasks_data = {
+            "campaign_redundancy": {
+                "info": {"assignment": "single-stream", "redundancy": 2},
+                "data": [[{"src": str(i), "tgt": "x"}] for i in range(3)],
+            }
+        }
+        progress_data = {
+            "campaign_redundancy": {
+                f"user{i}": {
+                    "progress": [False, False, False],
+                    "time": 0,
+                    "token_correct": "abc",
+                    "token_incorrect": "xyz",
+                }
+                for i in range(3)
+            }
+        }
+        annotated = {i: [] for i in range(3)}
+        for step in range(30):
+            user_id = f"user{step % 3}"
+            response = get_next_item("campaign_redundancy", user_id, tasks_data, progress_data)
+            if json.loads(response.body)["status"] == "goodbye":
+                continue
+            item_i = json.loads(response.body)["info"]["item_i"]
+            assert user_id not in annotated[item_i]
+            annotated[item_i].append(user_id)
+            save_db_payload("campaign_redundancy", {"user_id": user_id, "item_i": item_i, "annotation": []})
+            update_progress("campaign_redundancy", user_id, tasks_data, progress_data, item_i, {})
+            if step == 2:
+                assert progress_data["campaign_redundancy"]["user0"]["progress"] == [False, False, False]
+                # coverage is restored from the log
+                progress_data["campaign_redundancy"] = dict(progress_data["campaign_redundancy"])
+
+        assert all(len(users) == 2 for users in annotated.values())
+        assert progress_data["campaign_redundancy"]["user0"]["progress"] == [True, True, True]
+
+    def test_redundancy_annotations_independent(self, tmp_root):
+        """Test that with redundancy users are not shown the annotations of other users."""
+        tasks_data = {
+            "campaign_independent": {
+                "info": {"assignment": "single-stream", "redundancy": 2},
+                "data": [[{"src": "a", "tgt": "x"}]],
+            }
+        }
+        progress_data = {
+            "campaign_independent": {
+                user_id: {"progress": [False], "time": 0, "token_correct": "abc", "token_incorrect": "xyz"}
+                for user_id in ["user1", "user2"]
+            }
+        }
+        payload = {"annotation": [{"A": {"score": 13}}], "comment": "user1 only"}
+        response = get_next_item("campaign_independent", "user1", tasks_data, progress_data)
+        assert "payload_existing" not in json.loads(response.body)
+        save_db_payload("campaign_independent", payload | {"user_id": "user1", "item_i": 0})
+        update_progress("campaign_independent", "user1", tasks_data, progress_data, 0, payload)
+
+        response = get_next_item("campaign_independent", "user2", tasks_data, progress_data)
+        assert json.loads(response.body)["info"]["item_i"] == 0
+        assert "payload_existing" not in json.loads(response.body)
+        response = get_i_item("campaign_independent", "user2", tasks_data, progress_data, 0)
+        assert "payload_existing" not in json.loads(response.body)
+
+        # users still see their own annotation until it is reset for everyone
+        response = get_i_item("campaign_independent", "user1", tasks_data, progress_data, 0)
+        assert json.loads(response.body)["payload_existing"] == payload
+        reset_task("campaign_independent", "user2", tasks_data, progress_data)
+        response = get_i_item("campaign_independent", "user1", tasks_data, progress_data, 0)
+        assert "payload_existing" not in json.loads(response.body)
+
+
+class TestPriority:
+    """Tests for priority assignment."""
+
+    def test_highest_priority_first(self):
+        """Test that items are leased by priority and re-prioritized at runtime."""
+        scheduler = PriorityScheduler({}, [[1, 0], [5, 0], [3, 0], [2, 0]], [False, False, False, True])
+        assert scheduler.lease("user1", now=0) == 1
+        assert scheduler.lease("user2", now=0) == 2
+        scheduler.set_priority(0, 10, set_time=0)
+        # raised while leased, applies when released
+        scheduler.set_priority(2, 20, set_time=0)
+        assert scheduler.lease("user3", now=0) == 0
+        assert scheduler.lease("user4", now=0) is None
+
+        scheduler.release("user2")
+        assert scheduler.lease("user4", now=0) == 2
+        scheduler.complete("user3", 0)
+        scheduler.release("user4")
+        scheduler.set_priority(1, 30, set_time=0)
+        assert scheduler.lease("user5", now=0) == 2
+        assert scheduler.unfinished() == [1, 2]
+
+    def test_decay(self):
+        """Test that priorities set earlier decay relative to later ones."""
+        scheduler = PriorityScheduler({}, [[5, 0], [4, 7200]], [False, False], decay=1)
+        assert scheduler.lease("user1", now=0) == 1
+
+    def test_priority_campaign(self):
+        """Test serving a priority campaign with priorities from the documents."""
+        tasks_data = {
+            "campaign_priority": {
+                "info": {"assignment": "priority"},
+                "data": [
+                    [{"src": "a", "tgt": "x"}],
+                    [{"src": "b", "tgt": "x", "priority": 2}],
+                    [{"src": "c", "tgt": "x", "priority": 1}],
+                ],
+            }
+        }
+        progress_data = {
+            "campaign_priority": {
+                f"user{i}": {
+                    "progress": [False, False, False],
+                    "time": 0,
+                    "token_correct": "abc",
+                    "token_incorrect": "xyz",
+                }
+                for i in range(2)
+            }
+        }
+
+        def _next_item(user_id):
+            response = get_next_item("campaign_priority", user_id, tasks_data, progress_data)
+            return json.loads(response.body)["info"]["item_i"]
+
+        assert _next_item("user0") == 1
+        update_progress("campaign_priority", "user0", tasks_data, progress_data, 1, {})
+        assert progress_data["campaign_priority"]["user1"]["progress"] == [False, True, False]
+
+        priorities = set_priorities("campaign_priority", tasks_data, progress_data, {0: 5})
+        assert priorities[0][0] == 5
+        assert _next_item("user0") == 0
+        assert _next_item("user1") == 2
+
+
+class TestAddUsers:
+    """Tests for adding users to running campaigns."""
+
+    def test_new_users_share_progress(self):
+        """Test that new users start with the shared progress and are served the next item."""
+        _clear_test_logs()
+        tasks_data = {
+            "test_add_users": {
+                "info": {"assignment": "single-stream", "template": "basic"},
+                "data": [[{"src": "a", "tgt": {"A": "x"}}], [{"src": "b", "tgt": {"A": "y"}}]],
+            }
+        }
+        user1 = {
+            "progress": [True, False],
+            "time_start": 1.0,
+            "time_end": 2.0,
+            "time": 1.0,
+            "url": "basic.html?campaign_id=test_add_users&user_id=user1",
+            "token_correct": "abc",
+            "token_incorrect": "xyz",
+        }
+        progress_data = {"test_add_users": {"user1": user1}}
+        user1_before = json.dumps(user1)
+
+        new_users = add_users("test_add_users", tasks_data, progress_data, 3)
+        assert len(new_users) == 3
+        assert list(progress_data["test_add_users"]) == ["user1", *new_users]
+        assert json.dumps(user1) == user1_before
+        for user_id, user_val in new_users.items():
+            assert user_val["progress"] == [True, False]
+            assert user_val["progress"] is not user1["progress"]
+            assert user_val["url"] == f"basic.html?campaign_id=test_add_users&user_id={user_id}"
+            assert user_val["token_correct"] != user_val["token_incorrect"]
+
+        user_id = next(iter(new_users))
+        response = get_next_item("test_add_users", user_id, tasks_data, progress_data)
+        assert json.loads(response.body)["info"]["item_i"] == 1
+        update_progress("test_add_users", user_id, tasks_data, progress_data, 1, {"annotation": []})
+        assert all(all(v["progress"]) for v in progress_data["test_add_users"].values())
+
+    def test_only_shared_pool(self):
+        """Test that task-based campaigns are refused."""
+        tasks_data = {"test_add_users_tb": {"info": {"assignment": "task-based"}, "data": {}}}
+        progress_data = {"test_add_users_tb": {}}
+        with pytest.raises(ValueError):
+            add_users("test_add_users_tb", tasks_data, progress_data, 1)
+        assert progress_data["test_add_users_tb"] == {}
+
 
 class TestResetMasking:
     """Tests for reset masking functionality."""
@@ -844,6 +1212,49 @@ class TestValidationThreshold:
         progress_data["campaign1"]["user1"]["validations"][2] = [False]
         assert check_validation_threshold(tasks_data, progress_data, "campaign1", "user1") is False
 
+    def test_record_validations_updates_running_totals(self):
+        """Test that recording validations keeps the running totals up to date."""
+        tasks_data = {
+            "campaign1": {
+                "info": {
+                    "assignment": "task-based",
+                    "validation_threshold": 1,
+                }
+            }
+        }
+        user_progress = {"validations": {"0": [True, False]}}
+        progress_data = {"campaign1": {"user1": user_progress}}
+
+        record_validations(user_progress, 1, [False, True, True])
+        assert user_progress["validations_total"] == 5
+        assert user_progress["validations_failed"] == 2
+        assert check_validation_threshold(tasks_data, progress_data, "campaign1", "user1") is False
+
+        # resubmitting an item (also with string keys from disk) replaces its checks
+        record_validations(user_progress, 0, [True, True])
+        assert user_progress["validations_total"] == 5
+        assert user_progress["validations_failed"] == 1
+        assert set(user_progress["validations"].keys()) == {0, 1}
+        assert check_validation_threshold(tasks_data, progress_data, "campaign1", "user1") is True
+
+    def test_reset_clears_running_totals(self):
+        """Test that resetting a task clears the running totals of checks."""
+        tasks_data = {
+            "campaign1": {
+                "info": {"assignment": "task-based"},
+                "data": {"user1": [[{"src": "a", "tgt": {"A": "b"}}]]},
+            }
+        }
+        user_progress = {"progress": [True], "time": 10, "time_start": 1, "time_end": 11}
+        progress_data = {"campaign1": {"user1": user_progress}}
+        record_validations(user_progress, 0, [False])
+
+        reset_task("campaign1", "user1", tasks_data, progress_data)
+        assert user_progress["validations"] == {}
+        assert user_progress["validations_total"] == 0
+        assert user_progress["validations_failed"] == 0
+        assert check_validation_threshold(tasks_data, progress_data, "campaign1", "user1") is True
+
 
 class TestDynamic:
     """Tests for dynamic assignment."""
@@ -319,3 +319,65 @@ class TestShuffleData:
             # Should raise ValueError with helpful message
             with pytest.raises(ValueError, match="Document contains items with different model outputs"):
                 _add_single_campaign(campaign_file, True, "http://localhost:8001")
+
+
+class TestServerDetection:
+    """Tests for finding the running server by its URL."""
+
+    def _serve(self, status, body):
+        import http.server
+        import threading
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(status)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.HTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def test_server_running(self):
+        """Test that servers answering /ready count as running, also while loading."""
+        from pearmut.cli import _server_running
+
+        for status, body, running in [
+            (200, b'{"ready": true, "campaigns": {}}', True),
+            (503, b'{"ready": false, "campaigns": {}}', True),
+            (404, b"not found", False),
+        ]:
+            server = self._serve(status, body)
+            try:
+                assert _server_running(f"http://127.0.0.1:{server.server_port}") is running
+            finally:
+                server.shutdown()
+                server.server_close()
+
+        # nothing listens on the port of the closed server
+        assert _server_running(f"http://127.0.0.1:{server.server_port}") is False
+
+    def test_add_to_unreachable_server(self, tmp_root, capsys):
+        """Test that a campaign added while the server cannot be reached is kept as pending."""
+        from pearmut.cli import _add_single_campaign
+        from pearmut.utils import load_progress_data
+
+        os.makedirs(tmp_root / "data/tasks")
+        load_progress_data()
+        campaign_file = tmp_root / "campaign.json"
+        campaign_file.write_text(json.dumps({
+            "campaign_id": "test_unreachable_campaign",
+            "info": {"assignment": "task-based", "protocol": "ESA"},
+            "data": [[[{"src": "hello", "tgt": {"A": "world"}}]]],
+        }))
+        server = self._serve(200, b"")
+        url = f"http://127.0.0.1:{server.server_port}"
+        server.shutdown()
+        server.server_close()
+
+        _add_single_campaign(str(campaign_file), False, url, live=True)
+        assert "is loaded when it is started again" in capsys.readouterr().out
+        assert os.path.exists(tmp_root / "data/pending/test_unreachable_campaign.json")
@@ -0,0 +1,294 @@
+"""Tests for the campaign dashboard."""
+
+import asyncio
+import json
+
+import pytest
+from pearmut.dashboard import (
+    mark_dirty,
+    publish_changes,
+    publish_ranking,
+    query_dashboard,
+    query_dashboard_json,
+    schedule_ranking,
+    subscribe,
+    unsubscribe,
+)
+
+
+def _campaign():
+    tasks_data = {
+        "campaign1": {
+            "info": {"assignment": "task-based", "validation_threshold": 0},
+            "token": "secret",
+        }
+    }
+    progress_data = {
+        "campaign1": {
+            "user_c": {
+                "progress": [True, True],
+                "time": 120,
+                "time_start": 100,
+                "time_end": 300,
+                "validations": {"0": [True, False]},
+                "token_correct": "abc",
+                "token_incorrect": "xyz",
+            },
+            "user_a": {
+                "progress": [True, False],
+                "time": 60,
+                "time_start": 100,
+                "time_end": 200,
+                "token_correct": "abc",
+                "token_incorrect": "xyz",
+            },
+            "user_b": {
+                "progress": [False, False],
+                "time": 0,
+                "time_start": None,
+                "time_end": None,
+                "token_correct": "abc",
+                "token_incorrect": "xyz",
+            },
+        }
+    }
+    return tasks_data, progress_data
+
+
+class TestDashboardQuery:
+    """Tests for filtering, sorting and pagination of dashboard rows."""
+
+    def test_progress_summarized_as_counts(self):
+        """Test that rows contain progress counts and no full progress by default."""
+        tasks_data, progress_data = _campaign()
+        page, total = query_dashboard(tasks_data, progress_data, "campaign1", True)
+
+        assert total == 3
+        assert list(page) == ["user_a", "user_b", "user_c"]
+        assert page["user_a"]["progress_count"] == 1
+        assert page["user_a"]["progress_total"] == 2
+        assert "progress" not in page["user_a"]
+        assert page["user_c"]["status"] == "completed"
+        assert page["user_c"]["threshold_passed"] is False
+        assert page["user_c"]["validations_passed"] == 0
+        assert page["user_c"]["validations_count"] == 1
+        assert page["user_b"]["status"] == "not_started"
+
+        # submitted without accumulating time
+        progress_data["campaign1"]["user_a"]["time"] = 0
+        mark_dirty(tasks_data, "campaign1", "user_a")
+        page, _ = query_dashboard(tasks_data, progress_data, "campaign1", True)
+        assert page["user_a"]["status"] == "in_progress"
+        progress_data["campaign1"]["user_a"]["time_start"] = None
+        mark_dirty(tasks_data, "campaign1", "user_a")
+        page, _ = query_dashboard(tasks_data, progress_data, "campaign1", True)
+        assert page["user_a"]["status"] == "in_progress"
+        # shared progress does not start the other users
+        tasks_data["campaign1"]["info"]["assignment"] = "single-stream"
+        mark_dirty(tasks_data, "campaign1")
+        page, _ = query_dashboard(tasks_data, progress_data, "campaign1", True)
+        assert page["user_a"]["status"] == "not_started"
+        tasks_data["campaign1"]["info"]["assignment"] = "task-based"
+
+        page, _ = query_dashboard(
+            tasks_data, progress_data, "campaign1", True, include_progress=True
+        )
+        assert page["user_a"]["progress"] == [True, False]
+
+    def test_tokens_hidden_without_privilege(self):
+        """Test that completion tokens are only shown with the campaign token."""
+        tasks_data, progress_data = _campaign()
+        page, _ = query_dashboard(tasks_data, progress_data, "campaign1", False)
+        assert page["user_a"]["token_correct"] is None
+        assert progress_data["campaign1"]["user_a"]["token_correct"] == "abc"
+
+    def test_pagination_and_sorting(self):
+        """Test that pages are taken from the sorted rows."""
+        tasks_data, progress_data = _campaign()
+        page, total = query_dashboard(
+            tasks_data, progress_data, "campaign1", True,
+            offset=1, limit=1, sort_by="time", sort_desc=True,
+        )
+        assert total == 3
+        assert list(page) == ["user_a"]
+
+    def test_filters(self):
+        """Test filtering by status, validation outcome and last activity."""
+        tasks_data, progress_data = _campaign()
+
+        page, total = query_dashboard(
+            tasks_data, progress_data, "campaign1", True,
+            status=["in_progress", "not_started"],
+        )
+        assert total == 2
+        assert list(page) == ["user_a", "user_b"]
+
+        page, _ = query_dashboard(
+            tasks_data, progress_data, "campaign1", True, validation="failed"
+        )
+        assert list(page) == ["user_c"]
+
+        page, _ = query_dashboard(
+            tasks_data, progress_data, "campaign1", True,
+            active_since=150, active_before=250,
+        )
+        assert list(page) == ["user_a"]
+
+    def test_unknown_sort_key(self):
+        """Test that unknown sort keys are rejected."""
+        tasks_data, progress_data = _campaign()
+        with pytest.raises(ValueError):
+            query_dashboard(tasks_data, progress_data, "campaign1", True, sort_by="nope")
+
+
+class TestMaterializedView:
+    """Tests for the materialized dashboard rows."""
+
+    def test_rows_rebuilt_only_when_dirty(self):
+        """Test that changed users are only visible after being marked dirty."""
+        tasks_data, progress_data = _campaign()
+        page, _ = query_dashboard(tasks_data, progress_data, "campaign1", True)
+        assert page["user_b"]["progress_count"] == 0
+
+        progress_data["campaign1"]["user_b"]["progress"][0] = True
+        page, _ = query_dashboard(tasks_data, progress_data, "campaign1", True)
+        assert page["user_b"]["progress_count"] == 0
+
+        mark_dirty(tasks_data, "campaign1", "user_b")
+        page, _ = query_dashboard(tasks_data, progress_data, "campaign1", True)
+        assert page["user_b"]["progress_count"] == 1
+
+    def test_new_users_are_added(self):
+        """Test that users added to a campaign appear without marking them."""
+        tasks_data, progress_data = _campaign()
+        query_dashboard(tasks_data, progress_data, "campaign1", True)
+        progress_data["campaign1"]["user_d"] = dict(
+            progress_data["campaign1"]["user_b"]
+        )
+        _, total = query_dashboard(tasks_data, progress_data, "campaign1", True)
+        assert total == 4
+
+    def test_json_matches_rows(self):
+        """Test that the pre-serialized response matches the rows."""
+        tasks_data, progress_data = _campaign()
+        for is_privileged in [True, False]:
+            for include_progress in [True, False]:
+                page, total = query_dashboard(
+                    tasks_data, progress_data, "campaign1", is_privileged,
+                    include_progress=include_progress, limit=2,
+                )
+                content = json.loads(query_dashboard_json(
+                    tasks_data, progress_data, "campaign1", is_privileged,
+                    include_progress=include_progress, limit=2,
+                ))
+                assert content == {
+                    "data": page, "total": total, "validation_threshold": 0,
+                }
+
+
+class TestLiveEvents:
+    """Tests for the events pushed to live dashboards."""
+
+    def test_user_event_task_based(self):
+        """Test that a change in a task-based campaign sends only the changed row."""
+        tasks_data, progress_data = _campaign()
+        privileged = subscribe("campaign1", True)
+        public = subscribe("campaign1", False)
+
+        progress_data["campaign1"]["user_b"]["progress"][0] = True
+        mark_dirty(tasks_data, "campaign1", "user_b")
+        publish_changes(tasks_data, progress_data, "campaign1", "user_b")
+        unsubscribe("campaign1", privileged)
+        unsubscribe("campaign1", public)
+
+        campaign_id, event, data = privileged.get_nowait()
+        assert campaign_id == "campaign1"
+        assert event == "user"
+        assert json.loads(data)["user_id"] == "user_b"
+        assert json.loads(data)["row"]["progress_count"] == 1
+        assert json.loads(data)["row"]["token_correct"] == "abc"
+        assert privileged.empty()
+        assert json.loads(public.get_nowait()[2])["row"]["token_correct"] is None
+
+    def test_progress_event_shared_pool(self):
+        """Test that shared-pool campaigns send the shared progress once."""
+        tasks_data, progress_data = _campaign()
+        tasks_data["campaign1"]["info"]["assignment"] = "single-stream"
+        for user_val in progress_data["campaign1"].values():
+            user_val["progress"] = [True, False, False]
+        queue = subscribe("campaign1", True)
+
+        publish_changes(tasks_data, progress_data, "campaign1", "user_a")
+        _, event, data = queue.get_nowait()
+        assert event == "progress"
+        assert json.loads(data) == {"progress_count": 1, "progress_total": 3}
+        # and the row of the submitting user, whose time changed
+        _, event, data = queue.get_nowait()
+        assert event == "user"
+        assert json.loads(data)["user_id"] == "user_a"
+        assert queue.empty()
+
+        # completing the pool changes the status of every user
+        for user_val in progress_data["campaign1"].values():
+            user_val["progress"] = [True, True, True]
+        mark_dirty(tasks_data, "campaign1", "user_a")
+        publish_changes(tasks_data, progress_data, "campaign1", "user_a")
+        unsubscribe("campaign1", queue)
+        assert queue.qsize() == 3
+
+    def test_ranking_only_for_privileged(self):
+        """Test that rankings are only sent to privileged dashboards."""
+        public = subscribe("test_live_ranking", False)
+        publish_ranking("test_live_ranking")
+        assert public.empty()
+
+        privileged = subscribe("test_live_ranking", True)
+        publish_ranking("test_live_ranking")
+        # unchanged rankings are not sent again
+        publish_ranking("test_live_ranking")
+        unsubscribe("test_live_ranking", privileged)
+        unsubscribe("test_live_ranking", public)
+        assert privileged.qsize() == 1
+        assert public.empty()
+
+    def test_campaigns_share_queue(self):
+        """Test that one dashboard receives the events of all its campaigns through one queue."""
+        tasks_data, progress_data = _campaign()
+        tasks_data["campaign2"] = tasks_data["campaign1"]
+        progress_data["campaign2"] = progress_data["campaign1"]
+        queue = subscribe("campaign1", True)
+        assert subscribe("campaign2", False, queue) is queue
+
+        publish_changes(tasks_data, progress_data, "campaign2", "user_a")
+        publish_changes(tasks_data, progress_data, "campaign1", "user_a")
+        unsubscribe("campaign1", queue)
+        unsubscribe("campaign2", queue)
+        campaign_id, _, data = queue.get_nowait()
+        assert campaign_id == "campaign2"
+        assert json.loads(data)["row"]["token_correct"] is None
+        campaign_id, _, data = queue.get_nowait()
+        assert campaign_id == "campaign1"
+        assert json.loads(data)["row"]["token_correct"] == "abc"
+
+    def test_ranking_throttled(self, monkeypatch):
+        """Test that rankings after submissions are computed at most once per interval."""
+        calls = []
+        monkeypatch.setattr("pearmut.dashboard.RANKING_INTERVAL", 0.2)
+        monkeypatch.setattr(
+            "pearmut.dashboard.compute_model_scores",
+            lambda campaign_id: calls.append(campaign_id) or [{"count": len(calls)}],
+        )
+
+        async def _submissions():
+            queue = subscribe("test_throttled_ranking", True)
+            for _ in range(5):
+                schedule_ranking("test_throttled_ranking")
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.5)
+            unsubscribe("test_throttled_ranking", queue)
+            return queue
+
+        queue = asyncio.run(_submissions())
+        # the first submission and, after the interval, the ones in the meantime
+        assert len(calls) == 2
+        assert [json.loads(queue.get_nowait()[2]) for _ in range(2)] == [[{"count": 1}], [{"count": 2}]]
@@ -0,0 +1,95 @@
+"""Tests for the random-access item storage."""
+
+import json
+import os
+
+import pytest
+from pearmut.item_store import load_campaign, remove_items, write_items
+from pearmut.utils import ROOT
+
+
+def _prefix(campaign_id):
+    os.makedirs(f"{ROOT}/data/tasks", exist_ok=True)
+    return f"{ROOT}/data/tasks/{campaign_id}"
+
+
+def _save(prefix, campaign_data):
+    with open(f"{prefix}.json", "w") as f:
+        json.dump(write_items(prefix, campaign_data), f)
+
+
+class TestItemStore:
+    """Tests for writing and reading items by offset."""
+
+    def test_single_stream_roundtrip(self):
+        """Test that items are read back by index without the campaign JSON holding them."""
+        prefix = _prefix("test_items_single")
+        items = [[{"src": f"s{i}", "tgt": {"A": "ž" * i}}] for i in range(5)]
+        _save(prefix, {"campaign_id": "x", "info": {}, "data": items})
+
+        with open(f"{prefix}.json") as f:
+            assert "data" not in json.load(f)
+
+        campaign_data = load_campaign(prefix)
+        data = campaign_data["data"]
+        assert len(data) == 5
+        assert data[3] == items[3]
+        assert data[-1] == items[-1]
+        assert data[1:3] == items[1:3]
+        assert list(data) == items
+        with pytest.raises(IndexError):
+            data[5]
+
+    def test_task_based_roundtrip(self):
+        """Test that each user gets their own range of items."""
+        prefix = _prefix("test_items_tasks")
+        items = {
+            "user1": [[{"src": "a", "tgt": {"A": "x"}}], [{"src": "b", "tgt": {"A": "y"}}]],
+            "user2": [],
+            "user3": [[{"src": "c", "tgt": {"A": "z"}}]],
+        }
+        _save(prefix, {"campaign_id": "x", "info": {}, "data": items})
+
+        data = load_campaign(prefix)["data"]
+        assert {user_id: list(data[user_id]) for user_id in data} == items
+        assert len(data["user2"]) == 0
+        assert data["user3"][0] == items["user3"][0]
+
+        remove_items(prefix)
+        assert not os.path.exists(f"{prefix}.items.jsonl")
+
+    def test_identical_items_stored_once(self):
+        """Test that repeated items are written once and shared when read."""
+        prefix = _prefix("test_items_dedup")
+        tutorial = [{"src": "tutorial", "tgt": {"A": "x"}}]
+        items = {
+            f"user{i}": [tutorial, [{"src": f"s{i}", "tgt": {"A": "y"}}]]
+            for i in range(3)
+        }
+        _save(prefix, {"campaign_id": "x", "info": {}, "data": items})
+
+        with open(f"{prefix}.items.jsonl") as f:
+            assert len(f.readlines()) == 4
+
+        data = load_campaign(prefix)["data"]
+        assert {user_id: list(data[user_id]) for user_id in data} == items
+        assert data["user0"][0] is data["user2"][0]
+
+    def test_rewrite_while_mapped(self):
+        """Test that rewriting the items does not change the files a loaded campaign has mapped."""
+        prefix = _prefix("test_items_rewrite")
+        _save(prefix, {"campaign_id": "x", "info": {}, "data": [[{"src": "old" * 1000}]] * 3})
+        data_old = load_campaign(prefix)["data"]
+
+        _save(prefix, {"campaign_id": "x", "info": {}, "data": [[{"src": "new"}]]})
+        assert data_old[2] == [{"src": "old" * 1000}]
+        assert list(load_campaign(prefix)["data"]) == [[{"src": "new"}]]
+
+    def test_campaign_without_items_files(self):
+        """Test that campaigns with inline data are loaded with identical items shared."""
+        prefix = _prefix("test_items_inline")
+        with open(f"{prefix}.json", "w") as f:
+            json.dump({"campaign_id": "x", "info": {}, "data": [[{"src": "a"}]] * 3}, f)
+        data = load_campaign(prefix)["data"]
+        assert data == [[{"src": "a"}]] * 3
+        assert data[0] is data[2]
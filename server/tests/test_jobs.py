@@ -0,0 +1,92 @@
+"""Tests for background jobs."""
+
+import time
+
+import pytest
+from pearmut.jobs import cancel_job, get_job, job_status, start_job
+from pearmut.results_export import (
+    cache_export,
+    compute_model_scores,
+    export_digest,
+    get_cached_export,
+)
+from pearmut.utils import remove_db_log, save_db_payload
+
+
+class TestJobs:
+    """Tests for the background job executor."""
+
+    def test_download_annotations_job(self):
+        """Test that a job runs in the background and keeps its result."""
+        campaign_id = "test_job_annotations"
+        save_db_payload(campaign_id, {"user_id": "user1", "item_i": 0, "annotation": []})
+
+        job_id = start_job("download-annotations", [campaign_id])
+        job = get_job(job_id)
+        result = job["future"].result(timeout=60)
+
+        assert job_status(job)["status"] == "done"
+        assert result[campaign_id][-1]["user_id"] == "user1"
+
+    def test_jobs_see_new_annotations(self):
+        """Test that a job run after new annotations does not reuse the log parsed by an earlier job."""
+        campaign_id = "test_job_scores"
+        remove_db_log(campaign_id)
+
+        def _annotate(n):
+            for i in range(n):
+                save_db_payload(campaign_id, {
+                    "user_id": "user1",
+                    "item_i": i,
+                    "item": [{"src": f"src{i}-{n}", "tgt": {"A": "x"}}],
+                    "annotation": [{"A": {"score": 50}}],
+                })
+
+        _annotate(3)
+        for count in [3, 13]:
+            if count == 13:
+                _annotate(10)
+            job_ids = [start_job("model-scores", [campaign_id]) for _ in range(2)]
+            for job_id in job_ids:
+                result = get_job(job_id)["future"].result(timeout=60)
+                assert result[campaign_id][0]["count"] == count
+
+    def test_export_job_shares_cache(self, tmp_root):
+        """Test that export jobs reuse cached renders and cache their own."""
+        campaign_id = "test_job_export"
+        save_db_payload(campaign_id, {
+            "user_id": "user1",
+            "item_i": 0,
+            "item": [{"src": "src0", "tgt": {"A": "x"}}],
+            "annotation": [{"A": {"score": 50}}],
+        })
+        results = compute_model_scores(campaign_id)
+
+        job = get_job(start_job("export-results", [campaign_id], "latex"))
+        content = job["future"].result(timeout=60)
+        assert "A" in content
+        # done callbacks run right after the result is set
+        while job["finished"] is None:
+            time.sleep(0.01)
+        assert get_cached_export(export_digest(results, campaign_id, "latex")) == content
+
+        cache_export(export_digest(results, campaign_id, "typst"), "cached typst")
+        job = get_job(start_job("export-results", [campaign_id], "typst"))
+        assert job["future"].done()
+        assert job["future"].result() == "cached typst"
+        assert job_status(job)["status"] == "done"
+
+    def test_unknown_job_kind(self):
+        """Test that unknown job kinds are rejected."""
+        with pytest.raises(ValueError):
+            start_job("not-a-job", ["campaign1"])
+
+    def test_export_job_requires_format(self):
+        """Test that export jobs are rejected without a valid format."""
+        with pytest.raises(ValueError):
+            start_job("export-results", ["campaign1"], "docx")
+
+    def test_cancel_unknown_job(self):
+        """Test that cancelling an unknown job does nothing."""
+        assert get_job("unknown") is None
+        assert cancel_job("unknown") is False
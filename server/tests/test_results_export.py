@@ -0,0 +1,335 @@
+"""Tests for model ranking and results export."""
+
+import csv
+import io
+import threading
+
+import numpy as np
+import pytest
+import scipy.stats
+from pearmut.results_export import (
+    ANNOTATION_COLUMNS,
+    _export_cache,
+    _score_matrices,
+    _score_matrix_lock,
+    annotation_rows,
+    annotations_to_bytes,
+    bootstrap_ci,
+    compute_model_scores,
+    export_digest,
+    get_cached_export,
+    get_score_matrix,
+    pairwise_significance,
+    render_export,
+)
+from pearmut.utils import (
+    RESET_MARKER,
+    _logs,
+    load_snapshot,
+    remove_db_log,
+    save_db_payload,
+    take_snapshot,
+    write_snapshot,
+)
+
+
+def _save_annotation(campaign_id, src, scores):
+    """Save a single-segment annotation with the given model scores."""
+    save_db_payload(campaign_id, {
+        "user_id": "user1",
+        "item_i": 0,
+        "item": [{"src": src, "tgt": {model: "x" for model in scores}}],
+        "annotation": [{model: {"score": score} for model, score in scores.items()}],
+    })
+
+
+class TestPairwiseSignificance:
+    """Tests for the vectorized all-pairs significance testing."""
+
+    def test_matches_scipy_paired_ttest(self):
+        """Test that p-values match scipy.stats.ttest_rel on common items."""
+        rng = np.random.default_rng(0)
+        matrix = rng.uniform(0, 100, size=(4, 30))
+        # make some annotations missing
+        matrix[rng.uniform(size=matrix.shape) < 0.2] = np.nan
+
+        pvalues = pairwise_significance(matrix)
+        for i in range(4):
+            for j in range(4):
+                if i == j:
+                    continue
+                common = ~np.isnan(matrix[i]) & ~np.isnan(matrix[j])
+                expected = scipy.stats.ttest_rel(
+                    matrix[i][common], matrix[j][common], alternative="greater"
+                ).pvalue
+                assert np.isclose(pvalues[i, j], expected)
+
+    def test_too_few_common_items(self):
+        """Test that pairs with fewer than two common items have no p-value."""
+        matrix = np.array([
+            [80.0, np.nan, 70.0],
+            [np.nan, 50.0, 60.0],
+        ])
+        pvalues = pairwise_significance(matrix)
+        assert np.isnan(pvalues[0, 1])
+        assert np.isnan(pvalues[1, 0])
+
+    def test_bootstrap_ci_contains_mean(self):
+        """Test that the bootstrap interval contains the mean score."""
+        matrix = np.array([[10.0, 20.0, 30.0, 40.0, np.nan]])
+        intervals = bootstrap_ci(matrix, resamples=200)
+        assert intervals[0, 0] <= 25.0 <= intervals[0, 1]
+
+
+class TestModelScores:
+    """Tests for compute_model_scores."""
+
+    def test_ranking_and_significance(self):
+        """Test that models are ranked by score with all-pairs significance."""
+        _logs.clear()
+        campaign_id = "test_results_ranking"
+        for i in range(10):
+            _save_annotation(campaign_id, f"src{i}", {
+                "A": 90 + i % 3,
+                "B": 50 + i % 2,
+                "C": 10 + i % 4,
+            })
+
+        results = compute_model_scores(campaign_id)
+        assert [r["model"] for r in results] == ["A", "B", "C"]
+        assert [r["count"] for r in results] == [10, 10, 10]
+        assert all(r["sig_better_than_next"] for r in results[:-1])
+        assert results[-1]["sig_better_than_next"] is False
+        assert results[0]["sig_better_than"] == ["B", "C"]
+        assert results[2]["sig_better_than"] == []
+        assert "ci" not in results[0]
+
+        results = compute_model_scores(campaign_id, bootstrap=100)
+        assert results[0]["ci"][0] <= results[0]["score"] <= results[0]["ci"][1]
+
+    def test_matrix_cached_until_log_changes(self, tmp_root):
+        """Test that the score matrix is only rebuilt after new annotations."""
+        campaign_id = "test_results_cache"
+        _save_annotation(campaign_id, "src0", {"A": 80, "B": 60})
+
+        matrix = get_score_matrix(campaign_id)["matrix"]
+        assert get_score_matrix(campaign_id)["matrix"] is matrix
+        assert matrix.shape == (2, 1)
+
+        # re-annotating the same item overrides the score
+        _save_annotation(campaign_id, "src0", {"A": 70, "B": 60})
+        _save_annotation(campaign_id, "src1", {"A": 40})
+        matrix_new = get_score_matrix(campaign_id)["matrix"]
+        assert matrix_new is not matrix
+        assert matrix_new.shape == (2, 2)
+        assert matrix_new[0, 0] == 70
+        assert np.isnan(matrix_new[1, 1])
+
+
+    def test_matrix_restored_from_snapshot(self):
+        """Test that the score matrix is restored from a snapshot and updated from the tail."""
+        campaign_id = "test_results_snapshot"
+        remove_db_log(campaign_id)
+        _logs.pop(campaign_id, None)
+        _save_annotation(campaign_id, "src0", {"A": 80, "B": 60})
+        get_score_matrix(campaign_id)
+        write_snapshot(campaign_id, take_snapshot(campaign_id))
+        _save_annotation(campaign_id, "src1", {"A": 40, "B": 50})
+
+        _logs.pop(campaign_id, None)
+        _score_matrices.pop(campaign_id, None)
+        assert load_snapshot(campaign_id)
+        assert _score_matrices[campaign_id]["processed"] == 1
+        matrix = get_score_matrix(campaign_id)["matrix"]
+        assert matrix.tolist() == [[80, 40], [60, 50]]
+
+    def test_update_and_dump_exclusive(self, tmp_root):
+        """Test that the matrix is not updated or snapshotted while another thread updates it."""
+        campaign_id = "test_results_lock"
+        _save_annotation(campaign_id, "src0", {"A": 80, "B": 60})
+        get_score_matrix(campaign_id)
+        _save_annotation(campaign_id, "src1", {"A": 40, "B": 50})
+
+        results = {}
+        threads = [
+            threading.Thread(target=lambda: results.update(matrix=get_score_matrix(campaign_id))),
+            threading.Thread(target=lambda: results.update(snapshot=take_snapshot(campaign_id))),
+        ]
+        # held as if by an update in a worker thread
+        with _score_matrix_lock(campaign_id):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=0.2)
+            assert results == {}
+        for thread in threads:
+            thread.join()
+        assert results["matrix"]["matrix"].shape == (2, 2)
+        assert results["snapshot"]["derived"]["score_matrix"]["processed"] in [1, 2]
+
+
+class TestExportCache:
+    """Tests for the rendered export cache."""
+
+    def test_render_is_cached_by_results_and_format(self):
+        """Test that rendered exports are reused until the results change."""
+        _export_cache.clear()
+        results = [{
+            "model": "A", "score": 80.0, "count": 3,
+            "sig_better_than_next": False, "sig_better_than": [],
+        }]
+
+        digest = export_digest(results, "campaign1", "latex")
+        assert get_cached_export(digest) is None
+        content = render_export(results, "campaign1", "latex")
+        assert get_cached_export(digest) == content
+        assert "A & 80.0" in content
+
+        # different format or different results are separate entries
+        assert get_cached_export(export_digest(results, "campaign1", "typst")) is None
+        results_new = [results[0] | {"score": 70.0}]
+        assert get_cached_export(export_digest(results_new, "campaign1", "latex")) is None
+
+    def test_concurrent_renders_deduplicated(self, monkeypatch):
+        """Test that concurrent renders of the same export render it once."""
+        _export_cache.clear()
+        results = [{
+            "model": "B", "score": 60.0, "count": 1,
+            "sig_better_than_next": False, "sig_better_than": [],
+        }]
+        started = threading.Event()
+        release = threading.Event()
+        renders = []
+
+        def slow_latex(results):
+            renders.append(results)
+            started.set()
+            release.wait(timeout=10)
+            return "latex"
+
+        monkeypatch.setattr("pearmut.results_export.generate_latex_table", slow_latex)
+        contents = []
+        threads = [
+            threading.Thread(target=lambda: contents.append(render_export(results, "campaign1", "latex")))
+            for _ in range(3)
+        ]
+        threads[0].start()
+        started.wait(timeout=10)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert contents == ["latex"] * 3
+        assert len(renders) == 1
+        assert get_cached_export(export_digest(results, "campaign1", "latex")) == "latex"
+
+
+class TestAnnotationTable:
+    """Tests for the flat segment-level annotation export."""
+
+    def _save_campaign(self, campaign_id):
+        # annotations made after a reset are kept
+        save_db_payload(campaign_id, {
+            "user_id": "user1", "item_i": 3, "annotation": RESET_MARKER,
+        })
+        save_db_payload(campaign_id, {
+            "user_id": "user1",
+            "item_i": 3,
+            "item": [
+                {"doc_id": "doc1", "src": "a", "tgt": {"A": "x", "B": "y"}},
+                {"doc_id": "doc2", "src": "b", "tgt": {"A": "x", "B": "y"}},
+            ],
+            "annotation": [
+                {
+                    "A": {"score": 80, "error_spans": [{"severity": "minor"}]},
+                    "B": {"score": 20, "error_spans": [
+                        {"severity": "major"}, {"severity": "minor"}, {"severity": "major"}
+                    ]},
+                },
+                {"A": {"score": 90, "error_spans": []}, "B": {"score": None}},
+            ],
+            "actions": [{"time": 100.0}, {"time": 110.0}, {"time": 300.0}],
+        })
+
+    def test_rows_joined_with_items(self, tmp_root):
+        """Test that there is one typed row per segment and model."""
+        campaign_id = "test_annotation_rows"
+        self._save_campaign(campaign_id)
+
+        rows = list(annotation_rows(campaign_id))
+        assert len(rows) == 4
+        row = dict(zip(ANNOTATION_COLUMNS, rows[1]))
+        assert row == {
+            "campaign_id": campaign_id,
+            "user_id": "user1",
+            "item_i": 3,
+            "segment_i": 0,
+            "doc_id": "doc1",
+            "model": "B",
+            "score": 20,
+            "error_spans": 3,
+            "error_spans_minor": 1,
+            "error_spans_major": 2,
+            "time": 70.0,
+            "time_start": 100.0,
+            "time_end": 300.0,
+        }
+        assert dict(zip(ANNOTATION_COLUMNS, rows[3]))["score"] is None
+
+    def test_csv(self, tmp_root):
+        """Test that the CSV export has a header and one line per row."""
+        campaign_id = "test_annotation_csv"
+        self._save_campaign(campaign_id)
+
+        content = annotations_to_bytes(annotation_rows(campaign_id), "csv").decode()
+        lines = list(csv.reader(io.StringIO(content)))
+        assert lines[0] == list(ANNOTATION_COLUMNS)
+        assert len(lines) == 5
+        assert lines[2][list(ANNOTATION_COLUMNS).index("doc_id")] == "doc1"
+
+    @pytest.mark.parametrize("format", ["parquet", "arrow"])
+    def test_arrow_formats(self, format, tmp_root):
+        """Test that Parquet and Arrow exports are typed tables."""
+        pa = pytest.importorskip("pyarrow")
+        import pyarrow.parquet as pq
+
+        campaign_id = f"test_annotation_{format}"
+        self._save_campaign(campaign_id)
+
+        content = annotations_to_bytes(annotation_rows(campaign_id), format)
+        if format == "parquet":
+            table = pq.read_table(pa.BufferReader(content))
+        else:
+            table = pa.ipc.open_file(pa.BufferReader(content)).read_all()
+        assert table.num_rows == 4
+        assert table.schema.field("score").type == pa.float64()
+        assert table.schema.field("item_i").type == pa.int64()
+        assert table.column("model").to_pylist() == ["A", "B", "A", "B"]
+
+    def test_reset_annotations_skipped(self, tmp_root):
+        """Test that annotations masked by a later user or shared reset are not exported."""
+        campaign_id = "test_annotation_reset"
+
+        def annotate(user_id, item_i, score):
+            save_db_payload(campaign_id, {
+                "user_id": user_id,
+                "item_i": item_i,
+                "item": [{"src": "a", "tgt": {"A": "x"}}],
+                "annotation": [{"A": {"score": score}}],
+            })
+
+        annotate("user1", 0, 10)
+        annotate("user2", 0, 20)
+        save_db_payload(campaign_id, {"user_id": "user1", "item_i": 0, "annotation": RESET_MARKER})
+        annotate("user1", 0, 30)
+        annotate("user1", 1, 40)
+        save_db_payload(campaign_id, {"user_id": None, "item_i": 1, "annotation": RESET_MARKER})
+        annotate("user2", 1, 50)
+
+        rows = [dict(zip(ANNOTATION_COLUMNS, row)) for row in annotation_rows(campaign_id)]
+        assert [(row["user_id"], row["item_i"], row["score"]) for row in rows] == [
+            ("user2", 0, 20),
+            ("user1", 0, 30),
+            ("user2", 1, 50),
+        ]
@@ -0,0 +1,129 @@
+"""Tests for routing annotators across the campaigns of a pool."""
+
+import json
+
+from pearmut.assignment import get_next_item
+from pearmut.router import (
+    _work_remaining,
+    compute_work,
+    invalidate_work,
+    load_pool,
+    route_annotator,
+    save_pool,
+    unrouted_campaigns,
+)
+
+
+def _user(progress):
+    return {
+        "progress": progress,
+        "time_start": None,
+        "time_end": None,
+        "time": 0,
+        "url": "basic.html",
+        "token_correct": "abc",
+        "token_incorrect": "xyz",
+    }
+
+
+def _pool_data():
+    tasks_data = {
+        "test_route_ende": {"info": {"assignment": "single-stream"}, "data": [[]] * 4},
+        "test_route_encs": {"info": {"assignment": "task-based"}, "data": {}},
+        "test_route_enja": {"info": {"assignment": "single-stream"}, "data": [[]] * 9},
+    }
+    shared = [True, False, False, False]
+    progress_data = {
+        "test_route_ende": {"user1": _user(shared), "user2": _user(shared)},
+        "test_route_encs": {
+            "user1": _user([False] * 2),
+            "user2": _user([False] * 2),
+            "user3": _user([False] * 2),
+        },
+        "test_route_enja": {"user1": _user([False] * 9)},
+    }
+    pool = {
+        "pool_id": "test_route",
+        "campaigns": {
+            "test_route_ende": "en-de",
+            "test_route_encs": "en-cs",
+            "test_route_enja": "en-ja",
+        },
+        "annotators": {"alice": ["en-de", "en-cs"], "bob": ["en-de", "en-cs"], "carol": ["en-de"]},
+    }
+    for campaign_id in tasks_data:
+        invalidate_work(campaign_id)
+    return pool, tasks_data, progress_data
+
+
+class TestRouter:
+    """Tests for picking campaigns by outstanding work."""
+
+    def test_most_outstanding_work(self):
+        """Test that annotators claim free users of the eligible campaign with the most work."""
+        pool, tasks_data, progress_data = _pool_data()
+
+        # 6 items of free task-based users, 3 shared items, en-ja is not eligible
+        assert route_annotator(pool, "alice", tasks_data, progress_data) == ("test_route_encs", "user1")
+        assert progress_data["test_route_encs"]["user1"]["annotator"] == "alice"
+        assert progress_data["test_route_encs"]["user1"]["pool"] == "test_route"
+        # 4 items of free task-based users left
+        assert route_annotator(pool, "bob", tasks_data, progress_data) == ("test_route_encs", "user2")
+        # only en-de
+        assert route_annotator(pool, "carol", tasks_data, progress_data) == ("test_route_ende", "user1")
+        assert _work_remaining["test_route_encs"]["remaining"] == 2
+
+    def test_claimed_user_kept(self):
+        """Test that annotators are sent back to their unfinished user and move on once done."""
+        pool, tasks_data, progress_data = _pool_data()
+        assert route_annotator(pool, "alice", tasks_data, progress_data) == ("test_route_encs", "user1")
+        assert route_annotator(pool, "alice", tasks_data, progress_data) == ("test_route_encs", "user1")
+
+        progress_data["test_route_encs"]["user1"]["progress"] = [True, True]
+        invalidate_work("test_route_encs")
+        # the claims are restored from the progress
+        assert route_annotator(pool, "alice", tasks_data, progress_data) == ("test_route_ende", "user1")
+
+        response = get_next_item("test_route_encs", "user1", tasks_data, progress_data)
+        content = json.loads(response.body)
+        assert content["status"] == "goodbye"
+        assert content["route_url"] == "route?pool_id=test_route&annotator_id=alice"
+
+    def test_no_work_left(self):
+        """Test that nothing is returned when eligible campaigns are finished or fully claimed."""
+        pool, tasks_data, progress_data = _pool_data()
+        for user_val in progress_data["test_route_ende"].values():
+            user_val["progress"][:] = [True] * 4
+        progress_data["test_route_encs"]["user3"]["time_start"] = 1.0
+        assert route_annotator(pool, "carol", tasks_data, progress_data) is None
+
+        assert route_annotator(pool, "alice", tasks_data, progress_data)[0] == "test_route_encs"
+        assert route_annotator(pool, "bob", tasks_data, progress_data)[0] == "test_route_encs"
+        progress_data["test_route_encs"]["user2"]["progress"] = [True, True]
+        assert route_annotator(pool, "bob", tasks_data, progress_data) is None
+        assert route_annotator(pool, "dave", tasks_data, progress_data) is None
+
+    def test_pool_saved(self):
+        """Test that pools are loaded from their file."""
+        pool, _, _ = _pool_data()
+        save_pool(pool)
+        assert load_pool("test_route") == pool
+        assert load_pool("test_route_unknown") is None
+
+    def test_unsafe_pool_id(self):
+        """Test that pool IDs that are not plain file names are unknown."""
+        for pool_id in ["../tasks/test_route", "pools/test_route", "..\\test_route", "..", ""]:
+            assert load_pool(pool_id) is None
+
+    def test_routing_without_tasks(self):
+        """Test that once the work is computed, routing does not access the campaign tasks."""
+        pool, tasks_data, progress_data = _pool_data()
+        assert unrouted_campaigns(pool, "alice", progress_data) == ["test_route_ende", "test_route_encs"]
+        for campaign_id in unrouted_campaigns(pool, "alice", progress_data):
+            compute_work(tasks_data, progress_data, campaign_id)
+        assert unrouted_campaigns(pool, "alice", progress_data) == []
+        assert unrouted_campaigns(pool, "carol", progress_data) == []
+
+        # evicted campaigns are not loaded again
+        assert route_annotator(pool, "alice", {}, progress_data) == ("test_route_encs", "user1")
+        assert route_annotator(pool, "carol", {}, progress_data) == ("test_route_ende", "user1")
@@ -0,0 +1,472 @@
+"""Tests for campaign loading and the annotation logs."""
+
+import json
+import os
+import threading
+
+import pytest
+from pearmut.utils import (
+    RESET_MARKER,
+    ROOT,
+    CampaignTasks,
+    LogRecord,
+    _compress_log_segments,
+    _decode_extra,
+    _log_indexes,
+    _log_ranges,
+    _logs,
+    _parse_log_range,
+    get_db_log,
+    get_db_log_item,
+    get_latest_db_log_item,
+    get_log_index,
+    iter_db_log,
+    load_campaign_tokens,
+    load_log_segments,
+    load_snapshot,
+    log_size,
+    merge_pending_progress,
+    read_db_log,
+    remove_db_log,
+    save_db_payload,
+    save_pending_progress,
+    take_snapshot,
+    write_changed_snapshots,
+    write_snapshot,
+)
+
+
+def _write_campaign(campaign_id, token="secret"):
+    os.makedirs(f"{ROOT}/data/tasks", exist_ok=True)
+    with open(f"{ROOT}/data/tasks/{campaign_id}.json", "w") as f:
+        json.dump({"campaign_id": campaign_id, "info": {}, "token": token, "data": []}, f)
+
+
+class TestCampaignTasks:
+    """Tests for lazily loaded campaign tasks."""
+
+    def test_loaded_on_first_access(self):
+        """Test that campaigns are only loaded when accessed."""
+        _write_campaign("test_lazy1")
+        tasks_data = CampaignTasks({"test_lazy1": {}})
+
+        assert "test_lazy1" not in tasks_data
+        assert tasks_data["test_lazy1"]["token"] == "secret"
+        assert "test_lazy1" in tasks_data
+        with pytest.raises(KeyError):
+            tasks_data["unknown"]
+
+    def test_inactive_campaigns_evicted(self):
+        """Test that least recently used campaigns are evicted over the budget."""
+        for campaign_id in ["test_lazy2", "test_lazy3", "test_lazy4"]:
+            _write_campaign(campaign_id)
+        tasks_data = CampaignTasks(
+            {"test_lazy2": {}, "test_lazy3": {}, "test_lazy4": {}},
+            memory_budget=0,
+            active_window=0,
+        )
+
+        tasks_data["test_lazy2"]
+        get_db_log("test_lazy2")
+        tasks_data["test_lazy3"]
+        assert "test_lazy2" not in tasks_data
+        assert "test_lazy2" not in _logs
+        assert "test_lazy3" in tasks_data
+
+        # evicted campaigns are loaded again
+        assert tasks_data["test_lazy2"]["campaign_id"] == "test_lazy2"
+
+    def test_active_campaigns_kept(self):
+        """Test that recently accessed campaigns are not evicted."""
+        for campaign_id in ["test_lazy5", "test_lazy6"]:
+            _write_campaign(campaign_id)
+        tasks_data = CampaignTasks(
+            {"test_lazy5": {}, "test_lazy6": {}}, memory_budget=0
+        )
+
+        tasks_data["test_lazy5"]
+        tasks_data["test_lazy6"]
+        assert "test_lazy5" in tasks_data
+        assert "test_lazy6" in tasks_data
+
+    def test_unload(self):
+        """Test that an unloaded campaign is read again from disk with its caches dropped."""
+        _write_campaign("test_lazy8", token="old")
+        tasks_data = CampaignTasks({"test_lazy8": {}})
+        assert tasks_data["test_lazy8"]["token"] == "old"
+        get_db_log("test_lazy8")
+
+        _write_campaign("test_lazy8", token="new")
+        tasks_data.unload("test_lazy8")
+        assert "test_lazy8" not in tasks_data
+        assert "test_lazy8" not in _logs
+        assert tasks_data["test_lazy8"]["token"] == "new"
+
+    def test_pending_progress(self):
+        """Test that progress of campaigns added to a running server is merged once."""
+        save_pending_progress("test_pending1", {"user1": {"progress": [False]}})
+        save_pending_progress("test_pending2", {"user2": {"progress": [True]}})
+        progress_data = {"test_pending0": {}}
+
+        assert merge_pending_progress(progress_data, ["test_pending1", "test_unknown"]) == ["test_pending1"]
+        assert progress_data["test_pending1"] == {"user1": {"progress": [False]}}
+        assert "test_pending2" not in progress_data
+        assert "test_pending2" in merge_pending_progress(progress_data)
+        assert list(progress_data) == ["test_pending0", "test_pending1", "test_pending2"]
+        assert merge_pending_progress(progress_data) == []
+
+    def test_pending_progress_of_overwritten_campaign(self, tmp_root):
+        """Test that merging the progress of an overwritten campaign removes its old log."""
+        save_db_payload("test_pending_overwritten", {"user_id": "user1", "item_i": 0, "annotation": []})
+        save_pending_progress("test_pending_overwritten", {"user2": {"progress": [False]}})
+        progress_data = {"test_pending_overwritten": {"user1": {"progress": [True]}}}
+
+        assert merge_pending_progress(progress_data) == ["test_pending_overwritten"]
+        assert progress_data["test_pending_overwritten"] == {"user2": {"progress": [False]}}
+        assert read_db_log("test_pending_overwritten") == []
+
+    def test_token_without_loading(self):
+        """Test that tokens are remembered so campaigns do not need to be loaded."""
+        _write_campaign("test_lazy7", token="abc")
+        tasks_data = CampaignTasks({"test_lazy7": {}})
+
+        assert tasks_data.token("test_lazy7") == "abc"
+        assert "test_lazy7" not in tasks_data
+        assert load_campaign_tokens()["test_lazy7"] == "abc"
+
+
+class TestLogRecord:
+    """Tests for the compact in-memory log records."""
+
+    def test_dict_interface(self):
+        """Test that records behave like the original entries."""
+        entry = {
+            "user_id": "user1",
+            "item_i": 2,
+            "annotation": [{"A": {"score": 10}}],
+            "comment": "hi",
+            "actions": [{"time": 1.0}],
+        }
+        record = LogRecord(entry)
+
+        assert record["user_id"] == "user1"
+        assert record.get("item_i") == 2
+        assert record["annotation"] == [{"A": {"score": 10}}]
+        assert "comment" in record
+        assert record["comment"] == "hi"
+        assert record.get("item", []) == []
+        assert "item" not in record
+        assert record.to_dict() == entry
+        assert sorted(record.keys()) == sorted(entry.keys())
+        with pytest.raises(KeyError):
+            record["item"]
+
+    def test_extra_fields_decoded_once(self):
+        """Test that reading several fields of a record decodes its JSON once."""
+        record = LogRecord({"user_id": "user1", "comment": "decoded once", "actions": [{"time": 1.0}]})
+        misses = _decode_extra.cache_info().misses
+        for _ in range(3):
+            assert record["comment"] == "decoded once"
+            assert record.get("actions") == [{"time": 1.0}]
+        assert _decode_extra.cache_info().misses == misses + 1
+        # copies can be modified
+        record.to_dict()["actions"].append({"time": 2.0})
+        assert record["actions"] == [{"time": 1.0}]
+
+    def test_missing_and_null_fields(self):
+        """Test that missing fields differ from fields set to null."""
+        record = LogRecord({"user_id": "user1", "annotation": None})
+        assert "annotation" in record
+        assert record["annotation"] is None
+        assert "item_i" not in record
+        assert record.to_dict() == {"user_id": "user1", "annotation": None}
+
+    def test_interned_names(self):
+        """Test that user ids and model names are shared between records."""
+        records = [
+            LogRecord({"user_id": "".join(["us", "er1"]), "annotation": [{"".join(["mod", "el"]): {}}]})
+            for _ in range(2)
+        ]
+        assert records[0].user_id is records[1].user_id
+        assert next(iter(records[0].annotation[0])) is next(iter(records[1].annotation[0]))
+
+    def test_log_matches_disk(self):
+        """Test that the in-memory log has the same entries as the file."""
+        campaign_id = "test_log_records"
+        _logs.pop(campaign_id, None)
+        save_db_payload(campaign_id, {"user_id": "user1", "item_i": 0, "annotation": [], "comment": "x"})
+        _logs.pop(campaign_id, None)
+        save_db_payload(campaign_id, {"user_id": "user1", "item_i": 1, "annotation": []})
+
+        assert [record.to_dict() for record in get_db_log(campaign_id)] == read_db_log(campaign_id)
+
+
+class TestLogSegments:
+    """Tests for rolling the log into compressed segments."""
+
+    def test_segments_read_transparently(self, monkeypatch):
+        """Test that rolled and compressed segments are read as one log."""
+        monkeypatch.setattr("pearmut.utils.LOG_SEGMENT_SIZE", 100)
+        campaign_id = "test_log_segments"
+        remove_db_log(campaign_id)
+        _logs.pop(campaign_id, None)
+
+        payloads = [
+            {"user_id": "user1", "item_i": i, "annotation": [{"A": {"score": i}}]}
+            for i in range(10)
+        ]
+        for payload in payloads:
+            save_db_payload(campaign_id, payload)
+        _compress_log_segments(campaign_id)
+
+        segments = load_log_segments(campaign_id)
+        assert len(segments) > 1
+        assert all(segment["file"].endswith(".jsonl.gz") for segment in segments)
+        assert sum(segment["entries"] for segment in segments) <= len(payloads)
+        assert read_db_log(campaign_id) == payloads
+        assert log_size(campaign_id) == sum(len(json.dumps(p)) + 1 for p in payloads)
+
+        _logs.pop(campaign_id, None)
+        assert [record.to_dict() for record in get_db_log(campaign_id)] == payloads
+        for start in [0, 3, 9, 10]:
+            assert list(iter_db_log(campaign_id, start=start)) == payloads[start:]
+
+        remove_db_log(campaign_id)
+        assert read_db_log(campaign_id) == []
+        assert load_log_segments(campaign_id) == []
+
+    def test_compressed_while_reading(self, monkeypatch, tmp_root):
+        """Test that segments compressed after the log was listed are still read."""
+        monkeypatch.setattr("pearmut.utils.LOG_SEGMENT_SIZE", 100)
+        # sealed segments are compressed by hand below
+        monkeypatch.setattr("pearmut.utils._compress_log_segments", lambda campaign_id: None)
+        campaign_id = "test_log_compressed_while_reading"
+        payloads = [
+            {"user_id": "user1", "item_i": i, "annotation": [{"A": {"score": i}}]}
+            for i in range(10)
+        ]
+        for payload in payloads:
+            save_db_payload(campaign_id, payload)
+        assert load_log_segments(campaign_id) == []
+
+        entries = iter_db_log(campaign_id)
+        first = next(entries)
+        _compress_log_segments(campaign_id)
+        assert len(load_log_segments(campaign_id)) > 1
+        assert [first] + list(entries) == payloads
+
+    def test_compressed_before_parsing(self, monkeypatch, tmp_root):
+        """Test that byte ranges of segments compressed after they were listed are parsed."""
+        monkeypatch.setattr("pearmut.utils.LOG_SEGMENT_SIZE", 100)
+        monkeypatch.setattr("pearmut.utils._compress_log_segments", lambda campaign_id: None)
+        monkeypatch.setattr("pearmut.utils.PARALLEL_PARSE_CHUNK", 50)
+        campaign_id = "test_log_compressed_before_parsing"
+        payloads = [
+            {"user_id": "user1", "item_i": i, "annotation": [{"A": {"score": i}}]}
+            for i in range(10)
+        ]
+        for payload in payloads:
+            save_db_payload(campaign_id, payload)
+
+        ranges = _log_ranges(campaign_id)
+        _compress_log_segments(campaign_id)
+        entries = [entry for log_range in ranges for entry in _parse_log_range(*log_range, records=False)]
+        assert entries == payloads
+
+
+class TestParallelParsing:
+    """Tests for parsing large logs in worker processes."""
+
+    def test_parallel_matches_sequential(self, monkeypatch):
+        """Test that entries parsed in byte ranges are merged in order."""
+        monkeypatch.setattr("pearmut.utils.LOG_SEGMENT_SIZE", 500)
+        campaign_id = "test_parallel_parsing"
+        remove_db_log(campaign_id)
+        _logs.pop(campaign_id, None)
+        payloads = [
+            {"user_id": f"user{i % 3}", "item_i": i, "annotation": [{"A": {"score": i}}], "comment": "ž" * i}
+            for i in range(40)
+        ]
+        for payload in payloads:
+            save_db_payload(campaign_id, payload)
+        _compress_log_segments(campaign_id)
+        assert load_log_segments(campaign_id)
+
+        monkeypatch.setattr("pearmut.utils.PARSE_WORKERS", 2)
+        monkeypatch.setattr("pearmut.utils.PARALLEL_PARSE_SIZE", 0)
+        monkeypatch.setattr("pearmut.utils.PARALLEL_PARSE_CHUNK", 100)
+        assert read_db_log(campaign_id) == payloads
+
+        _logs.pop(campaign_id, None)
+        log = get_db_log(campaign_id)
+        assert [record.to_dict() for record in log] == payloads
+        # names are interned again after unpickling the records
+        assert log[0].user_id is log[3].user_id
+
+
+class TestLogIndex:
+    """Tests for looking up single log entries through the line index."""
+
+    def test_latest_matches_log(self, monkeypatch):
+        """Test that lookups from disk match the in-memory log, also in compressed segments."""
+        monkeypatch.setattr("pearmut.utils.LOG_SEGMENT_SIZE", 200)
+        campaign_id = "test_log_index"
+        remove_db_log(campaign_id)
+        _logs.pop(campaign_id, None)
+        payloads = [
+            {"user_id": f"user{i % 3}", "item_i": i % 4, "annotation": [{"A": {"score": i}}], "comment": "ž" * i}
+            for i in range(20)
+        ] + [
+            {"user_id": "user0", "item_i": 0, "annotation": RESET_MARKER},
+            {"user_id": None, "item_i": 1, "annotation": RESET_MARKER},
+        ]
+        for payload in payloads:
+            save_db_payload(campaign_id, payload)
+        _compress_log_segments(campaign_id)
+        assert load_log_segments(campaign_id)
+
+        def _expected(user_id, item_i):
+            items = get_db_log_item(campaign_id, user_id, item_i)
+            return items[-1].to_dict() if items else None
+
+        for index_loaded in [True, False]:
+            if not index_loaded:
+                _log_indexes.pop(campaign_id)
+            for user_id in ["user0", "user1", "user2", "user3", None]:
+                for item_i in range(5):
+                    assert get_latest_db_log_item(campaign_id, user_id, item_i) == _expected(user_id, item_i)
+        assert get_latest_db_log_item(campaign_id, "user0", 0) is None
+
+    def test_compressed_lookup_from_block(self, monkeypatch, tmp_root):
+        """Test that lookups in compressed segments decompress only from the block of the line."""
+        monkeypatch.setattr("pearmut.utils.LOG_SEGMENT_SIZE", 2000)
+        monkeypatch.setattr("pearmut.utils.LOG_BLOCK_SIZE", 100)
+        campaign_id = "test_log_index_blocks"
+        payloads = [
+            {"user_id": "user1", "item_i": i, "annotation": [{"A": {"score": i}}], "comment": "ž" * i}
+            for i in range(30)
+        ]
+        for payload in payloads:
+            save_db_payload(campaign_id, payload)
+        _compress_log_segments(campaign_id)
+        segment = load_log_segments(campaign_id)[0]
+        assert len(segment["blocks"]) > 10
+
+        # earlier blocks are never read
+        with open(f"{tmp_root}/data/outputs/{segment['file']}", "r+b") as f:
+            f.write(b"\0" * segment["blocks"][5])
+        for i in range(segment["entries"] - 5, segment["entries"]):
+            assert get_latest_db_log_item(campaign_id, "user1", i) == payloads[i]
+
+    def test_index_built_once(self, tmp_root):
+        """Test that threads asking for a missing index at the same time share one."""
+        campaign_id = "test_log_index_once"
+        for i in range(50):
+            save_db_payload(campaign_id, {"user_id": "user1", "item_i": i, "annotation": []})
+        _log_indexes.pop(campaign_id)
+
+        barrier = threading.Barrier(4)
+        indexes = []
+
+        def build():
+            barrier.wait()
+            indexes.append(get_log_index(campaign_id))
+
+        threads = [threading.Thread(target=build) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert all(index is _log_indexes[campaign_id] for index in indexes)
+
+    def test_index_rebuilt(self):
+        """Test that a missing or outdated index is rebuilt from the log."""
+        campaign_id = "test_log_index_rebuilt"
+        remove_db_log(campaign_id)
+        _logs.pop(campaign_id, None)
+        payloads = [{"user_id": "user1", "item_i": i, "annotation": []} for i in range(5)]
+        for payload in payloads:
+            save_db_payload(campaign_id, payload)
+
+        # written without updating the index
+        with open(f"{ROOT}/data/outputs/{campaign_id}.jsonl", "a") as f:
+            f.write(json.dumps({"user_id": "user2", "item_i": 0, "annotation": [1]}) + "\n")
+        _log_indexes.pop(campaign_id)
+        assert get_latest_db_log_item(campaign_id, "user2", 0)["annotation"] == [1]
+
+        os.remove(f"{ROOT}/data/outputs/{campaign_id}.lines.idx")
+        _log_indexes.pop(campaign_id)
+        assert get_latest_db_log_item(campaign_id, "user1", 4) == payloads[4]
+        for start in [0, 2, 5, 6]:
+            assert len(list(iter_db_log(campaign_id, start=start))) == 6 - start
+
+
+class TestSnapshots:
+    """Tests for restoring the in-memory log from snapshots."""
+
+    def test_snapshot_with_tail(self):
+        """Test that the snapshot is restored and only newer entries are replayed."""
+        campaign_id = "test_snapshot"
+        remove_db_log(campaign_id)
+        _logs.pop(campaign_id, None)
+        for i in range(3):
+            save_db_payload(campaign_id, {"user_id": "user1", "item_i": i, "annotation": []})
+        write_snapshot(campaign_id, take_snapshot(campaign_id))
+        save_db_payload(campaign_id, {"user_id": "user2", "item_i": 0, "annotation": []})
+
+        _logs.pop(campaign_id, None)
+        assert load_snapshot(campaign_id)
+        assert [record.to_dict() for record in _logs[campaign_id]] == read_db_log(campaign_id)
+        assert _logs[campaign_id][-1].user_id == "user2"
+
+    def test_snapshot_of_removed_log(self):
+        """Test that snapshots are discarded when the log was replaced."""
+        campaign_id = "test_snapshot_removed"
+        remove_db_log(campaign_id)
+        _logs.pop(campaign_id, None)
+        for i in range(3):
+            save_db_payload(campaign_id, {"user_id": "user1", "item_i": i, "annotation": []})
+        write_snapshot(campaign_id, take_snapshot(campaign_id))
+        remove_db_log(campaign_id)
+
+        _logs.pop(campaign_id, None)
+        assert not load_snapshot(campaign_id)
+        assert get_db_log(campaign_id) == []
+
+    def test_changed_snapshots_retried(self, tmp_root, monkeypatch, caplog):
+        """Test that campaigns whose snapshot failed are logged and snapshotted next time."""
+        campaign_id = "test_snapshot_retried"
+        save_db_payload(campaign_id, {"user_id": "user1", "item_i": 0, "annotation": []})
+        snapshot_path = f"{tmp_root}/data/snapshots/{campaign_id}.pickle"
+
+        def fail(campaign_id, state):
+            raise OSError("disk full")
+
+        with monkeypatch.context() as m:
+            m.setattr("pearmut.utils.write_snapshot", fail)
+            write_changed_snapshots()
+        assert "Failed to snapshot campaign test_snapshot_retried" in caplog.text
+        assert not os.path.exists(snapshot_path)
+
+        write_changed_snapshots()
+        assert os.path.exists(snapshot_path)
+        # unchanged campaigns are not written again
+        os.remove(snapshot_path)
+        write_changed_snapshots()
+        assert not os.path.exists(snapshot_path)
+
+    def test_snapshot_of_regrown_log(self, tmp_root):
+        """Test that snapshots are discarded when a new log grew past the size of the old one."""
+        campaign_id = "test_snapshot_regrown"
+        for i in range(3):
+            save_db_payload(campaign_id, {"user_id": "user1", "item_i": i, "annotation": []})
+        write_snapshot(campaign_id, take_snapshot(campaign_id))
+        # the log is replaced without removing the snapshot
+        os.remove(f"{tmp_root}/data/outputs/{campaign_id}.jsonl")
+        _log_indexes.pop(campaign_id, None)
+        for i in range(4):
+            save_db_payload(campaign_id, {"user_id": "user2", "item_i": i, "annotation": [i]})
+
+        _logs.pop(campaign_id, None)
+        assert not load_snapshot(campaign_id)
+        assert [record.user_id for record in get_db_log(campaign_id)] == ["user2"] * 4
@@ -1,5 +1,29 @@
+import concurrent.futures
+import functools
+import glob
+import gzip
+import hashlib
+import itertools
 import json
+import logging
+import mmap
+import multiprocessing
 import os
+import pickle
+import random
+import struct
+import sys
+import threading
+import time
+
+from .item_store import load_campaign
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
 
 ROOT = "."
 
@@ -36,28 +60,520 @@ def save_progress_data(data):
         json.dump(serializable_data, f, indent=2)
 
 
+# marks log record fields that are not present in the entry
+_MISSING = object()
+
+
+# number of recently accessed records whose other fields are kept decoded
+LOG_RECORD_DECODE_CACHE = 1024
+
+
+@functools.lru_cache(maxsize=LOG_RECORD_DECODE_CACHE)
+def _decode_extra(extra: str) -> dict:
+    # strings cache their hash, so lookups of the same record are cheap
+    return json.loads(extra)
+
+
+class LogRecord:
+    """
+    Compact in-memory form of a log entry with the read-only interface of a dict.
+    The user id and model names are interned and the annotation is kept decoded.
+    All other fields (actions, comment, the echoed item, ...) are kept as a single
+    JSON string that is decoded on access. The decoded fields of recently accessed
+    records are shared and must not be modified, to_dict returns a fresh copy.
+    """
+
+    __slots__ = ("user_id", "item_i", "annotation", "_extra_keys", "_extra")
+
+    # shared tuples of the other field names
+    _keys_cache = {}
+
+    def __init__(self, entry: dict):
+        entry = dict(entry)
+        user_id = entry.pop("user_id", _MISSING)
+        item_i = entry.pop("item_i", _MISSING)
+        annotation = entry.pop("annotation", _MISSING)
+        self.__setstate__((
+            user_id,
+            item_i,
+            annotation,
+            tuple(entry.keys()),
+            json.dumps(entry, separators=(",", ":")) if entry else None,
+        ))
+
+    def __getstate__(self):
+        return (self.user_id, self.item_i, self.annotation, self._extra_keys, self._extra)
+
+    def __setstate__(self, state):
+        # names are interned again when records are unpickled in another process
+        user_id, self.item_i, annotation, keys, self._extra = state
+        self.user_id = sys.intern(user_id) if isinstance(user_id, str) else user_id
+        if isinstance(annotation, list):
+            annotation = [
+                {sys.intern(model): v for model, v in segment.items()}
+                if isinstance(segment, dict) else segment
+                for segment in annotation
+            ]
+        self.annotation = annotation
+        self._extra_keys = self._keys_cache.setdefault(keys, keys)
+
+    def keys(self) -> list[str]:
+        return [
+            key for key in ("user_id", "item_i", "annotation")
+            if getattr(self, key) is not _MISSING
+        ] + list(self._extra_keys)
+
+    def __contains__(self, key) -> bool:
+        if key in ("user_id", "item_i", "annotation"):
+            return getattr(self, key) is not _MISSING
+        return key in self._extra_keys
+
+    def __getitem__(self, key):
+        if key in ("user_id", "item_i", "annotation"):
+            value = getattr(self, key)
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        if key not in self._extra_keys:
+            raise KeyError(key)
+        return _decode_extra(self._extra)[key]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def to_dict(self) -> dict:
+        """The original log entry."""
+        return {key: self[key] for key in ("user_id", "item_i", "annotation") if key in self} | (
+            json.loads(self._extra) if self._extra is not None else {}
+        )
+
+
 _logs = {}
 
 
-def get_db_log(campaign_id: str) -> list[dict]:
+# The log of a campaign is written to data/outputs/{campaign_id}.jsonl. Once it is
+# larger than LOG_SEGMENT_SIZE, it is sealed as {campaign_id}.{n:05d}.jsonl and
+# compressed to {campaign_id}.{n:05d}.jsonl.gz in the background. Compressed
+# segments are listed in {campaign_id}.segments.json with their number of
+# entries and uncompressed size. Every LOG_BLOCK_SIZE uncompressed bytes start a
+# new gzip member, whose compressed offsets are listed as the segment's blocks,
+# so that single lines are read without decompressing the segment up to them.
+LOG_SEGMENT_SIZE = 64 * 1024 ** 2
+LOG_BLOCK_SIZE = 1024 ** 2
+
+_compress_lock = threading.Lock()
+
+
+def _log_prefix(campaign_id: str) -> str:
+    return f"{ROOT}/data/outputs/{campaign_id}"
+
+
+def load_log_segments(campaign_id: str) -> list[dict]:
+    """Returns the index of compressed log segments."""
+    index_path = f"{_log_prefix(campaign_id)}.segments.json"
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, "r") as f:
+        return json.load(f)
+
+
+def _log_segment_paths(campaign_id: str) -> list[str]:
+    """Paths of all log segments in order, the active segment last."""
+    prefix = _log_prefix(campaign_id)
+    segments = load_log_segments(campaign_id)
+    paths = [f"{ROOT}/data/outputs/{segment['file']}" for segment in segments]
+    # sealed segments that are not compressed yet, or were compressed after
+    # the index was read
+    n = len(segments)
+    while os.path.exists(f"{prefix}.{n:05d}.jsonl") or os.path.exists(f"{prefix}.{n:05d}.jsonl.gz"):
+        if os.path.exists(f"{prefix}.{n:05d}.jsonl"):
+            paths.append(f"{prefix}.{n:05d}.jsonl")
+        else:
+            paths.append(f"{prefix}.{n:05d}.jsonl.gz")
+        n += 1
+    paths.append(f"{prefix}.jsonl")
+    return paths
+
+
+def _open_log_segment(campaign_id: str, segment: int):
     """
-    Returns up to date log for the given campaign_id.
+    Open log segment number segment for binary reading: the sealed segment, compressed
+    or not, if there is one and otherwise the active segment.
+    Returns (file, path) or (None, None) if there is no such segment.
+
+    Paths listed earlier may be stale because sealed segments are compressed and removed,
+    and the active segment is sealed as the next segment number at any time.
     """
-    if campaign_id not in _logs:
-        # create a new one if it doesn't exist
-        log_path = f"{ROOT}/data/outputs/{campaign_id}.jsonl"
-        if os.path.exists(log_path):
-            with open(log_path, "r") as f:
-                _logs[campaign_id] = [
-                    json.loads(line) for line in f.readlines()
-                ]
+    prefix = _log_prefix(campaign_id)
+    sealed_paths = [f"{prefix}.{segment:05d}.jsonl", f"{prefix}.{segment:05d}.jsonl.gz"]
+    while True:
+        # the .gz exists before the .jsonl is removed
+        for path in sealed_paths:
+            try:
+                return (gzip.open if path.endswith(".gz") else open)(path, "rb"), path
+            except FileNotFoundError:
+                continue
+        try:
+            f = open(f"{prefix}.jsonl", "rb")
+        except FileNotFoundError:
+            f = None
+        if any(os.path.exists(path) for path in sealed_paths):
+            # sealed in the meantime, the opened file may already be the next active segment
+            if f is not None:
+                f.close()
+            continue
+        return (f, f"{prefix}.jsonl") if f is not None else (None, None)
+
+
+def _iter_log_segments(campaign_id: str, first_segment: int = 0):
+    """
+    Yields (segment, file) for the log segments in order from first_segment on, opening
+    each segment only when it is reached. Files are closed when the next one is requested.
+    """
+    prefix = _log_prefix(campaign_id)
+    segment = first_segment
+    while True:
+        f, path = _open_log_segment(campaign_id, segment)
+        if f is None:
+            return
+        with f:
+            yield segment, f
+        # the active segment continues in the next one if it was sealed while it was read
+        if path == f"{prefix}.jsonl" and not (
+            os.path.exists(f"{prefix}.{segment:05d}.jsonl") or os.path.exists(f"{prefix}.{segment:05d}.jsonl.gz")
+        ):
+            return
+        segment += 1
+
+
+def _compress_log_segments(campaign_id: str) -> None:
+    """Compress all sealed log segments and add them to the segment index."""
+    with _compress_lock:
+        prefix = _log_prefix(campaign_id)
+        segments = load_log_segments(campaign_id)
+        # left over if interrupted after the segment was indexed
+        if segments and os.path.exists(f"{prefix}.{len(segments) - 1:05d}.jsonl"):
+            os.remove(f"{prefix}.{len(segments) - 1:05d}.jsonl")
+
+        while os.path.exists(sealed_path := f"{prefix}.{len(segments):05d}.jsonl"):
+            entries = 0
+            blocks = []
+            with open(sealed_path, "rb") as f_in, open(f"{sealed_path}.gz.tmp", "wb") as f_out:
+                while chunk := f_in.read(LOG_BLOCK_SIZE):
+                    entries += chunk.count(b"\n")
+                    blocks.append(f_out.tell())
+                    f_out.write(gzip.compress(chunk))
+            os.replace(f"{sealed_path}.gz.tmp", f"{sealed_path}.gz")
+
+            segments.append({
+                "file": os.path.basename(f"{sealed_path}.gz"),
+                "entries": entries,
+                "size": os.path.getsize(sealed_path),
+                "block_size": LOG_BLOCK_SIZE,
+                "blocks": blocks,
+            })
+            with open(f"{prefix}.segments.json.tmp", "w") as f:
+                json.dump(segments, f, indent=2)
+            os.replace(f"{prefix}.segments.json.tmp", f"{prefix}.segments.json")
+            os.remove(sealed_path)
+
+
+def _rotate_db_log(campaign_id: str) -> None:
+    """Seal the active log segment and compress it in the background."""
+    prefix = _log_prefix(campaign_id)
+    n = len(load_log_segments(campaign_id))
+    # a segment may be compressed in the meantime, its .gz exists before the .jsonl is removed
+    while os.path.exists(f"{prefix}.{n:05d}.jsonl") or os.path.exists(f"{prefix}.{n:05d}.jsonl.gz"):
+        n += 1
+    os.replace(f"{prefix}.jsonl", f"{prefix}.{n:05d}.jsonl")
+    threading.Thread(target=_compress_log_segments, args=(campaign_id,), daemon=True).start()
+
+
+def log_size(campaign_id: str) -> int:
+    """Uncompressed size of the log of a campaign in bytes."""
+    size = sum(segment["size"] for segment in load_log_segments(campaign_id))
+    for path in _log_segment_paths(campaign_id):
+        if not path.endswith(".gz") and os.path.exists(path):
+            size += os.path.getsize(path)
+    return size
+
+
+def remove_db_log(campaign_id: str) -> None:
+    """Remove all log segments of a campaign."""
+    with _compress_lock:
+        prefix = glob.escape(_log_prefix(campaign_id))
+        for path in [
+            f"{_log_prefix(campaign_id)}.jsonl",
+            f"{_log_prefix(campaign_id)}.segments.json",
+            f"{_log_prefix(campaign_id)}.lines.idx",
+            f"{_log_prefix(campaign_id)}.lines.users",
+            _snapshot_path(campaign_id),
+        ] + glob.glob(f"{prefix}.[0-9][0-9][0-9][0-9][0-9].jsonl*"):
+            if os.path.exists(path):
+                os.remove(path)
+        _log_indexes.pop(campaign_id, None)
+
+
+def _json_loads(line: str | bytes):
+    """Decode a log line, with orjson if it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            # e.g. NaN, which only the standard library accepts
+            pass
+    return json.loads(line)
+
+
+# logs larger than this are parsed in parallel worker processes, in bytes
+PARALLEL_PARSE_SIZE = 32 * 1024 ** 2
+# size of the byte ranges of uncompressed segments parsed by one worker
+PARALLEL_PARSE_CHUNK = 8 * 1024 ** 2
+# number of worker processes, logs are parsed in the server process if below 2
+PARSE_WORKERS = os.cpu_count() or 1
+
+_parse_executor = None
+
+
+def _get_parse_executor() -> concurrent.futures.ProcessPoolExecutor:
+    global _parse_executor
+    if _parse_executor is None:
+        # spawn instead of fork because the server process runs threads
+        _parse_executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _parse_executor
+
+
+def _log_ranges(campaign_id: str) -> list[tuple[str, int, int, int]]:
+    """
+    Split the log segments into (campaign_id, segment, start, end) byte ranges on line
+    boundaries. Compressed segments are a single range.
+    """
+    ranges = []
+    for segment, f in _iter_log_segments(campaign_id):
+        if isinstance(f, gzip.GzipFile):
+            ranges.append((campaign_id, segment, 0, -1))
+            continue
+        size = os.fstat(f.fileno()).st_size
+        start = 0
+        while start < size:
+            end = min(start + PARALLEL_PARSE_CHUNK, size)
+            if end < size:
+                # extend to the end of the line
+                f.seek(end)
+                f.readline()
+                end = min(f.tell(), size)
+            ranges.append((campaign_id, segment, start, end))
+            start = end
+    return ranges
+
+
+def _parse_log_range(campaign_id: str, segment: int, start: int, end: int, records: bool) -> list:
+    """
+    Parse the log entries in a byte range of a segment, as LogRecords if records is set.
+    The range is read from the compressed segment if the segment was compressed since.
+    """
+    f, _ = _open_log_segment(campaign_id, segment)
+    if f is None:
+        return []
+    with f:
+        if end < 0:
+            data = f.read()
         else:
-            _logs[campaign_id] = []
+            f.seek(start)
+            data = f.read(end - start)
+    entries = [_json_loads(line) for line in data.split(b"\n") if line]
+    return [LogRecord(entry) for entry in entries] if records else entries
+
+
+def _load_db_log(campaign_id: str, records: bool) -> list:
+    """
+    Read the whole log of a campaign. Large logs are parsed in a process pool
+    and merged in order.
+    """
+    if PARSE_WORKERS < 2 or log_size(campaign_id) < PARALLEL_PARSE_SIZE:
+        entries = iter_db_log(campaign_id)
+        return [LogRecord(entry) for entry in entries] if records else list(entries)
+
+    executor = _get_parse_executor()
+    futures = [
+        executor.submit(_parse_log_range, *log_range, records)
+        for log_range in _log_ranges(campaign_id)
+    ]
+    return list(itertools.chain.from_iterable(future.result() for future in futures))
+
+
+def iter_db_log(campaign_id: str, start: int = 0):
+    """
+    Yields the log entries for the given campaign_id from disk one by one,
+    bypassing the in-memory cache. Reads all log segments in order.
+    The first start entries are skipped without parsing them.
+    """
+    first_segment, offset = 0, 0
+    index = _log_indexes.get(campaign_id)
+    if index is not None and 0 < start < index.entries:
+        # seek to the entry instead of skipping lines
+        first_segment, offset = index.position(start)
+        start = 0
+
+    segments = load_log_segments(campaign_id)
+    for segment, f in _iter_log_segments(campaign_id, first_segment):
+        # whole compressed segments are skipped without reading them
+        if segment < len(segments) and start >= segments[segment]["entries"]:
+            start -= segments[segment]["entries"]
+            continue
+        if segment == first_segment:
+            f.seek(offset)
+        for line in f:
+            if start > 0:
+                start -= 1
+                continue
+            yield _json_loads(line)
+
+
+def read_db_log(campaign_id: str) -> list[dict]:
+    """
+    Reads the log for the given campaign_id from disk, bypassing the in-memory cache.
+    """
+    return _load_db_log(campaign_id, records=False)
+
+
+def get_db_log(campaign_id: str) -> list[LogRecord]:
+    """
+    Returns up to date log for the given campaign_id as compact records.
+    Use read_db_log for the entries as dicts.
+    """
+    if campaign_id not in _logs and not load_snapshot(campaign_id):
+        # create a new one if it doesn't exist
+        _logs[campaign_id] = _load_db_log(campaign_id, records=True)
 
     return _logs[campaign_id]
 
 
-def get_db_log_item(campaign_id: str, user_id: str | None, item_i: int | None) -> list[dict]:
+def log_loaded(campaign_id: str) -> bool:
+    """Whether the log of a campaign is in memory."""
+    return campaign_id in _logs
+
+
+# how often the in-memory state of changed campaigns is snapshotted, in seconds
+SNAPSHOT_INTERVAL = 5 * 60
+
+# name -> (dump, load) of derived per-campaign state that is stored in snapshots.
+# dump(campaign_id, log) is called from the event loop and returns a copy of the
+# state that is consistent with the log, or None. load(campaign_id, state, log)
+# restores it for the log before the tail is replayed.
+snapshot_hooks = {}
+
+
+def _snapshot_path(campaign_id: str) -> str:
+    return f"{ROOT}/data/snapshots/{campaign_id}.pickle"
+
+
+def _log_identity(campaign_id: str) -> str | None:
+    """
+    Hash of the first log line, which tells a log apart from one that was
+    removed and written again. None if the log is empty.
+    """
+    for log_path in _log_segment_paths(campaign_id):
+        if not os.path.exists(log_path):
+            continue
+        with (gzip.open if log_path.endswith(".gz") else open)(log_path, "rb") as f:
+            line = f.readline()
+        if line:
+            return hashlib.sha256(line).hexdigest()
+    return None
+
+
+def take_snapshot(campaign_id: str) -> dict | None:
+    """
+    Copy of the in-memory state of a campaign, together with the number of log
+    entries, the log size and the log identity it covers. None if the log is not loaded.
+    """
+    log = _logs.get(campaign_id)
+    if log is None:
+        return None
+    # records are never modified so a shallow copy is consistent, the log may grow
+    # meanwhile when this runs in a worker thread
+    log_copy = log[:]
+    state = {
+        "entries": len(log_copy),
+        "log_size": log_size(campaign_id),
+        "log_id": _log_identity(campaign_id),
+        "log": log_copy,
+        "derived": {},
+    }
+    for name, (dump, _) in snapshot_hooks.items():
+        derived = dump(campaign_id, log)
+        if derived is not None:
+            state["derived"][name] = derived
+    return state
+
+
+# campaign_id -> number of log entries covered by the last snapshot
+_snapshot_entries = {}
+
+
+def write_changed_snapshots() -> None:
+    """
+    Snapshot all loaded campaigns whose log changed since their last snapshot.
+    Copying the logs and reading the log identity takes a while for large campaigns,
+    so this runs in a worker thread. Campaigns that fail are logged and retried next time.
+    """
+    for campaign_id, log in list(_logs.items()):
+        if _snapshot_entries.get(campaign_id) == len(log):
+            continue
+        try:
+            state = take_snapshot(campaign_id)
+            if state is None:
+                # evicted in the meantime
+                continue
+            write_snapshot(campaign_id, state)
+            _snapshot_entries[campaign_id] = state["entries"]
+        except Exception:
+            # snapshots are only a shortcut, the log is replayed instead
+            logger.exception("Failed to snapshot campaign %s", campaign_id)
+
+
+def write_snapshot(campaign_id: str, state: dict) -> None:
+    """Atomically write a snapshot taken by take_snapshot."""
+    os.makedirs(f"{ROOT}/data/snapshots", exist_ok=True)
+    path = _snapshot_path(campaign_id)
+    with open(f"{path}.tmp", "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_snapshot(campaign_id: str) -> bool:
+    """
+    Restore the in-memory state of a campaign from its snapshot and replay the
+    log entries written after it. Returns False if there is no valid snapshot.
+    """
+    path = _snapshot_path(campaign_id)
+    if not os.path.exists(path):
+        return False
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    # the log was removed or replaced since the snapshot, possibly growing past its old size
+    if (
+        log_size(campaign_id) < state["log_size"]
+        or state.get("log_id") != _log_identity(campaign_id)
+    ):
+        os.remove(path)
+        return False
+
+    log = state["log"]
+    for name, derived in state["derived"].items():
+        if name in snapshot_hooks:
+            snapshot_hooks[name][1](campaign_id, derived, log)
+    log.extend(LogRecord(entry) for entry in iter_db_log(campaign_id, start=state["entries"]))
+    _logs[campaign_id] = log
+    _snapshot_entries[campaign_id] = state["entries"]
+    return True
+
+
+def get_db_log_item(campaign_id: str, user_id: str | None, item_i: int | None) -> list[LogRecord]:
     """
     Returns the log item for the given campaign_id, user_id and item_i.
     Can be empty. Respects reset markers - if a reset marker is found,
@@ -69,15 +585,15 @@ def get_db_log_item(campaign_id: str, user_id: str | None, item_i: int | None) -
     matching = [
         entry for entry in log
         if (
-            (user_id is None or entry.get("user_id") == user_id) and
-            (item_i is None or entry.get("item_i") == item_i)
+            (user_id is None or entry.user_id == user_id) and
+            (item_i is None or entry.item_i == item_i)
         )
     ]
     
     # Find the last reset marker for this user (if any)
     last_reset_idx = -1
     for i, entry in enumerate(matching):
-        if entry.get("annotation") == RESET_MARKER:
+        if entry.annotation == RESET_MARKER:
             last_reset_idx = i
     
     # Return only entries after the last reset
@@ -87,21 +603,477 @@ def get_db_log_item(campaign_id: str, user_id: str | None, item_i: int | None) -
     return matching
 
 
+# fixed-size record of the line index per log entry: user number (-1 for None),
+# item_i (-1 for None), segment, byte offset and length of the line
+_LINE_RECORD = struct.Struct("<iiIQI")
+
+_log_indexes = {}
+
+
+class LogIndex:
+    """
+    On-disk line-offset index of the log of a campaign, so that single entries
+    are decoded from disk instead of from the parsed log.
+
+    data/outputs/{campaign_id}.lines.idx has a _LINE_RECORD per log entry, where
+    the segment is the position in _log_segment_paths and user numbers are the
+    lines of data/outputs/{campaign_id}.lines.users. In memory only the positions
+    of the latest entry per (user, item) and per item are kept.
+    """
+
+    def __init__(self, campaign_id: str):
+        self.campaign_id = campaign_id
+        self._prefix = _log_prefix(campaign_id)
+        segment_paths = _log_segment_paths(campaign_id)
+        # entries are appended to the active segment, which is the last one
+        self.segment = len(segment_paths) - 1
+        if not self._load():
+            self._build(segment_paths)
+
+    def _reset(self) -> None:
+        self._users = {}
+        # (user number, item_i) -> (segment, offset, length) of the latest entry
+        self._latest = {}
+        # item_i -> (segment, offset, length) of the latest entry of any user
+        self._latest_item = {}
+        self.entries = 0
+        self._size = 0
+
+    def _add_position(self, user_no: int, item_i: int, segment: int, offset: int, length: int) -> None:
+        self._latest[(user_no, item_i)] = (segment, offset, length)
+        self._latest_item[item_i] = (segment, offset, length)
+        self.entries += 1
+        self._size += length
+
+    def _load(self) -> bool:
+        """Read the index from disk, False if it is missing or does not cover the log."""
+        self._reset()
+        if not os.path.exists(f"{self._prefix}.lines.idx") or not os.path.exists(f"{self._prefix}.lines.users"):
+            return False
+        with open(f"{self._prefix}.lines.users", "r") as f:
+            for user_no, line in enumerate(f):
+                self._users[json.loads(line)] = user_no
+        with open(f"{self._prefix}.lines.idx", "rb") as f:
+            data = f.read()
+        # interrupted while writing a record
+        if len(data) % _LINE_RECORD.size:
+            return False
+        for record in _LINE_RECORD.iter_unpack(data):
+            self._add_position(*record)
+        return self._size == log_size(self.campaign_id)
+
+    def _build(self, segment_paths: list[str]) -> None:
+        """Index the whole log and replace the index on disk."""
+        self._reset()
+        records = bytearray()
+        for segment in range(len(segment_paths)):
+            f, _ = _open_log_segment(self.campaign_id, segment)
+            if f is None:
+                continue
+            with f:
+                offset = 0
+                for line in f:
+                    entry = _json_loads(line)
+                    user_no = self._user_no(entry.get("user_id"))
+                    record = (user_no, _item_no(entry.get("item_i")), segment, offset, len(line))
+                    records += _LINE_RECORD.pack(*record)
+                    self._add_position(*record)
+                    offset += len(line)
+
+        os.makedirs(os.path.dirname(self._prefix), exist_ok=True)
+        with open(f"{self._prefix}.lines.users", "w") as f:
+            f.writelines(json.dumps(user_id) + "\n" for user_id in self._users)
+        with open(f"{self._prefix}.lines.idx.tmp", "wb") as f:
+            f.write(records)
+        os.replace(f"{self._prefix}.lines.idx.tmp", f"{self._prefix}.lines.idx")
+
+    def _user_no(self, user_id: str | None) -> int:
+        if user_id is None:
+            return -1
+        if user_id not in self._users:
+            self._users[user_id] = len(self._users)
+        return self._users[user_id]
+
+    def add(self, user_id: str | None, item_i: int | None, offset: int, length: int) -> None:
+        """Index a line that was appended to the active segment."""
+        users = len(self._users)
+        user_no = self._user_no(user_id)
+        # the users are written before the record that refers to them
+        if len(self._users) > users:
+            with open(f"{self._prefix}.lines.users", "a") as f:
+                f.write(json.dumps(user_id) + "\n")
+        record = (user_no, _item_no(item_i), self.segment, offset, length)
+        with open(f"{self._prefix}.lines.idx", "ab") as f:
+            f.write(_LINE_RECORD.pack(*record))
+        self._add_position(*record)
+
+    def position(self, entry_i: int) -> tuple[int, int]:
+        """Segment and byte offset of the entry_i-th log entry."""
+        with open(f"{self._prefix}.lines.idx", "rb") as f:
+            f.seek(entry_i * _LINE_RECORD.size)
+            _, _, segment, offset, _ = _LINE_RECORD.unpack(f.read(_LINE_RECORD.size))
+        return segment, offset
+
+    def latest(self, user_id: str | None, item_i: int) -> tuple[int, int, int] | None:
+        """Segment, offset and length of the latest entry of the user (any user if None) for the item."""
+        if user_id is None:
+            return self._latest_item.get(item_i)
+        if user_id not in self._users:
+            return None
+        return self._latest.get((self._users[user_id], item_i))
+
+    def latest_unattributed(self, item_i: int) -> tuple[int, int, int] | None:
+        """Segment, offset and length of the latest entry without a user (shared resets) for the item."""
+        return self._latest.get((-1, item_i))
+
+
+def _item_no(item_i: int | None) -> int:
+    return -1 if item_i is None else item_i
+
+
+# campaign_id -> lock for creating the line index, which is also built by warmup threads
+_log_index_locks = {}
+
+
+def get_log_index(campaign_id: str) -> LogIndex:
+    """Returns the line index of the log of a campaign, built on first use."""
+    index = _log_indexes.get(campaign_id)
+    if index is None:
+        with _log_index_locks.setdefault(campaign_id, threading.Lock()):
+            index = _log_indexes.get(campaign_id)
+            if index is None:
+                index = _log_indexes[campaign_id] = LogIndex(campaign_id)
+    return index
+
+
+def _read_compressed(campaign_id: str, log_path: str, segment: int, offset: int, length: int) -> bytes:
+    """
+    Read bytes of a compressed segment, decompressing from the gzip member that contains
+    the offset. Segments compressed without blocks are decompressed from the start.
+    """
+    segments = load_log_segments(campaign_id)
+    block_start = block_offset = 0
+    if segment < len(segments) and segments[segment].get("blocks"):
+        block_size = segments[segment]["block_size"]
+        block = min(offset // block_size, len(segments[segment]["blocks"]) - 1)
+        block_start, block_offset = block * block_size, segments[segment]["blocks"][block]
+    with open(log_path, "rb") as f_raw:
+        f_raw.seek(block_offset)
+        # a line continues in the next members if it spans blocks
+        with gzip.GzipFile(fileobj=f_raw, mode="rb") as f:
+            f.seek(offset - block_start)
+            return f.read(length)
+
+
+def _read_log_line(campaign_id: str, segment: int, offset: int, length: int) -> bytes | None:
+    """Read a single line of a log segment, memory-mapped unless it is compressed."""
+    prefix = _log_prefix(campaign_id)
+    # sealed segments may be compressed and removed in the meantime, the
+    # active segment is only read if there is no sealed segment with its number
+    for log_path in [f"{prefix}.{segment:05d}.jsonl", f"{prefix}.{segment:05d}.jsonl.gz", f"{prefix}.jsonl"]:
+        try:
+            if log_path.endswith(".gz"):
+                return _read_compressed(campaign_id, log_path, segment, offset, length)
+            with open(log_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[offset:offset + length]
+        except FileNotFoundError:
+            continue
+    return None
+
+
+def get_latest_db_log_item(
+    campaign_id: str,
+    user_id: str | None,
+    item_i: int,
+    shared_reset: bool = False,
+) -> dict | None:
+    """
+    Returns the latest log entry for the given campaign_id, user_id (any user if None)
+    and item_i, decoded from disk through the line index.
+    None if there is no entry or annotations were reset since. With shared_reset,
+    resets of all users (user_id None, as in shared-pool campaigns) also apply to the user.
+    """
+    index = get_log_index(campaign_id)
+    position = index.latest(user_id, item_i)
+    if position is None:
+        return None
+    if shared_reset and user_id is not None:
+        reset_position = index.latest_unattributed(item_i)
+        # positions are ordered by segment and offset
+        if reset_position is not None and reset_position[:2] > position[:2]:
+            reset_line = _read_log_line(campaign_id, *reset_position)
+            if reset_line and _json_loads(reset_line).get("annotation") == RESET_MARKER:
+                return None
+    line = _read_log_line(campaign_id, *position)
+    if not line:
+        return None
+    entry = _json_loads(line)
+    if entry.get("annotation") == RESET_MARKER:
+        return None
+    return entry
+
+
 def save_db_payload(campaign_id: str, payload: dict):
     """
     Saves the given payload to the log for the given campaign_id, user_id and item_i.
-    Saves both on disk and in-memory.
+    Saves both on disk and in-memory, and adds it to the line index.
     """
     # Ensure the in-memory cache is initialized before writing to file
     # to avoid reading back the same entry we're about to append
     log = get_db_log(campaign_id)
+    index = get_log_index(campaign_id)
 
     log_path = f"{ROOT}/data/outputs/{campaign_id}.jsonl"
     os.makedirs(os.path.dirname(log_path), exist_ok=True)
-    with open(log_path, "a") as log_file:
-        log_file.write(json.dumps(payload, ensure_ascii=False,) + "\n")
+    line = (json.dumps(payload, ensure_ascii=False) + "\n").encode()
+    with open(log_path, "ab") as log_file:
+        log_file.write(line)
+        active_size = log_file.tell()
+
+    log.append(LogRecord(payload))
+    index.add(payload.get("user_id"), payload.get("item_i"), active_size - len(line), len(line))
+
+    if active_size >= LOG_SEGMENT_SIZE:
+        _rotate_db_log(campaign_id)
+        index.segment += 1
+
+
+# approximate memory budget for loaded campaigns, measured by the size of their
+# task and log files on disk
+CAMPAIGN_MEMORY_BUDGET = 1024 ** 3
+# campaigns accessed within this many seconds are never evicted
+CAMPAIGN_ACTIVE_WINDOW = 15 * 60
+
+# per-campaign caches that are dropped together with an evicted campaign
+campaign_caches = [_logs, _log_indexes]
 
-    log.append(payload)
+
+class CampaignTasks(dict):
+    """
+    Campaign tasks keyed by campaign_id, loaded from data/tasks on first access.
+    When the loaded campaigns exceed memory_budget, the least recently used ones are
+    evicted together with their cached logs, except for campaigns accessed within
+    active_window seconds. Evicted campaigns are transparently loaded again.
+    """
+
+    def __init__(
+        self,
+        campaign_ids,
+        memory_budget: int = CAMPAIGN_MEMORY_BUDGET,
+        active_window: float = CAMPAIGN_ACTIVE_WINDOW,
+    ):
+        super().__init__()
+        # existing campaigns, usually the progress data
+        self.campaign_ids = campaign_ids
+        self.memory_budget = memory_budget
+        self.active_window = active_window
+        self._last_access = {}
+        self._sizes = {}
+
+    def __getitem__(self, campaign_id):
+        self._last_access[campaign_id] = time.monotonic()
+        return super().__getitem__(campaign_id)
+
+    def __missing__(self, campaign_id):
+        if campaign_id not in self.campaign_ids:
+            raise KeyError(campaign_id)
+        campaign_data = load_campaign(f"{ROOT}/data/tasks/{campaign_id}")
+        # items in random-access files are memory-mapped and not counted
+        self._sizes[campaign_id] = os.path.getsize(f"{ROOT}/data/tasks/{campaign_id}.json")
+        self[campaign_id] = campaign_data
+        self.evict(keep=campaign_id)
+        return campaign_data
+
+    def _size(self, campaign_id: str) -> int:
+        size = self._sizes.get(campaign_id, 0)
+        if campaign_id in _logs:
+            size += log_size(campaign_id)
+        return size
+
+    def evict(self, keep: str | None = None) -> None:
+        """
+        Evict least recently used inactive campaigns, except keep, until the budget is met.
+        """
+        loaded = set(self.keys()) | set(_logs.keys())
+        total = sum(self._size(campaign_id) for campaign_id in loaded)
+        if total <= self.memory_budget:
+            return
+
+        now = time.monotonic()
+        for campaign_id in sorted(loaded, key=lambda c: self._last_access.get(c, 0)):
+            if total <= self.memory_budget:
+                break
+            if now - self._last_access.get(campaign_id, 0) < self.active_window:
+                # all remaining campaigns were accessed even more recently
+                break
+            if campaign_id == keep:
+                continue
+            total -= self._size(campaign_id)
+            self.unload(campaign_id)
+
+    def unload(self, campaign_id: str) -> None:
+        """Drop a loaded campaign and its caches, it is loaded again from disk on next access."""
+        self.pop(campaign_id, None)
+        self._sizes.pop(campaign_id, None)
+        self._last_access.pop(campaign_id, None)
+        for cache in campaign_caches:
+            cache.pop(campaign_id, None)
+
+    def token(self, campaign_id: str) -> str:
+        """
+        Returns the dashboard token of a campaign without keeping it loaded.
+        Tokens are remembered in data/tokens.json.
+        """
+        tokens = load_campaign_tokens()
+        if campaign_id not in tokens:
+            if campaign_id in self:
+                token = super().__getitem__(campaign_id)["token"]
+            else:
+                with open(f"{ROOT}/data/tasks/{campaign_id}.json", "r") as f:
+                    token = json.load(f)["token"]
+            save_campaign_token(campaign_id, token)
+            return token
+        return tokens[campaign_id]
+
+
+def save_pending_progress(campaign_id: str, user_progress: dict) -> None:
+    """
+    Progress of a campaign added while the server is running, it is moved to
+    progress.json by the server so that the running server does not overwrite it.
+    """
+    os.makedirs(f"{ROOT}/data/pending", exist_ok=True)
+    with open(f"{ROOT}/data/pending/{campaign_id}.json", "w") as f:
+        json.dump(user_progress, f, indent=2)
+
+
+def merge_pending_progress(progress_data: dict, campaign_ids=None) -> list[str]:
+    """
+    Move the pending progress of added campaigns (all if campaign_ids is None) into
+    progress_data and save it. Campaigns that are already in progress_data were
+    overwritten and their log is removed.
+
+    Returns:
+        IDs of the merged campaigns.
+    """
+    if campaign_ids is None:
+        campaign_ids = [
+            os.path.basename(path).removesuffix(".json")
+            for path in glob.glob(f"{ROOT}/data/pending/*.json")
+        ]
+    merged = []
+    for campaign_id in campaign_ids:
+        path = f"{ROOT}/data/pending/{campaign_id}.json"
+        if os.path.exists(path):
+            if campaign_id in progress_data:
+                remove_db_log(campaign_id)
+            with open(path, "r") as f:
+                progress_data[campaign_id] = json.load(f)
+            merged.append(campaign_id)
+    if merged:
+        # pending files are removed only once the progress is saved
+        save_progress_data(progress_data)
+        for campaign_id in merged:
+            os.remove(f"{ROOT}/data/pending/{campaign_id}.json")
+    return merged
+
+
+def load_campaign_tokens() -> dict[str, str]:
+    if not os.path.exists(f"{ROOT}/data/tokens.json"):
+        return {}
+    with open(f"{ROOT}/data/tokens.json", "r") as f:
+        return json.load(f)
+
+
+def save_campaign_token(campaign_id: str, token: str) -> None:
+    tokens = load_campaign_tokens()
+    tokens[campaign_id] = token
+    with open(f"{ROOT}/data/tokens.json", "w") as f:
+        json.dump(tokens, f, indent=2)
+
+
+def random_user_ids(num_users: int, rng: random.Random, existing=()) -> list[str]:
+    """Random adjective-noun-number user IDs that are not in existing."""
+    import wonderwords
+
+    rword = wonderwords.RandomWord(rng=rng)
+    user_ids = []
+    while len(user_ids) < num_users:
+        new_id = f"{rword.random_words(amount=1, include_parts_of_speech=['adjective'])[0]}-{rword.random_words(amount=1, include_parts_of_speech=['noun'])[0]}"
+        new_id = f"{new_id}-{rng.randint(0, 999):03d}"
+        if new_id not in user_ids and new_id not in existing:
+            user_ids.append(new_id)
+    return user_ids
+
+
+def random_token(rng: random.Random) -> str:
+    return hashlib.sha256(rng.randbytes(16)).hexdigest()[:10]
+
+
+def load_priorities(campaign_id: str) -> list[list[float]] | None:
+    """
+    Priorities of the items of a priority campaign and the time they were set,
+    None if they were never saved.
+    """
+    if not os.path.exists(f"{ROOT}/data/tasks/{campaign_id}.priorities.json"):
+        return None
+    with open(f"{ROOT}/data/tasks/{campaign_id}.priorities.json", "r") as f:
+        return json.load(f)
+
+
+def save_priorities(campaign_id: str, priorities: list[list[float]]) -> None:
+    path = f"{ROOT}/data/tasks/{campaign_id}.priorities.json"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(priorities, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def _validation_counts(user_progress: dict) -> tuple[int, int]:
+    """
+    Returns the totals (checks, failed checks) of a user.
+    Uses the running totals if present, otherwise counts them from the validations.
+    """
+    if "validations_total" in user_progress:
+        return user_progress["validations_total"], user_progress["validations_failed"]
+
+    # progress data without running totals (e.g. from older versions)
+    checks = [
+        check_passed
+        for item_validations in user_progress.get("validations", {}).values()
+        for check_passed in item_validations
+    ]
+    return len(checks), checks.count(False)
+
+
+def init_validation_counts(user_progress: dict) -> None:
+    """
+    Add the running totals of checks to progress data that does not have them yet.
+    """
+    total_checks, failed_checks = _validation_counts(user_progress)
+    user_progress["validations_total"] = total_checks
+    user_progress["validations_failed"] = failed_checks
+
+
+def record_validations(user_progress: dict, item_i: int, validations: list[bool]) -> None:
+    """
+    Store validation results of a user for an item, replacing the previous results
+    for that item, and update the running totals of checks and failed checks.
+    """
+    total_checks, failed_checks = _validation_counts(user_progress)
+    user_validations = user_progress.setdefault("validations", {})
+
+    # progress loaded from disk has string keys
+    for key in (item_i, str(item_i)):
+        previous = user_validations.pop(key, None)
+        if previous is not None:
+            total_checks -= len(previous)
+            failed_checks -= sum(not check_passed for check_passed in previous)
+
+    user_validations[item_i] = validations
+    user_progress["validations_total"] = total_checks + len(validations)
+    user_progress["validations_failed"] = failed_checks + sum(
+        not check_passed for check_passed in validations
+    )
 
 
 def check_validation_threshold(
@@ -123,17 +1095,10 @@ def check_validation_threshold(
     """
     threshold = tasks_data[campaign_id]["info"].get("validation_threshold", 0)
     
-    user_progress = progress_data[campaign_id][user_id]
-    validations = user_progress.get("validations", {})
-    
-    # Count failed checks (validations is dict of item_i -> list of bools)
-    total_checks = 0
-    failed_checks = 0
-    for item_validations in validations.values():
-        for check_passed in item_validations:
-            total_checks += 1
-            if not check_passed:
-                failed_checks += 1
+    # running totals of checks, kept up to date by record_validations
+    total_checks, failed_checks = _validation_counts(
+        progress_data[campaign_id][user_id]
+    )
 
     # If no validation checks exist, pass
     if total_checks == 0:
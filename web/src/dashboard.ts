@@ -30,15 +30,137 @@ function delta_to_human(delta: number): string {
     }
 }
 
-async function fetchAndRenderCampaign(campaign_id: string, token: string | null) {
-    let x = await $.ajax({
+async function runJob(kind: string, campaign_id: string, token: string, format: string) {
+    /* Start a background job on the server, wait for it to finish and download the result */
+    let { job_id } = await $.ajax({
+        url: `/start-job`,
+        method: "POST",
+        data: JSON.stringify({ "kind": kind, "campaign_id": [campaign_id], "token": [token], "format": format }),
+        contentType: "application/json",
+        dataType: "json",
+    });
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        let status = await $.ajax({
+            url: `/job-status`,
+            method: "POST",
+            data: JSON.stringify({ "job_id": job_id }),
+            contentType: "application/json",
+            dataType: "json",
+        });
+        if (status.status == "done") {
+            window.location.href = `/job-result?job_id=${encodeURIComponent(job_id)}`
+            return
+        }
+        if (status.status == "failed" || status.status == "cancelled") {
+            throw new Error(`Job ${status.status}${status.error ? ": " + status.error : ""}`)
+        }
+    }
+}
+
+// number of users loaded per request
+const PAGE_SIZE = 100
+
+function renderUserRow(user_id: string, entry: any, token: string | null): string {
+    /* Render a single user row of the dashboard table */
+    let progress_count = entry["progress_count"]
+    let progress_total = entry["progress_total"]
+    let threshold_passed = entry["threshold_passed"]
+    let status = ''
+    if (entry["time"] == 0)
+        status = '💤'
+    else if (entry["time"] != 0 && progress_count == progress_total) {
+        // Use threshold_passed to determine if user passed/failed
+        // threshold_passed is null if not complete, true if passed, false if failed
+        if (threshold_passed === false)
+            status = '❌'
+        else
+            status = '✅'
+    }
+    else
+        status = '✍️'
+
+    let html = `<tr data-user-id="${user_id}">`
+
+    // user id and emoji
+    html += `<td>${status} ${user_id}</td>`
+
+    // time section
+    html += `<td>${progress_count}/${progress_total}</td>`
+    if (entry["time_start"] == null) {
+        html += `<td title="N/A"></td>`
+    } else {
+        html += `<td title="${new Date(entry["time_start"] * 1000).toLocaleString()}">${delta_to_human(Date.now() / 1000 - entry["time_start"])} ago</td>`
+    }
+    if (entry["time_end"] == null) {
+        html += `<td title="N/A"></td>`
+    } else {
+        html += `<td title="${new Date(entry["time_end"] * 1000).toLocaleString()}">${delta_to_human(Date.now() / 1000 - entry["time_end"])} ago</td>`
+    }
+    html += `<td>${Math.round(entry["time"] / 60)}m</td>`
+
+    let validation_passed = entry["validations_passed"]
+    let validation_total = entry["validations_count"]
+    html += `<td><span style="${validation_passed != validation_total ? 'color: #c75050;' : ''}">${validation_passed}</span><span style="color: #333;">/${validation_total}</span></td>`
+
+    // actions section
+    html += `<td>
+        <a href="${entry["url"]}">🔗</a>
+        &nbsp;&nbsp;
+        <a href="${entry["url"]}&frozen" title="View only (frozen)">👁️</a>
+        &nbsp;&nbsp;
+        <span class="reset-task" user_id="${user_id}" ${token == null ? "disabled" : ""}>🗑️</span>
+    </td>`
+    html += '</tr>'
+    return html
+}
+
+function renderRankingTable(resultsData: Array<any>): string {
+    /* Render the model ranking table */
+    let tableHtml = `
+        <table class="results-table">
+            <thead><tr>
+                <th>Model</th>
+                <th>Score</th>
+                <th>Count</th>
+            </tr></thead>
+            <tbody>`;
+
+    for (let result of resultsData) {
+        tableHtml += `
+            <tr>
+                <td style="${result.sig_better_than_next ? "border-bottom: 1pt solid black;" : ""}">${result.model}</td>
+                <td>${result.score.toFixed(1)}</td>
+                <td>${result.count}</td>
+            </tr>`;
+    }
+
+    tableHtml += `
+            </tbody>
+        </table>`;
+    return tableHtml
+}
+
+async function fetchDashboardPage(campaign_id: string, token: string | null, offset: number, filter: string): Promise<any> {
+    /* Fetch one page of users, filter is either empty, a status or a validation outcome */
+    let filters: Record<string, any> = {}
+    if (["not_started", "in_progress", "completed"].indexOf(filter) != -1) {
+        filters["status"] = [filter]
+    } else if (["passed", "failed"].indexOf(filter) != -1) {
+        filters["validation"] = filter
+    }
+    return await $.ajax({
         url: `/dashboard-data`,
         method: "POST",
-        data: JSON.stringify({ "campaign_id": campaign_id, "token": token }),
+        data: JSON.stringify({ "campaign_id": campaign_id, "token": token, "offset": offset, "limit": PAGE_SIZE, ...filters }),
         contentType: "application/json",
         dataType: "json",
     });
-    let data = x.data;
+}
+
+function renderCampaign(campaign_id: string, token: string | null, x: any) {
+    /* Render the first page of users and the (hidden) ranking from the batch summary */
+    let ranking: Array<any> | null = x.results
 
     let html = ""
     html += `
@@ -52,60 +174,19 @@ async function fetchAndRenderCampaign(campaign_id: string, token: string | null)
             <th style="min-width: 70px;">Checks</th>
             <th style="min-width: 50px;">Actions</th>
         </tr></thead>
-        <tbody>`
-    for (let user_id in data) {
-        // sum
-        let progress_count = (data[user_id]["progress"] as Array<boolean>).reduce((a, b) => a + (b ? 1 : 0), 0)
-        let progress_total = (data[user_id]["progress"] as Array<boolean>).length
-        let threshold_passed = data[user_id]["threshold_passed"]
-        let status = ''
-        if (data[user_id]["time"] == 0)
-            status = '💤'
-        else if (data[user_id]["time"] != 0 && progress_count == progress_total) {
-            // Use threshold_passed to determine if user passed/failed
-            // threshold_passed is null if not complete, true if passed, false if failed
-            if (threshold_passed === false)
-                status = '❌'
-            else
-                status = '✅'
-        }
-        else
-            status = '✍️'
-
-        html += '<tr>'
-
-        // user id and emoji
-        html += `<td>${status} ${user_id}</td>`
-
-        // time section
-        html += `<td>${progress_count}/${progress_total}</td>`
-        if (data[user_id]["time_start"] == null) {
-            html += `<td title="N/A"></td>`
-        } else {
-            html += `<td title="${new Date(data[user_id]["time_start"] * 1000).toLocaleString()}">${delta_to_human(Date.now() / 1000 - data[user_id]["time_start"])} ago</td>`
-        }
-        if (data[user_id]["time_end"] == null) {
-            html += `<td title="N/A"></td>`
-        } else {
-            html += `<td title="${new Date(data[user_id]["time_end"] * 1000).toLocaleString()}">${delta_to_human(Date.now() / 1000 - data[user_id]["time_end"])} ago</td>`
-        }
-        html += `<td>${Math.round(data[user_id]["time"] / 60)}m</td>`
-
-        let validation_passed = data[user_id]["validations"].reduce((a: number, b: boolean) => a + (b ? 1 : 0), 0)
-        let validation_total = data[user_id]["validations"].length
-        html += `<td><span style="${validation_passed != validation_total ? 'color: #c75050;' : ''}">${validation_passed}</span><span style="color: #333;">/${validation_total}</span></td>`
-
-        // actions section
-        html += `<td>
-            <a href="${data[user_id]["url"]}">🔗</a>
-            &nbsp;&nbsp;
-            <a href="${data[user_id]["url"]}&frozen" title="View only (frozen)">👁️</a>
-            &nbsp;&nbsp;
-            <span class="reset-task" user_id="${user_id}" ${token == null ? "disabled" : ""}>🗑️</span>
-        </td>`
-        html += '</tr>'
-    }
-    html += '</tbody></table>'
+        <tbody></tbody></table>
+    <div class="dashboard-pagination">
+        <select class="dashboard-filter">
+            <option value="">All users</option>
+            <option value="not_started">💤 Not started</option>
+            <option value="in_progress">✍️ In progress</option>
+            <option value="completed">✅ Completed</option>
+            <option value="passed">Passed checks</option>
+            <option value="failed">❌ Failed checks</option>
+        </select>
+        <span class="dashboard-count"></span>
+        <a class="abutton dashboard-more">Show more</a>
+    </div>`
 
     // link to campaign-specific dashboard
     let dashboard_url = `${window.location.origin}/dashboard.html?campaign_id=${encodeURIComponent(campaign_id)}${token != null ? `&token=${encodeURIComponent(token)}` : ''}`
@@ -139,16 +220,73 @@ async function fetchAndRenderCampaign(campaign_id: string, token: string | null)
 
     $("#dashboard_div").append(el)
 
+    // render users page by page
+    let shown = 0
+    let filter = ""
+    // rendered users, kept for live updates
+    let entries: Record<string, any> = {}
+    function appendPage(page: any) {
+        let rows = ""
+        for (let user_id in page.data) {
+            entries[user_id] = page.data[user_id]
+            rows += renderUserRow(user_id, page.data[user_id], token)
+        }
+        el.find(".dashboard-table tbody").append(rows)
+        shown += Object.keys(page.data).length
+        el.find(".dashboard-count").text(`${shown}/${page.total} users`)
+        el.find(".dashboard-more").toggle(shown < page.total)
+    }
+    appendPage(x)
+
+    el.find(".dashboard-more").on("click", async function () {
+        appendPage(await fetchDashboardPage(campaign_id, token, shown, filter))
+    })
+    el.find(".dashboard-filter").on("change", async function () {
+        filter = $(this).val() as string
+        shown = 0
+        entries = {}
+        el.find(".dashboard-table tbody").empty()
+        appendPage(await fetchDashboardPage(campaign_id, token, 0, filter))
+    })
+
+    // apply live updates to the rendered users and the ranking
+    function updateRow(user_id: string) {
+        el.find(`tr[data-user-id="${user_id}"]`).replaceWith(renderUserRow(user_id, entries[user_id], token))
+    }
+    liveHandlers[campaign_id] = {
+        "user": (data: any) => {
+            let { user_id, row } = data
+            if (user_id in entries) {
+                entries[user_id] = row
+                updateRow(user_id)
+            }
+        },
+        "progress": (progress: any) => {
+            // shared-pool progress is the same for all users
+            for (let user_id in entries) {
+                entries[user_id]["progress_count"] = progress["progress_count"]
+                entries[user_id]["progress_total"] = progress["progress_total"]
+                updateRow(user_id)
+            }
+        },
+        "ranking": (resultsData: any) => {
+            ranking = resultsData
+            let $table = el.find(".ranking-content .results-table")
+            if ($table.length > 0 && resultsData.length > 0) {
+                $table.replaceWith(renderRankingTable(resultsData))
+            }
+        },
+    }
+
     // Add event listener for show/hide ranking button
     el.find(".show-ranking-btn").on("click", async function () {
         const $content = el.find(".ranking-content");
 
         $(this).remove()
 
-        // Check if data is already loaded
-        // Fetch results data
+        // Ranking is already loaded with the batch summary if the token is valid
         try {
-            const resultsData = await $.ajax({
+            const resultsData = ranking != null ? ranking : await $.ajax({
                 url: `/dashboard-results`,
                 method: "POST",
                 data: JSON.stringify({ "campaign_id": campaign_id, "token": token }),
@@ -157,41 +295,28 @@ async function fetchAndRenderCampaign(campaign_id: string, token: string | null)
             });
 
             if (resultsData && resultsData.length > 0) {
-                let tableHtml = `
-                    <table class="results-table">
-                        <thead><tr>
-                            <th>Model</th>
-                            <th>Score</th>
-                            <th>Count</th>
-                        </tr></thead>
-                        <tbody>`;
-
-                for (let result of resultsData) {
-                    tableHtml += `
-                        <tr>
-                            <td style="${result.sig_better_than_next ? "border-bottom: 1pt solid black;" : ""}">${result.model}</td>
-                            <td>${result.score.toFixed(1)}</td>
-                            <td>${result.count}</td>
-                        </tr>`;
-                }
-
-                tableHtml += `
-                        </tbody>
-                    </table>`;
-
-                $content.append(tableHtml);
+                $content.append(renderRankingTable(resultsData));
                 
                 // Add export links with direct hrefs - no click handlers needed
                 // Only show if token is available
                 if (token) {
                     const exportLinksHtml = `
                         <div style="margin-top: 10px;">
-                            <a href="/export-results?campaign_id=${encodeURIComponent(campaign_id)}&token=${encodeURIComponent(token)}&format=pdf" class="abutton">Export PDF</a>
+                            <a class="abutton export-pdf-btn">Export PDF</a>
                             <a href="/export-results?campaign_id=${encodeURIComponent(campaign_id)}&token=${encodeURIComponent(token)}&format=typst" class="abutton">Export Typst</a>
                             <a href="/export-results?campaign_id=${encodeURIComponent(campaign_id)}&token=${encodeURIComponent(token)}&format=latex" class="abutton">Export LaTeX</a>
                         </div>
                     `;
                     $content.append(exportLinksHtml);
+                    $content.find(".export-pdf-btn").on("click", async function () {
+                        $(this).text("Exporting PDF ⏳")
+                        try {
+                            await runJob("export-results", campaign_id, token, "pdf")
+                        } catch (error: any) {
+                            notify("Error exporting PDF: " + (error?.responseText || error))
+                        }
+                        $(this).text("Export PDF")
+                    })
                 }
             } else {
                 $content.html("<p>No ranking data available yet.</p>");
@@ -206,7 +331,7 @@ async function fetchAndRenderCampaign(campaign_id: string, token: string | null)
     });
 
     if (token != null) {
-        el.find(".reset-task").on("click", function () {
+        el.on("click", ".reset-task", function () {
             let user_id = $(this).attr("user_id")
             // show dialog to confirm
             if (!confirm(`Are you sure you want to reset progress for user ${$(this).attr("user_id")} in ${campaign_id}?\n\nThe user will annotate new data which will be stored alongside the already-collected data. This action cannot be undone.`)) {
@@ -231,17 +356,45 @@ async function fetchAndRenderCampaign(campaign_id: string, token: string | null)
     }
 }
 
-// for each campaign_id, fetch dashboard data and display them in a white-box
+// live update handlers of each rendered campaign by event name
+let liveHandlers: { [campaign_id: string]: { [event: string]: (data: any) => void } } = {}
+
+// all campaigns share a single connection, browsers allow only a few per host
+function subscribeLiveEvents() {
+    let query = campaign_ids.map((id, i) => `campaign_id=${encodeURIComponent(id)}&token=${encodeURIComponent(tokens[i] || "")}`).join("&")
+    let events = new EventSource(`/dashboard-events?${query}`)
+    for (let name of ["user", "progress", "ranking"]) {
+        events.addEventListener(name, (event: MessageEvent) => {
+            let { campaign_id, data } = JSON.parse(event.data)
+            if (campaign_id in liveHandlers) {
+                liveHandlers[campaign_id][name](data)
+            }
+        })
+    }
+}
+
+// fetch dashboard data of all campaigns in one request and display each in a white-box
 (async () => {
-    for (let i = 0; i < campaign_ids.length; i++) {
-        let campaign_id = campaign_ids[i];
-        let token = tokens[i] || null
-        try {
-            await fetchAndRenderCampaign(campaign_id, token);
-        } catch (error: any) {
-            const errorMsg = error?.responseJSON?.error || error?.responseText || error?.statusText || "An unknown error occurred";
-            notify("Error fetching data: " + errorMsg);
+    try {
+        let summaries = await $.ajax({
+            url: `/dashboard-batch`,
+            method: "POST",
+            data: JSON.stringify({
+                "campaign_id": campaign_ids,
+                "token": campaign_ids.map((_, i) => tokens[i] || null),
+                "limit": PAGE_SIZE,
+                "include_results": true,
+            }),
+            contentType: "application/json",
+            dataType: "json",
+        });
+        for (let i = 0; i < campaign_ids.length; i++) {
+            renderCampaign(campaign_ids[i], tokens[i] || null, summaries[campaign_ids[i]]);
         }
+        subscribeLiveEvents()
+    } catch (error: any) {
+        const errorMsg = error?.responseJSON?.error || error?.responseText || error?.statusText || "An unknown error occurred";
+        notify("Error fetching data: " + errorMsg);
     }
 })();
 
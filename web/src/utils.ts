@@ -495,6 +495,7 @@ export type DataGoodbye = {
     time: number,
     token: string,
     instructions_goodbye?: string,
+    route_url?: string,
 }
 
 // Shared protocol info type
@@ -517,6 +518,7 @@ export function displayGoodbyeScreen(response: DataGoodbye, navigate_to_item: (i
     ${response.instructions_goodbye}
     <br>
     <br>
+    ${response.route_url ? `<a href="${response.route_url}">Continue with the next campaign ➡️</a><br><br>` : ""}
     </div>
     `)
     redrawProgress(null, response.progress, navigate_to_item)